@@ -0,0 +1,120 @@
+"""
+Response cache for list endpoints with per-system data versions
+"""
+
+import hashlib
+import time
+from django.conf import settings
+from django.core.cache import caches
+from django.db import transaction
+from rest_framework.response import Response
+from hydroponic_system.routers import replicas_may_lag
+from hydroponic_system.routers import use_replica
+
+HITS_KEY = 'response-cache:hits'
+MISSES_KEY = 'response-cache:misses'
+
+
+def get_cache():
+    """Return the cache used for responses, data versions and statistics"""
+    return caches[settings.RESPONSE_CACHE_ALIAS]
+
+
+def version_key(scope, object_id):
+    """Cache key of a data version
+
+    Scope is 'system', 'systems' (per user), 'measurements' (per user) or 'rewrites' (per system, bumped
+    by updates and deletes of its measurements only).
+    """
+    return f'data-version:{scope}:{object_id}'
+
+
+def incr(cache, key, start=0):
+    """Increment a counter, creating it with the start value when it is missing"""
+    try:
+        return cache.incr(key)
+    except ValueError:
+        cache.add(key, start, timeout=None)
+        return cache.incr(key)
+
+
+def get_data_version(scope, object_id):
+    """Return the current data version of a scope"""
+    cache = get_cache()
+    key = version_key(scope, object_id)
+    version = cache.get(key)
+    if version is None:
+        cache.add(key, time.time_ns(), timeout=None)
+        version = cache.get(key)
+    return version
+
+
+def bump_data_versions(*scopes):
+    """Invalidate the cached responses of the given (scope, object_id) pairs
+
+    The versions are bumped right away and again once the transaction commits, so a reader cannot
+    cache rows from before the commit under the new version.
+    """
+    def bump():
+        cache = get_cache()
+        for scope, object_id in scopes:
+            # Versions start from the current time, so an evicted version is never reused
+            incr(cache, version_key(scope, object_id), start=time.time_ns())
+
+    bump()
+    if transaction.get_connection().in_atomic_block:
+        transaction.on_commit(bump)
+
+
+def get_stats():
+    """Return the hit/miss statistics of the response cache"""
+    cache = get_cache()
+    stats = cache.get_many([HITS_KEY, MISSES_KEY])
+    hits = stats.get(HITS_KEY, 0)
+    misses = stats.get(MISSES_KEY, 0)
+    return {'hits': hits, 'misses': misses, 'hit_ratio': hits / (hits + misses) if hits + misses else 0.0}
+
+
+def reset_stats():
+    """Reset the hit/miss statistics of the response cache"""
+    get_cache().delete_many([HITS_KEY, MISSES_KEY])
+
+
+class CachedListMixin:
+    """Serve list responses from the response cache
+
+    The key is built from the user, the normalized query parameters and the data version of the
+    scope returned by `get_cache_scope`, so a write only invalidates the responses of its own scope.
+    Lists read from a replica right after a write of the user are not stored, the replica may lag.
+    """
+    cache_scope = None
+
+    def get_cache_scope(self):
+        """Return the (scope, object_id) pair whose data version the list depends on"""
+        return self.cache_scope, self.request.user.pk
+
+    def get_list_cache_key(self, request):
+        params = [(key, value) for key, values in request.query_params.lists() for value in values if value]
+        if 'page' not in request.query_params:
+            params.append(('page', '1'))
+        digest = hashlib.sha1(repr(sorted(params)).encode()).hexdigest()
+        version = get_data_version(*self.get_cache_scope())
+        return f'list:{self.basename}:{request.user.pk}:{version}:{digest}'
+
+    def list(self, request, *args, **kwargs):
+        if not settings.RESPONSE_CACHE_ENABLED:
+            return super().list(request, *args, **kwargs)
+
+        cache = get_cache()
+        key = self.get_list_cache_key(request)
+        data = cache.get(key)
+        if data is not None:
+            incr(cache, HITS_KEY)
+            return Response(data, headers={'X-Cache': 'HIT'})
+
+        incr(cache, MISSES_KEY)
+        response = super().list(request, *args, **kwargs)
+        if response.status_code == 200 and not (use_replica.get() and replicas_may_lag(request.user.pk)):
+            cache.set(key, response.data)
+        response['X-Cache'] = 'MISS'
+        return response
@@ -5,9 +5,11 @@ Filters for Measurement View and HydroponicSystem View
 from django_filters import rest_framework as filters
 from core.models import Measurement
 from core.models import HydroponicSystem
+from core.search import search_systems
 
 
 class MeasurementFilter(filters.FilterSet):
+    hydroponic_system = filters.NumberFilter(field_name='hydroponic_system')
     start_date = filters.DateFromToRangeFilter(field_name='timestamp', lookup_expr='gte')
     end_date = filters.DateFromToRangeFilter(field_name='timestamp', lookup_expr='lte')
     ph_min = filters.NumberFilter(field_name='ph', lookup_expr='gte')
@@ -19,11 +21,19 @@ class MeasurementFilter(filters.FilterSet):
 
     class Meta:
         model = Measurement
-        fields = ['start_date', 'end_date', 'ph_min', 'ph_max', 'temperature_min', 'temperature_max', 'tds_min',
-                  'tds_max']
+        fields = ['hydroponic_system', 'start_date', 'end_date', 'ph_min', 'ph_max', 'temperature_min',
+                  'temperature_max', 'tds_min', 'tds_max']
+
+    def time_range(self):
+        """Return the lower and upper timestamp bounds of the validated date filters, None where unbounded"""
+        ranges = [self.form.cleaned_data.get(name) for name in ('start_date', 'end_date')]
+        starts = [value.start for value in ranges if value and value.start]
+        stops = [value.stop for value in ranges if value and value.stop]
+        return max(starts, default=None), min(stops, default=None)
 
 
 class HydroponicSystemFilter(filters.FilterSet):
+    search = filters.CharFilter(method='filter_search', label='Search in title and location')
     location = filters.CharFilter(field_name='location', lookup_expr='icontains')
     created_min = filters.DateFromToRangeFilter(field_name='created', lookup_expr='gte')
     created_max = filters.DateFromToRangeFilter(field_name='created', lookup_expr='lte')
@@ -32,4 +42,8 @@ class HydroponicSystemFilter(filters.FilterSet):
 
     class Meta:
         model = HydroponicSystem
-        fields = ['location', 'created_min', 'created_max', 'updated_min', 'updated_max']
+        fields = ['search', 'location', 'created_min', 'created_max', 'updated_min', 'updated_max']
+
+    def filter_search(self, queryset, name, value):
+        """Ranked substring search in title and location"""
+        return search_systems(queryset, value)
@@ -0,0 +1,90 @@
+"""
+Query cost guard for measurement queries on the unindexed ph, temperature and tds fields
+"""
+
+from contextlib import contextmanager
+from django.conf import settings
+from django.db import OperationalError
+from rest_framework import status
+from rest_framework.exceptions import APIException
+from core.db import estimate_rows
+from core.db import is_query_timeout
+from core.db import statement_timeout
+from core.models import HydroponicSystem
+from core.models import Measurement
+from .filters import MeasurementFilter
+
+VALUE_FIELDS = ('ph', 'temperature', 'tds')
+# Filters narrowing the rows through the (hydroponic_system, timestamp) and timestamp indexes
+BOUNDING_FILTERS = ('hydroponic_system', 'start_date_after', 'start_date_before', 'end_date_after',
+                    'end_date_before')
+
+
+class QueryTooExpensive(APIException):
+    status_code = status.HTTP_400_BAD_REQUEST
+    default_detail = 'This query would scan too many measurements.'
+    default_code = 'query_too_expensive'
+
+
+class QueryTimeout(APIException):
+    status_code = status.HTTP_503_SERVICE_UNAVAILABLE
+    default_detail = 'The query took too long and was cancelled.'
+    default_code = 'query_timeout'
+
+
+def value_fields(query_params, ordering):
+    """Return the unindexed fields a measurement query orders or filters by"""
+    fields = [field for field in VALUE_FIELDS
+              if query_params.get(f'{field}_min') or query_params.get(f'{field}_max')]
+    fields += [field.lstrip('-') for field in ordering if field.lstrip('-') in VALUE_FIELDS]
+    return sorted(set(fields), key=VALUE_FIELDS.index)
+
+
+def scanned_rows(request, limit):
+    """Return how many rows the indexed filters of the request leave to scan
+
+    The planner's estimate on PostgreSQL, elsewhere a count stopped after limit + 1 rows. The user's
+    systems are listed by id, the planner estimates a join on the owner far too low when one user
+    holds most of the measurements.
+    """
+    systems = list(HydroponicSystem.objects.filter(user=request.user).values_list('id', flat=True))
+    if not systems:
+        return 0
+    params = {name: request.query_params[name] for name in BOUNDING_FILTERS if name in request.query_params}
+    scanned = MeasurementFilter(params, queryset=Measurement.objects.filter(hydroponic_system__in=systems),
+                                request=request).qs.order_by()
+    estimate = estimate_rows(scanned)
+    if estimate is not None:
+        return estimate
+    return scanned[:limit + 1].count()
+
+
+def check_query_cost(request, ordering):
+    """Reject a measurement query ordering or filtering by ph, temperature or tds over too many rows
+
+    Those fields have no index, so the database reads and sorts every row the indexed filters
+    (system and time range) leave. Orderings and filters on timestamp and id are always allowed.
+    """
+    fields = value_fields(request.query_params, ordering)
+    if not fields:
+        return
+    limit = settings.MEASUREMENT_QUERY_MAX_ROWS
+    rows = scanned_rows(request, limit)
+    if rows > limit:
+        raise QueryTooExpensive(
+            f"Ordering or filtering by {', '.join(fields)} would scan about {rows} measurements, more than "
+            f"the {limit} allowed. Narrow the query down with start_date_after and start_date_before or a "
+            f"hydroponic_system, or order by timestamp.")
+
+
+@contextmanager
+def guarded_query():
+    """Cancel the queries of the block after QUERY_TIMEOUT_MS and answer with a QueryTimeout error"""
+    try:
+        with statement_timeout(settings.QUERY_TIMEOUT_MS):
+            yield
+    except OperationalError as error:
+        if not is_query_timeout(error):
+            raise
+        raise QueryTimeout(f'The query was cancelled after {settings.QUERY_TIMEOUT_MS / 1000:g} seconds. '
+                           f'Narrow it down with a time range, or submit a job for whole histories.') from error
@@ -0,0 +1,481 @@
+"""
+In-process store of the recent measurements of every hydroponic system
+
+Each system's readings are kept in typed NumPy ring buffers (values as integer hundredths), so recent
+window lists, stats and charts are answered without SQL. A series is only used while its data version
+in the response cache matches the version it was loaded at, so writes of other processes are noticed.
+When they only inserted readings, the series catches up by fetching the newer rows instead of reloading.
+"""
+
+import logging
+import math
+import threading
+from collections import OrderedDict
+from datetime import datetime
+from datetime import timedelta
+from datetime import timezone as dt_timezone
+from decimal import Decimal
+import numpy as np
+from django.conf import settings
+from django.db import router
+from django.db import transaction
+from django.db.models import Max
+from django.utils import timezone
+from rest_framework import serializers
+from core.analysis import CHUNK_SIZE
+from core.downsampling import CANDIDATES_PER_POINT
+from core.downsampling import lttb
+from core.downsampling import select_candidates
+from core.models import HydroponicSystem
+from core.models import Measurement
+from .cache import get_data_version
+from .filters import MeasurementFilter
+
+logger = logging.getLogger(__name__)
+
+FIELDS = ('ph', 'temperature', 'tds')
+COLUMNS = {
+    'id': np.int64,
+    'timestamp': np.int64,
+    'ph': np.int16,
+    'temperature': np.int32,
+    'tds': np.int32,
+}
+MIN_CAPACITY = 256
+EPOCH = datetime(1970, 1, 1, tzinfo=dt_timezone.utc)
+MICROSECOND = timedelta(microseconds=1)
+DATETIME_FIELD = serializers.DateTimeField()
+
+
+def to_microseconds(value):
+    """Return the microseconds since the epoch of an aware datetime"""
+    return (value - EPOCH) // MICROSECOND
+
+
+def to_hundredths(value):
+    """Return a reading with two decimal places as an integer number of hundredths"""
+    return int(Decimal(str(value)).scaleb(2))
+
+
+def format_hundredths(value):
+    """Return integer hundredths formatted like the serializer's decimal fields"""
+    return format(Decimal(int(value)).scaleb(-2), 'f')
+
+
+def from_microseconds(value):
+    """Return the aware datetime of microseconds since the epoch"""
+    return EPOCH + timedelta(microseconds=int(value))
+
+
+def to_columns(row):
+    """Return a row of `values_list(*COLUMNS)` as the column values of a series"""
+    return {
+        'id': row[0],
+        'timestamp': to_microseconds(row[1]),
+        **{field: to_hundredths(value) for field, value in zip(FIELDS, row[2:])},
+    }
+
+
+def format_microseconds(value):
+    """Return microseconds since the epoch formatted like the serializer's datetime fields"""
+    return DATETIME_FIELD.to_representation(from_microseconds(value))
+
+
+class Series:
+    """Ring buffer of the readings of one system in time order
+
+    All readings at or after `since` (epoch microseconds) are present. The buffer grows up to the
+    configured capacity, then the oldest readings are overwritten and `since` moves forward.
+    `rewrites` is the system's rewrites version when loaded, it changes on updates and deletes.
+    """
+
+    def __init__(self, system_id, user_id, version, since, columns, capacity, rewrites=None):
+        self.system_id = system_id
+        self.user_id = user_id
+        self.version = version
+        self.rewrites = rewrites
+        self.since = since
+        self.size = len(columns['id'])
+        self.start = 0
+        self.columns = {}
+        for name, dtype in COLUMNS.items():
+            self.columns[name] = np.empty(max(capacity, self.size), dtype=dtype)
+            self.columns[name][:self.size] = columns[name]
+
+    @property
+    def capacity(self):
+        return len(self.columns['id'])
+
+    @property
+    def nbytes(self):
+        return sum(column.nbytes for column in self.columns.values())
+
+    def last_timestamp(self):
+        if not self.size:
+            return None
+        return self.columns['timestamp'][(self.start + self.size - 1) % self.capacity]
+
+    def arrays(self):
+        """Return copies of the columns in time order"""
+        end = self.start + self.size
+        if end <= self.capacity:
+            return {name: column[self.start:end].copy() for name, column in self.columns.items()}
+        return {name: np.concatenate((column[self.start:], column[:end - self.capacity]))
+                for name, column in self.columns.items()}
+
+    def resize(self, capacity):
+        arrays = self.arrays()
+        for name, dtype in COLUMNS.items():
+            self.columns[name] = np.empty(capacity, dtype=dtype)
+            self.columns[name][:self.size] = arrays[name]
+        self.start = 0
+
+    def append(self, row, max_capacity):
+        """Append a reading, growing the buffer or overwriting the oldest reading when it is full"""
+        if self.size == self.capacity:
+            if self.capacity < max_capacity:
+                self.resize(min(self.capacity * 2, max_capacity))
+            else:
+                self.since = max(self.since, int(self.columns['timestamp'][self.start]) + 1)
+                self.start = (self.start + 1) % self.capacity
+                self.size -= 1
+        index = (self.start + self.size) % self.capacity
+        for name in COLUMNS:
+            self.columns[name][index] = row[name]
+        self.size += 1
+
+
+class Window:
+    """Snapshot of a series, the columns are copies in time order"""
+
+    def __init__(self, series):
+        self.system_id = series.system_id
+        self.user_id = series.user_id
+        self.since = series.since
+        self.columns = series.arrays()
+
+    def __len__(self):
+        return len(self.columns['id'])
+
+    def select(self, mask=None, ordering=None):
+        """Return the readings of a mask sorted like `order_by(*ordering)`, in time order by default"""
+        columns = self.columns if mask is None else {name: column[mask] for name, column in self.columns.items()}
+        order = None
+        if ordering:
+            keys = [-columns[name.lstrip('-')].astype(np.int64) if name.startswith('-') else columns[name]
+                    for name in reversed(ordering)]
+            order = np.lexsort(keys)
+        return Readings(self.system_id, columns, order)
+
+
+class Readings:
+    """Sequence of readings serialized like MeasurementSerializer on access"""
+
+    def __init__(self, system_id, columns, order=None):
+        self.system_id = system_id
+        self.columns = columns
+        self.order = np.arange(len(columns['id'])) if order is None else order
+
+    def __len__(self):
+        return len(self.order)
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [self.serialize(position) for position in self.order[index]]
+        return self.serialize(self.order[index])
+
+    def serialize(self, position):
+        return {
+            'id': int(self.columns['id'][position]),
+            'ph': format_hundredths(self.columns['ph'][position]),
+            'temperature': format_hundredths(self.columns['temperature'][position]),
+            'tds': format_hundredths(self.columns['tds'][position]),
+            'timestamp': format_microseconds(self.columns['timestamp'][position]),
+            'hydroponic_system': self.system_id,
+        }
+
+
+class HotStore:
+    """Recent readings of the most recently used systems, bounded by HOT_STORE_MAX_BYTES"""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.series = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.refreshes = 0
+
+    def clear(self):
+        with self.lock:
+            self.series.clear()
+            self.hits = self.misses = self.refreshes = 0
+
+    def window(self, system_id):
+        """Return a snapshot of a system's recent readings, loading it when it is missing or stale
+
+        A stale series only written to by inserts is caught up with the newer rows, so a write in
+        one worker does not make every other worker reload the whole window on its next request.
+        Returns None inside a transaction, where uncommitted rows could end up in the store.
+        """
+        using = router.db_for_write(Measurement)
+        if transaction.get_connection(using).in_atomic_block:
+            return None
+        # The version is read before the rows, so a write committing meanwhile makes the series stale
+        version = get_data_version('system', system_id)
+        with self.lock:
+            series = self.series.get(system_id)
+            if series is not None and series.version == version:
+                self.series.move_to_end(system_id)
+                self.hits += 1
+                return Window(series)
+            self.misses += 1
+
+        rewrites = get_data_version('rewrites', system_id)
+        if series is not None and series.rewrites == rewrites and self.refresh(series, version, using):
+            with self.lock:
+                self.series.move_to_end(system_id)
+                return Window(series)
+        series = self.load(system_id, version, rewrites, using)
+        if series is None:
+            return None
+        with self.lock:
+            self.series[system_id] = series
+            self.evict()
+            return Window(series)
+
+    def latest(self, system_id, number):
+        """Return the latest readings of a system, newest first, only when its series is loaded and current
+
+        Never loads the series: reading the whole window to show a few readings costs more than the
+        query it would replace. Returns None when the series is missing, stale or shorter.
+        """
+        version = get_data_version('system', system_id)
+        with self.lock:
+            series = self.series.get(system_id)
+            if series is None or series.version != version or series.size < number:
+                self.misses += 1
+                return None
+            self.series.move_to_end(system_id)
+            self.hits += 1
+            positions = (series.start + np.arange(series.size - 1, series.size - number - 1, -1)) % series.capacity
+            columns = {name: column[positions] for name, column in series.columns.items()}
+        return Readings(system_id, columns)
+
+    def refresh(self, series, version, using):
+        """Append the readings inserted since a series was last current, returns whether it caught up
+
+        The rows at or after the last stored timestamp are fetched, then the readings of the window are
+        counted: a reading committed behind the last timestamp makes the count differ and the series
+        has to be loaded again, as it does with more new readings than HOT_STORE_CAPACITY.
+        """
+        capacity = settings.HOT_STORE_CAPACITY
+        with self.lock:
+            expected = series.version
+            since = series.since
+            arrays = series.arrays()
+        timestamps = arrays['timestamp']
+        last = int(timestamps[-1]) if len(timestamps) else since
+        known = set(arrays['id'][timestamps == last].tolist())
+        readings = Measurement.objects.using(using).filter(hydroponic_system_id=series.system_id)
+        rows = list(readings.filter(timestamp__gte=from_microseconds(last)).order_by('timestamp', 'id')
+                    .values_list(*COLUMNS)[:capacity])
+        if len(rows) == capacity:
+            return False
+        rows = [to_columns(row) for row in rows if row[0] not in known]
+        # Counted after fetching, so a reading committing in between makes the count differ as well
+        total = readings.filter(timestamp__gte=from_microseconds(since)).count()
+        if total != np.count_nonzero(timestamps >= since) + len(rows):
+            return False
+        with self.lock:
+            if self.series.get(series.system_id) is not series or series.version != expected:
+                return False
+            for row in rows:
+                series.append(row, capacity)
+            series.version = version
+            self.refreshes += 1
+            self.evict()
+        return True
+
+    def load(self, system_id, version, rewrites, using):
+        """Read a system's readings of the window from the primary, replicas may lag behind the version"""
+        user_id = HydroponicSystem.objects.using(using).filter(id=system_id).values_list('user_id', flat=True).first()
+        if user_id is None:
+            return None
+        capacity = settings.HOT_STORE_CAPACITY
+        start = timezone.now() - timedelta(hours=settings.HOT_STORE_WINDOW_HOURS)
+        rows = list(Measurement.objects.using(using).filter(hydroponic_system_id=system_id, timestamp__gte=start)
+                    .order_by('-timestamp', '-id').values_list(*COLUMNS)[:capacity])
+        rows.reverse()
+        since = to_microseconds(start)
+        if len(rows) == capacity:
+            # Older readings with the same timestamp as the first loaded one may have been cut off
+            since = to_microseconds(rows[0][1]) + 1
+        columns = {
+            'id': np.fromiter((row[0] for row in rows), dtype=np.int64, count=len(rows)),
+            'timestamp': np.fromiter((to_microseconds(row[1]) for row in rows), dtype=np.int64, count=len(rows)),
+        }
+        for index, field in enumerate(FIELDS, start=2):
+            columns[field] = np.fromiter((to_hundredths(row[index]) for row in rows), dtype=COLUMNS[field],
+                                         count=len(rows))
+        initial = max(MIN_CAPACITY, 1 << (2 * len(rows) - 1).bit_length()) if rows else MIN_CAPACITY
+        return Series(system_id, user_id, version, since, columns, min(initial, capacity), rewrites)
+
+    def evict(self):
+        """Drop the least recently used series until the store fits HOT_STORE_MAX_BYTES"""
+        total = sum(series.nbytes for series in self.series.values())
+        while total > settings.HOT_STORE_MAX_BYTES and len(self.series) > 1:
+            _, series = self.series.popitem(last=False)
+            total -= series.nbytes
+
+    def ingest(self, measurement):
+        """Append a new measurement once its transaction commits
+
+        The receivers in api/signals.py bump the system's data version once now and once more on
+        commit when inside a transaction. The series only stays current when exactly those bumps
+        happened since it was loaded, otherwise another process wrote as well and it is dropped.
+        """
+        system_id = measurement.hydroponic_system_id
+        with self.lock:
+            series = self.series.get(system_id)
+            if series is None:
+                return
+            expected = series.version
+        using = router.db_for_write(Measurement)
+        in_transaction = transaction.get_connection(using).in_atomic_block
+        bumps = 2 if in_transaction else 1
+        row = to_columns((measurement.pk, measurement.timestamp, *(getattr(measurement, field) for field in FIELDS)))
+
+        def append():
+            version = get_data_version('system', system_id)
+            with self.lock:
+                series = self.series.get(system_id)
+                if series is None:
+                    return
+                last = series.last_timestamp()
+                if series.version != expected or version != expected + bumps or (
+                        last is not None and row['timestamp'] < last):
+                    del self.series[system_id]
+                    return
+                series.append(row, settings.HOT_STORE_CAPACITY)
+                series.version = version
+                self.evict()
+
+        if in_transaction:
+            transaction.on_commit(append, using=using)
+        else:
+            append()
+
+    def warm(self):
+        """Load every system with readings in the window, most recently active last"""
+        start = timezone.now() - timedelta(hours=settings.HOT_STORE_WINDOW_HOURS)
+        active = (Measurement.objects.filter(timestamp__gte=start).values('hydroponic_system')
+                  .annotate(last=Max('timestamp')).order_by('last').values_list('hydroponic_system', flat=True))
+        for system_id in active:
+            self.window(system_id)
+        stats = self.stats()
+        logger.info('Hot store warmed with %d readings of %d systems in %d bytes',
+                    stats['readings'], stats['systems'], stats['bytes'])
+
+    def stats(self):
+        """Return the size and memory use of the store and its hit/miss counts"""
+        with self.lock:
+            return {
+                'systems': len(self.series),
+                'readings': sum(series.size for series in self.series.values()),
+                'capacity': sum(series.capacity for series in self.series.values()),
+                'bytes': sum(series.nbytes for series in self.series.values()),
+                'max_bytes': settings.HOT_STORE_MAX_BYTES,
+                'hits': self.hits,
+                'misses': self.misses,
+                'refreshes': self.refreshes,
+            }
+
+
+store = HotStore()
+
+
+def get_hot_store():
+    """Return the hot store, or None when HOT_STORE_ENABLED is off"""
+    return store if settings.HOT_STORE_ENABLED else None
+
+
+def warm_hot_store():
+    """Load the recent readings of all active systems at startup, when the hot store is enabled"""
+    if settings.HOT_STORE_ENABLED:
+        store.warm()
+
+
+def query_window(request, system_id=None):
+    """Return the hot window and reading mask answering a measurement query, or None when it cannot
+
+    The query must be limited to one system owned by the user and start within the stored window.
+    """
+    store = get_hot_store()
+    if store is None:
+        return None
+    filterset = MeasurementFilter(request.query_params, queryset=Measurement.objects.none(), request=request)
+    if not filterset.is_valid():
+        return None
+    data = filterset.form.cleaned_data
+    requested = data.get('hydroponic_system')
+    if requested is not None:
+        if requested != int(requested) or system_id not in (None, int(requested)):
+            return None
+        system_id = int(requested)
+    ranges = [data[name] for name in ('start_date', 'end_date') if data.get(name)]
+    starts = [bound.start for bound in ranges if bound.start]
+    stops = [bound.stop for bound in ranges if bound.stop]
+    if system_id is None or not starts:
+        return None
+
+    start = to_microseconds(max(starts))
+    window = store.window(system_id)
+    if window is None or window.user_id != request.user.pk or start < window.since:
+        return None
+    timestamps = window.columns['timestamp']
+    mask = timestamps >= start
+    if stops:
+        mask &= timestamps <= to_microseconds(min(stops))
+    for field in FIELDS:
+        if data.get(f'{field}_min') is not None:
+            mask &= window.columns[field] >= math.ceil(data[f'{field}_min'] * 100)
+        if data.get(f'{field}_max') is not None:
+            mask &= window.columns[field] <= math.floor(data[f'{field}_max'] * 100)
+    return window, mask
+
+
+def downsample_window(window, mask, max_points, field):
+    """Return at most max_points readings of the mask, chosen exactly like core.downsampling.downsample"""
+    readings = window.select(mask)
+    count = len(readings)
+    if count <= max_points:
+        return readings, count
+    columns = readings.columns
+    ids = columns['id'].astype(np.float64)
+    times = columns['timestamp'] / 1e6
+    values = columns[field] / 100
+    chunks = ((ids[offset:offset + CHUNK_SIZE], times[offset:offset + CHUNK_SIZE], values[offset:offset + CHUNK_SIZE])
+              for offset in range(0, count, CHUNK_SIZE))
+    candidate_ids, candidate_times, candidate_values = select_candidates(
+        chunks, max_points * CANDIDATES_PER_POINT, times[0], times[-1])
+    selected = candidate_ids[lttb(candidate_times, candidate_values, max_points)]
+    return Readings(window.system_id, columns, np.flatnonzero(np.isin(columns['id'], selected))), count
+
+
+def window_stats(window, mask):
+    """Return the count, time range and per field minimum, maximum and average of the mask's readings"""
+    columns = {name: column[mask] for name, column in window.columns.items()}
+    count = len(columns['id'])
+    stats = {
+        'count': count,
+        'first': from_microseconds(columns['timestamp'].min()) if count else None,
+        'last': from_microseconds(columns['timestamp'].max()) if count else None,
+    }
+    for field in FIELDS:
+        values = columns[field]
+        stats[field] = {
+            'min': Decimal(int(values.min())).scaleb(-2) if count else None,
+            'max': Decimal(int(values.max())).scaleb(-2) if count else None,
+            'avg': float(values.astype(np.int64).sum()) / count / 100 if count else None,
+        }
+    return stats
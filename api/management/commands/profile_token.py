@@ -0,0 +1,18 @@
+"""
+Create a signed X-Profile header value for profiling requests without a staff account
+"""
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from hydroponic_system.profiling import sign_profile_token
+
+
+class Command(BaseCommand):
+    help = 'Create an X-Profile header value that profiles requests below a path until it expires'
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', nargs='?', default='/', help='Only requests below this path are profiled')
+
+    def handle(self, *args, **options):
+        self.stdout.write(sign_profile_token(options['path']))
+        self.stderr.write(f'Valid for {settings.PROFILING_TOKEN_MAX_AGE} seconds, send it as the X-Profile header')
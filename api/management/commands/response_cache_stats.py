@@ -0,0 +1,23 @@
+"""
+Show the hit/miss statistics of the response cache
+"""
+
+from django.core.management.base import BaseCommand
+from api.cache import get_stats
+from api.cache import reset_stats
+
+
+class Command(BaseCommand):
+    help = 'Show the hit/miss statistics of the response cache'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--reset', action='store_true', help='Reset the statistics after showing them')
+
+    def handle(self, *args, **options):
+        stats = get_stats()
+        self.stdout.write(f"hits: {stats['hits']}")
+        self.stdout.write(f"misses: {stats['misses']}")
+        self.stdout.write(f"hit ratio: {stats['hit_ratio']:.1%}")
+        if options['reset']:
+            reset_stats()
+            self.stdout.write(self.style.SUCCESS('Statistics reset'))
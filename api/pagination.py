@@ -0,0 +1,90 @@
+"""
+Pagination with approximate counts for large listings
+"""
+
+from django.conf import settings
+from django.core.paginator import EmptyPage
+from django.core.paginator import Page
+from django.core.paginator import PageNotAnInteger
+from django.core.paginator import Paginator
+from django.utils.functional import cached_property
+from rest_framework.pagination import PageNumberPagination
+from rest_framework.response import Response
+from core.db import estimate_rows
+
+
+class ApproximatePage(Page):
+    """Page of an estimated listing, which knows from one extra row whether another page follows"""
+
+    def __init__(self, object_list, number, paginator, has_next):
+        super().__init__(object_list, number, paginator)
+        self.next_exists = has_next
+
+    def has_next(self):
+        return self.next_exists
+
+
+class ApproximateCountPaginator(Paginator):
+    """Paginator that counts exactly up to APPROXIMATE_COUNT_THRESHOLD rows and estimates above it
+
+    The estimate is only reported, it may be too low or too high. Pages of an estimated listing are
+    not checked against it: a page past the real rows is empty and the next link follows the rows.
+    """
+    is_approximate = False
+
+    @cached_property
+    def count(self):
+        if not hasattr(self.object_list, 'query'):
+            return super().count
+        threshold = settings.APPROXIMATE_COUNT_THRESHOLD
+        bounded = self.object_list.order_by()[:threshold + 1].count()
+        if bounded <= threshold:
+            return bounded
+        estimate = estimate_rows(self.object_list)
+        if estimate is None:
+            return self.object_list.count()
+        self.is_approximate = True
+        return max(estimate, bounded)
+
+    def validate_number(self, number):
+        if not (self.count and self.is_approximate):
+            return super().validate_number(number)
+        try:
+            number = int(number)
+        except (TypeError, ValueError):
+            raise PageNotAnInteger(self.error_messages['invalid_page'])
+        if number < 1:
+            raise EmptyPage(self.error_messages['min_page'])
+        return number
+
+    def page(self, number):
+        number = self.validate_number(number)
+        if not self.is_approximate:
+            return super().page(number)
+        bottom = (number - 1) * self.per_page
+        rows = list(self.object_list[bottom:bottom + self.per_page + 1])
+        if not rows and number > 1:
+            raise EmptyPage(self.error_messages['no_results'])
+        return ApproximatePage(rows[:self.per_page], number, self, has_next=len(rows) > self.per_page)
+
+
+class ApproximateCountPagination(PageNumberPagination):
+    """Page number pagination that flags when the count is a planner estimate"""
+    django_paginator_class = ApproximateCountPaginator
+
+    def get_paginated_response(self, data):
+        return Response({
+            'count': self.page.paginator.count,
+            'count_is_approximate': self.page.paginator.is_approximate,
+            'next': self.get_next_link(),
+            'previous': self.get_previous_link(),
+            'results': data,
+        })
+
+    def get_paginated_response_schema(self, schema):
+        response_schema = super().get_paginated_response_schema(schema)
+        response_schema['properties']['count_is_approximate'] = {
+            'type': 'boolean',
+            'example': False,
+        }
+        return response_schema
@@ -0,0 +1,37 @@
+"""
+JSON renderer on orjson, a replacement for DRF's JSONRenderer
+"""
+
+import orjson
+from rest_framework.renderers import JSONRenderer
+
+OPTIONS = orjson.OPT_NON_STR_KEYS | orjson.OPT_SERIALIZE_NUMPY | orjson.OPT_PASSTHROUGH_DATETIME
+
+
+class ORJSONRenderer(JSONRenderer):
+    """Render JSON with orjson, like JSONRenderer with the default settings except for floats
+
+    Serializer output is mostly strings and numbers, which orjson encodes natively. Datetimes,
+    Decimals, lazy strings and the rest fall back to the encoder class, so values keep the format
+    of JSONRenderer (datetimes with a Z suffix, Decimals outside serializers as numbers). Floats
+    have the same value but a shorter exponent (1e-7 for 1e-07, 1e16 for 1e+16), and NaN and
+    infinity become null where JSONRenderer raises an error.
+    """
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if data is None:
+            return b''
+        renderer_context = renderer_context or {}
+        indent = self.get_indent(accepted_media_type, renderer_context)
+        # orjson only writes compact UTF-8 or two space indents, anything else is left to JSONRenderer
+        if self.ensure_ascii or indent not in (None, 2) or (indent is None and not self.compact):
+            return super().render(data, accepted_media_type, renderer_context)
+
+        options = OPTIONS | orjson.OPT_INDENT_2 if indent else OPTIONS
+        try:
+            ret = orjson.dumps(data, default=self.encoder_class().default, option=options)
+        except orjson.JSONEncodeError:
+            # Integers beyond 64 bits and other values orjson refuses
+            return super().render(data, accepted_media_type, renderer_context)
+        # Like JSONRenderer, escape the separators that are not valid in JavaScript strings
+        return ret.replace(b'\xe2\x80\xa8', b'\\u2028').replace(b'\xe2\x80\xa9', b'\\u2029')
@@ -0,0 +1,29 @@
+"""
+Read-your-writes for views whose reads may be routed to a replica
+"""
+
+from hydroponic_system.routers import SAFE_METHODS
+from hydroponic_system.routers import is_pinned_to_primary
+from hydroponic_system.routers import pin_to_primary
+from hydroponic_system.routers import use_replica
+
+
+class ReadYourWritesMixin:
+    """Read from the primary while the authenticated user has recent writes of their own session
+
+    Successful writes pin the user, except those of `unpinned_actions`: a gateway posting readings
+    more often than REPLICA_READ_YOUR_WRITES_SECONDS would keep its owner on the primary for good.
+    """
+    unpinned_actions = ()
+
+    def initial(self, request, *args, **kwargs):
+        super().initial(request, *args, **kwargs)
+        if use_replica.get() and request.user.is_authenticated and is_pinned_to_primary(request.user.pk):
+            use_replica.set(False)
+
+    def finalize_response(self, request, response, *args, **kwargs):
+        response = super().finalize_response(request, response, *args, **kwargs)
+        if (response.status_code < 400 and request.method not in SAFE_METHODS and request.user.is_authenticated
+                and self.action not in self.unpinned_actions):
+            pin_to_primary(request.user.pk)
+        return response
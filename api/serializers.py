@@ -2,9 +2,16 @@
 Serializers for HydroponicSystem and Measurement model
 """
 
+from decimal import Decimal
 from core.models import HydroponicSystem
 from rest_framework import serializers
+from rest_framework.reverse import reverse
 from core.models import Measurement
+from core.models import CalibrationCorrection
+from core.models import Change
+from core.models import Job
+from core import analysis
+from core import completeness
 
 
 class MeasurementSerializer(serializers.ModelSerializer):
@@ -31,3 +38,179 @@ class HydroponicSystemDetailSerializer(HydroponicSystemSerializer):
 
     class Meta(HydroponicSystemSerializer.Meta):
         fields = HydroponicSystemSerializer.Meta.fields + ['measurements']
+
+
+class MeasurementCalibrationSerializer(serializers.Serializer):
+    """Serializer for a bulk calibration correction: value * scale + offset"""
+    hydroponic_system = serializers.PrimaryKeyRelatedField(queryset=HydroponicSystem.objects.all())
+    field = serializers.ChoiceField(choices=CalibrationCorrection.FIELD_CHOICES)
+    scale = serializers.DecimalField(max_digits=10, decimal_places=6, min_value=Decimal('0.000001'),
+                                     default=Decimal('1'))
+    offset = serializers.DecimalField(max_digits=8, decimal_places=2, default=Decimal('0'))
+
+    def validate(self, attrs):
+        """Reject corrections that would not change any reading"""
+        if attrs['scale'] == 1 and attrs['offset'] == 0:
+            raise serializers.ValidationError('The correction must change the readings (scale or offset).')
+        return attrs
+
+
+class CalibrationCorrectionSerializer(serializers.ModelSerializer):
+    """Serializer for the CalibrationCorrection model"""
+
+    class Meta:
+        model = CalibrationCorrection
+        fields = ['id', 'hydroponic_system', 'user', 'field', 'scale', 'offset', 'filters', 'affected', 'created']
+        read_only_fields = fields
+
+
+class ChangeSerializer(serializers.ModelSerializer):
+    """Serializer for the Change feed model"""
+    correction = CalibrationCorrectionSerializer(read_only=True)
+
+    class Meta:
+        model = Change
+        fields = ['id', 'model', 'object_id', 'system_id', 'action', 'correction', 'timestamp']
+        read_only_fields = fields
+
+
+class AnomalyParametersSerializer(serializers.Serializer):
+    """Serializer for the anomaly detection query parameters"""
+    window = serializers.IntegerField(min_value=3, max_value=10000, default=analysis.DEFAULT_WINDOW)
+    z_threshold = serializers.FloatField(min_value=0.5, default=analysis.DEFAULT_Z_THRESHOLD)
+    flatline_points = serializers.IntegerField(min_value=2, default=analysis.DEFAULT_FLATLINE_POINTS)
+
+
+class DownsampleParametersSerializer(serializers.Serializer):
+    """Serializer for the chart downsampling query parameters"""
+    hydroponic_system = serializers.IntegerField()
+    max_points = serializers.IntegerField(min_value=3, max_value=10000)
+    downsample_field = serializers.ChoiceField(choices=CalibrationCorrection.FIELD_CHOICES, default='ph')
+
+
+class CompletenessParametersSerializer(serializers.Serializer):
+    """Serializer for the completeness report query parameters"""
+    min_gap = serializers.IntegerField(min_value=1, default=completeness.DEFAULT_MIN_GAP_SECONDS)
+
+
+class GapSerializer(serializers.Serializer):
+    """Serializer for a period without readings"""
+    start = serializers.DateTimeField()
+    end = serializers.DateTimeField()
+    seconds = serializers.FloatField()
+
+
+class CompletenessSerializer(serializers.Serializer):
+    """Serializer for the completeness report of a system's measurements"""
+    hydroponic_system = serializers.IntegerField()
+    start = serializers.DateTimeField(allow_null=True)
+    end = serializers.DateTimeField(allow_null=True)
+    readings = serializers.IntegerField()
+    first = serializers.DateTimeField(allow_null=True)
+    last = serializers.DateTimeField(allow_null=True)
+    uptime = serializers.FloatField(allow_null=True)
+    readings_per_hour = serializers.FloatField(allow_null=True)
+    gaps = GapSerializer(many=True)
+
+
+class FieldStatsSerializer(serializers.Serializer):
+    """Serializer for the minimum, maximum and average of one measurement field"""
+    min = serializers.DecimalField(max_digits=5, decimal_places=2, allow_null=True)
+    max = serializers.DecimalField(max_digits=5, decimal_places=2, allow_null=True)
+    avg = serializers.FloatField(allow_null=True)
+
+    def to_representation(self, instance):
+        data = super().to_representation(instance)
+        if data['avg'] is not None:
+            data['avg'] = round(data['avg'], 3)
+        return data
+
+
+class MeasurementStatsSerializer(serializers.Serializer):
+    """Serializer for the summary statistics of a system's measurements"""
+    hydroponic_system = serializers.IntegerField()
+    count = serializers.IntegerField()
+    first = serializers.DateTimeField(allow_null=True)
+    last = serializers.DateTimeField(allow_null=True)
+    ph = FieldStatsSerializer()
+    temperature = FieldStatsSerializer()
+    tds = FieldStatsSerializer()
+
+
+class JobParametersSerializer(serializers.Serializer):
+    """Serializer for the parameters of a job over the measurements of one system"""
+    hydroponic_system = serializers.PrimaryKeyRelatedField(queryset=HydroponicSystem.objects.all())
+    start = serializers.DateTimeField(required=False)
+    end = serializers.DateTimeField(required=False)
+
+
+class AnomalyJobParametersSerializer(AnomalyParametersSerializer, JobParametersSerializer):
+    """Serializer for the parameters of an anomaly detection job"""
+
+
+class JobSerializer(serializers.ModelSerializer):
+    """Serializer for the Job model, the parameters are validated for the job kind"""
+    PARAMETER_SERIALIZERS = {
+        Job.EXPORT_MEASUREMENTS: JobParametersSerializer,
+        Job.SYSTEM_STATS: JobParametersSerializer,
+        Job.DETECT_ANOMALIES: AnomalyJobParametersSerializer,
+    }
+    download = serializers.SerializerMethodField()
+
+    class Meta:
+        model = Job
+        fields = ['id', 'kind', 'parameters', 'status', 'progress', 'result', 'error', 'created', 'started',
+                  'finished', 'download']
+        read_only_fields = ['id', 'status', 'progress', 'result', 'error', 'created', 'started', 'finished']
+
+    def get_download(self, obj):
+        """URL of the result file of a finished export"""
+        if obj.status != Job.SUCCEEDED or not obj.result_file:
+            return None
+        return reverse('api:job-download', args=[obj.id], request=self.context.get('request'))
+
+    def validate(self, attrs):
+        parameters = self.PARAMETER_SERIALIZERS[attrs['kind']](data=attrs.get('parameters', {}))
+        if not parameters.is_valid():
+            raise serializers.ValidationError({'parameters': parameters.errors})
+        attrs['parameters'] = parameters.data
+        return attrs
+
+
+class QueryTimingSerializer(serializers.Serializer):
+    """Serializer for one SQL query of a request profile"""
+    database = serializers.CharField()
+    sql = serializers.CharField()
+    many = serializers.BooleanField()
+    duration_ms = serializers.FloatField()
+
+
+class FunctionTimingSerializer(serializers.Serializer):
+    """Serializer for the time spent in one function of a request profile"""
+    function = serializers.CharField()
+    calls = serializers.IntegerField()
+    total_ms = serializers.FloatField()
+    cumulative_ms = serializers.FloatField()
+
+
+class RequestProfileSerializer(serializers.Serializer):
+    """Serializer for the summary of a request profile"""
+    id = serializers.CharField()
+    created = serializers.DateTimeField()
+    method = serializers.CharField()
+    path = serializers.CharField()
+    status = serializers.IntegerField()
+    duration_ms = serializers.FloatField()
+    query_count = serializers.IntegerField()
+    query_ms = serializers.FloatField()
+    download = serializers.SerializerMethodField()
+
+    def get_download(self, obj):
+        """URL of the cProfile statistics, readable with pstats or snakeviz"""
+        return reverse('api:profile-download', args=[obj['id']], request=self.context.get('request'))
+
+
+class RequestProfileDetailSerializer(RequestProfileSerializer):
+    """Serializer for a request profile with its SQL queries and slowest functions"""
+    queries = QueryTimingSerializer(many=True)
+    functions = FunctionTimingSerializer(many=True)
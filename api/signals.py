@@ -0,0 +1,71 @@
+"""
+Receivers keeping the response cache versions, replica routing and hot store in step with the data
+"""
+
+from django.db.models.signals import post_delete
+from django.db.models.signals import post_save
+from django.dispatch import receiver
+from core.models import HydroponicSystem
+from core.models import Measurement
+from core.signals import deleted_directly
+from core.signals import measurements_bulk_updated
+from hydroponic_system.routers import note_write
+from .cache import bump_data_versions
+from .hotstore import get_hot_store
+
+
+def data_changed(user_id, *scopes):
+    """Note the owner's write for the replica routing and invalidate the cached responses of the scopes"""
+    note_write(user_id)
+    bump_data_versions(*scopes)
+
+
+@receiver(post_save, sender=HydroponicSystem)
+def invalidate_system_lists(sender, instance, **kwargs):
+    """Invalidate the owner's cached system lists"""
+    data_changed(instance.user_id, ('systems', instance.user_id))
+
+
+@receiver(post_delete, sender=HydroponicSystem)
+def invalidate_deleted_system(sender, instance, origin=None, **kwargs):
+    """Invalidate the cached system and measurement lists of the owner of a deleted system"""
+    if not deleted_directly(origin, HydroponicSystem):
+        return
+    data_changed(instance.user_id, ('system', instance.pk), ('rewrites', instance.pk), ('systems', instance.user_id),
+                 ('measurements', instance.user_id))
+
+
+def measurement_changed(measurement, created=False):
+    """Invalidate the cached measurement lists of the measurement's system and owner
+
+    Called by the API for deleted measurements, a post_delete receiver on Measurement would turn off
+    the single DELETE of the measurements of a deleted system. Updates and deletes also bump the
+    system's rewrites version, so hot stores reload the series instead of appending the newer rows.
+    """
+    system_id = measurement.hydroponic_system_id
+    user_id = measurement.hydroponic_system.user_id
+    scopes = [('system', system_id), ('measurements', user_id)]
+    if not created:
+        scopes.append(('rewrites', system_id))
+    data_changed(user_id, *scopes)
+
+
+@receiver(post_save, sender=Measurement)
+def invalidate_measurement_lists(sender, instance, created, **kwargs):
+    """Invalidate the cached measurement lists of a saved measurement"""
+    measurement_changed(instance, created)
+
+
+@receiver(post_save, sender=Measurement)
+def feed_hot_store(sender, instance, created, **kwargs):
+    """Append new measurements to the hot window store, after the data version bumps above"""
+    hot_store = get_hot_store()
+    if created and hot_store is not None:
+        hot_store.ingest(instance)
+
+
+@receiver(measurements_bulk_updated)
+def invalidate_bulk_updated_measurements(sender, hydroponic_system, **kwargs):
+    """Invalidate the cached measurement lists of a bulk updated system"""
+    data_changed(hydroponic_system.user_id, ('system', hydroponic_system.pk), ('rewrites', hydroponic_system.pk),
+                 ('measurements', hydroponic_system.user_id))
@@ -0,0 +1,146 @@
+"""
+Tests for the change feed API
+"""
+
+from datetime import timedelta
+from decimal import Decimal
+from io import StringIO
+from django.contrib.auth.models import User
+from django.core.management import call_command
+from django.utils import timezone
+from core.models import Change
+from core.models import ChangeFeedPrune
+from core.models import HydroponicSystem
+from core.models import Measurement
+from django.test import TestCase
+from django.test import override_settings
+from django.urls import reverse
+from rest_framework.test import APIClient
+from rest_framework import status
+
+CHANGES_URL = reverse('api:change-list')
+CALIBRATE_URL = reverse('api:measurement-calibrate')
+
+
+def create_user(username, password):
+    """Create and return a new user"""
+    return User.objects.create_user(username, password)
+
+
+class PublicChangeFeedApiTests(TestCase):
+    """Test unauthenticated change feed API access"""
+
+    def setUp(self):
+        self.client = APIClient()
+
+    def test_auth_required(self):
+        """Test that authentication is required to access the API"""
+        response = self.client.get(CHANGES_URL)
+        self.assertEqual(response.status_code, status.HTTP_401_UNAUTHORIZED)
+
+
+@override_settings(CHANGE_FEED_SETTLE_SECONDS=0)
+class PrivateChangeFeedApiTests(TestCase):
+    """Test authenticated change feed API access"""
+
+    def setUp(self):
+        self.client = APIClient()
+        self.user = create_user(username='testuser', password='testpass123')
+        self.client.force_authenticate(self.user)
+
+    def test_changes_since_cursor(self):
+        """Test only changes after the cursor are returned, in order"""
+        hydroponic_system = HydroponicSystem.objects.create(title='System 1', user=self.user, location='London')
+        cursor = self.client.get(CHANGES_URL).data['cursor']
+        measurement = Measurement.objects.create(hydroponic_system=hydroponic_system, ph=Decimal('6'),
+                                                 temperature=Decimal('20'), tds=Decimal('300'))
+        measurement.ph = Decimal('6.5')
+        measurement.save()
+        self.client.delete(reverse('api:measurement-detail', args=[measurement.id]))
+
+        response = self.client.get(CHANGES_URL, {'since': cursor})
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual([(change['model'], change['action']) for change in response.data['results']],
+                         [('measurement', 'create'), ('measurement', 'update'), ('measurement', 'delete')])
+        self.assertEqual(response.data['cursor'], response.data['results'][-1]['id'])
+        self.assertFalse(response.data['has_more'])
+        self.assertEqual(self.client.get(CHANGES_URL, {'since': response.data['cursor']}).data['results'], [])
+
+    def test_system_delete_does_not_record_each_measurement(self):
+        """Test deleting a system records one change for the system only"""
+        hydroponic_system = HydroponicSystem.objects.create(title='System 1', user=self.user, location='London')
+        Measurement.objects.create(hydroponic_system=hydroponic_system, ph=Decimal('6'),
+                                   temperature=Decimal('20'), tds=Decimal('300'))
+        cursor = Change.objects.last().id
+
+        hydroponic_system.delete()
+
+        changes = Change.objects.filter(id__gt=cursor)
+        self.assertEqual([(change.model, change.action) for change in changes], [('system', 'delete')])
+
+    @override_settings(CHANGE_FEED_SETTLE_SECONDS=60)
+    def test_cursor_without_since_is_settled(self):
+        """Test the cursor returned without since skips changes younger than the settle time"""
+        settled_system = HydroponicSystem.objects.create(title='System 1', user=self.user, location='London')
+        Change.objects.update(timestamp=timezone.now() - timedelta(minutes=5))
+        HydroponicSystem.objects.create(title='System 2', user=self.user, location='Paris')
+
+        response = self.client.get(CHANGES_URL)
+
+        self.assertEqual(response.data['cursor'], Change.objects.get(object_id=settled_system.id).id)
+
+    def test_calibration_is_one_system_change(self):
+        """Test a calibration correction records a single update of the system with the correction"""
+        hydroponic_system = HydroponicSystem.objects.create(title='System 1', user=self.user, location='London')
+        for ph in (Decimal('6'), Decimal('6.5')):
+            Measurement.objects.create(hydroponic_system=hydroponic_system, ph=ph, temperature=Decimal('20'),
+                                       tds=Decimal('300'))
+        cursor = self.client.get(CHANGES_URL).data['cursor']
+
+        self.client.post(CALIBRATE_URL, {'hydroponic_system': hydroponic_system.id, 'field': 'ph', 'offset': '0.1'})
+        response = self.client.get(CHANGES_URL, {'since': cursor})
+
+        [change] = response.data['results']
+        self.assertEqual((change['model'], change['object_id'], change['action']),
+                         ('system', hydroponic_system.id, 'update'))
+        self.assertEqual((change['correction']['field'], change['correction']['affected']), ('ph', 2))
+
+    def test_changes_limited_to_user(self):
+        """Test changes of other users are not returned"""
+        other_user = create_user(username='testuser2', password='testpass123')
+        HydroponicSystem.objects.create(title='System 1', user=other_user, location='London')
+
+        response = self.client.get(CHANGES_URL, {'since': 0})
+
+        self.assertEqual(response.data['results'], [])
+
+    def test_invalid_cursor(self):
+        """Test a non-numeric cursor is rejected"""
+        response = self.client.get(CHANGES_URL, {'since': 'abc'})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    @override_settings(CHANGE_FEED_PAGE_SIZE=2)
+    def test_changes_has_more(self):
+        """Test the feed is returned in pages of at most CHANGE_FEED_PAGE_SIZE changes"""
+        for index in range(3):
+            HydroponicSystem.objects.create(title=f'System {index}', user=self.user, location='London')
+
+        response = self.client.get(CHANGES_URL, {'since': 0})
+
+        self.assertEqual(len(response.data['results']), 2)
+        self.assertTrue(response.data['has_more'])
+
+    def test_pruned_cursor_expired(self):
+        """Test a cursor below the pruned changes gets 410 and a cursor after them still works"""
+        HydroponicSystem.objects.create(title='System 1', user=self.user, location='London')
+        Change.objects.update(timestamp=timezone.now() - timedelta(days=60))
+        HydroponicSystem.objects.create(title='System 2', user=self.user, location='Paris')
+
+        call_command('prune_changes', days=30, stdout=StringIO())
+
+        self.assertEqual(Change.objects.count(), 1)
+        self.assertEqual(ChangeFeedPrune.objects.get().deleted, 1)
+        self.assertEqual(self.client.get(CHANGES_URL, {'since': 0}).status_code, status.HTTP_410_GONE)
+        response = self.client.get(CHANGES_URL, {'since': ChangeFeedPrune.objects.get().pruned_through})
+        self.assertEqual([change['action'] for change in response.data['results']], ['create'])
@@ -0,0 +1,83 @@
+"""
+Tests for the completeness report API
+"""
+
+from datetime import timedelta
+from decimal import Decimal
+from django.contrib.auth.models import User
+from django.test import TestCase
+from django.urls import reverse
+from django.utils import timezone
+from rest_framework import status
+from rest_framework.test import APIClient
+from core.models import HydroponicSystem
+from core.models import Measurement
+
+COMPLETENESS_URL = reverse('api:hydroponicsystem-completeness-all')
+
+
+def detail_url(hydroponic_system_id):
+    """Create and return a system completeness URL"""
+    return reverse('api:hydroponicsystem-completeness', args=[hydroponic_system_id])
+
+
+class CompletenessApiTests(TestCase):
+    """Test the completeness reports of one and of all systems"""
+
+    def setUp(self):
+        self.client = APIClient()
+        self.user = User.objects.create_user(username='testuser', password='testpass123')
+        self.client.force_authenticate(self.user)
+        self.system = HydroponicSystem.objects.create(title='System 1', user=self.user, location='London')
+        self.other_system = HydroponicSystem.objects.create(title='System 2', user=self.user, location='Paris')
+        now = timezone.now()
+        for age in (timedelta(days=3), timedelta(hours=2), timedelta(hours=1, minutes=50)):
+            measurement = Measurement.objects.create(hydroponic_system=self.system, ph=Decimal('6.5'),
+                                                     temperature=Decimal('20'), tds=Decimal('300'))
+            Measurement.objects.filter(id=measurement.id).update(timestamp=now - age)
+
+    def test_system_report(self):
+        """Test the gaps of a system's whole history"""
+        response = self.client.get(detail_url(self.system.id), {'min_gap': 3600})
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['readings'], 3)
+        self.assertEqual(len(response.data['gaps']), 1)
+        self.assertAlmostEqual(response.data['gaps'][0]['seconds'], (timedelta(days=3) - timedelta(hours=2))
+                               .total_seconds(), places=0)
+
+    def test_report_date_range(self):
+        """Test the date filters limit the period, which ends now at the latest"""
+        today = timezone.now().date().isoformat()
+        response = self.client.get(detail_url(self.system.id), {'min_gap': 3600, 'start_date_before': today,
+                                                                'start_date_after': today})
+
+        self.assertEqual(response.data['readings'], 2)
+        self.assertLessEqual(response.data['end'], timezone.now().isoformat().replace('+00:00', 'Z'))
+        self.assertEqual(response.data['gaps'][-1]['seconds'] > 3600, True)
+
+    def test_all_systems(self):
+        """Test the batch report covers every system of the user"""
+        other = User.objects.create_user(username='other', password='testpass123')
+        HydroponicSystem.objects.create(title='System 3', user=other, location='Rome')
+
+        response = self.client.get(COMPLETENESS_URL)
+
+        self.assertEqual([report['hydroponic_system'] for report in response.data],
+                         [self.system.id, self.other_system.id])
+        self.assertEqual(response.data[1]['readings'], 0)
+
+    def test_invalid_parameters(self):
+        """Test a minimum gap below one second is rejected"""
+        response = self.client.get(detail_url(self.system.id), {'min_gap': 0})
+
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_other_users_system(self):
+        """Test the report of another user's system is not found"""
+        other = User.objects.create_user(username='other', password='testpass123')
+        other_system = HydroponicSystem.objects.create(title='System 3', user=other, location='Rome')
+
+        response = self.client.get(detail_url(other_system.id))
+
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
@@ -0,0 +1,194 @@
+"""
+Tests for the in-process hot window store
+"""
+
+from datetime import timedelta
+from decimal import Decimal
+import numpy as np
+from django.contrib.auth.models import User
+from django.test import SimpleTestCase
+from django.test import TransactionTestCase
+from django.test import override_settings
+from django.urls import reverse
+from django.utils import timezone
+from rest_framework.test import APIClient
+from core.models import HydroponicSystem
+from core.models import Measurement
+from ..cache import bump_data_versions
+from ..cache import get_cache
+from ..hotstore import COLUMNS
+from ..hotstore import Series
+from ..hotstore import store
+
+MEASUREMENTS_URL = reverse('api:measurement-list')
+
+
+def create_user(username, password):
+    """Create and return a new user"""
+    return User.objects.create_user(username, password)
+
+
+def create_readings(hydroponic_system, number, minutes=5):
+    """Create readings every few minutes up to now, pH moving through a daily cycle"""
+    now = timezone.now()
+    for index in range(number):
+        measurement = Measurement.objects.create(hydroponic_system=hydroponic_system,
+                                                 ph=Decimal(6 + (index * 7) % 200 / 100).quantize(Decimal('0.01')),
+                                                 temperature=Decimal(20 + index % 5), tds=Decimal(300 + index % 11))
+        Measurement.objects.filter(id=measurement.id).update(
+            timestamp=now - timedelta(minutes=minutes * (number - index)))
+
+
+def system_url(hydroponic_system_id, name):
+    """Return the URL of a hydroponic system action"""
+    return reverse(f'api:hydroponicsystem-{name}', args=[hydroponic_system_id])
+
+
+class SeriesTests(SimpleTestCase):
+    """Test the ring buffer of a system's readings"""
+
+    def make_series(self, capacity):
+        columns = {name: np.array([], dtype=dtype) for name, dtype in COLUMNS.items()}
+        return Series(1, 1, 0, 0, columns, capacity)
+
+    def test_buffer_grows_then_overwrites_oldest(self):
+        """Test the buffer doubles up to its capacity and then drops the oldest readings"""
+        series = self.make_series(2)
+        for index in range(1, 6):
+            series.append({'id': index, 'timestamp': index * 10, 'ph': 600, 'temperature': 2000, 'tds': 30000}, 4)
+
+        self.assertEqual(series.capacity, 4)
+        self.assertEqual(series.arrays()['id'].tolist(), [2, 3, 4, 5])
+        self.assertEqual(series.since, 11)
+        self.assertEqual(series.nbytes, 4 * 26)
+
+
+@override_settings(HOT_STORE_ENABLED=True, RESPONSE_CACHE_ENABLED=False)
+class HotStoreApiTests(TransactionTestCase):
+    """Test answering recent window queries from the hot store"""
+
+    def setUp(self):
+        get_cache().clear()
+        store.clear()
+        self.client = APIClient()
+        self.user = create_user(username='testuser', password='testpass123')
+        self.client.force_authenticate(self.user)
+        self.system = HydroponicSystem.objects.create(title='System 1', user=self.user, location='London')
+        create_readings(self.system, 300)
+        self.since = {'hydroponic_system': self.system.id,
+                      'start_date_after': (timezone.now() - timedelta(days=1)).date()}
+
+    def assert_same_as_database(self, url, params):
+        """Assert the store answers the request exactly like the database"""
+        response = self.client.get(url, params)
+        with override_settings(HOT_STORE_ENABLED=False):
+            expected = self.client.get(url, params)
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['X-Hot-Store'], 'HIT')
+        self.assertNotIn('X-Hot-Store', expected)
+        self.assertEqual(response.json(), expected.json())
+
+    def test_list_matches_database(self):
+        """Test recent window lists with filters, ordering and pages match the database"""
+        self.assert_same_as_database(MEASUREMENTS_URL, self.since)
+        self.assert_same_as_database(MEASUREMENTS_URL, {**self.since, 'ordering': 'timestamp', 'page': 3})
+        self.assert_same_as_database(MEASUREMENTS_URL, {**self.since, 'ph_min': '6.5', 'ph_max': '7.255',
+                                                        'ordering': '-timestamp'})
+
+    def test_chart_and_stats_match_database(self):
+        """Test downsampled charts and stats of the window match the database"""
+        self.assert_same_as_database(MEASUREMENTS_URL, {**self.since, 'max_points': 50})
+        self.assert_same_as_database(MEASUREMENTS_URL, {**self.since, 'max_points': 20,
+                                                        'downsample_field': 'temperature'})
+        self.assert_same_as_database(system_url(self.system.id, 'stats'), self.since)
+
+    def test_latest_measurements_of_system(self):
+        """Test the system detail lists its latest measurements from a loaded series, without loading it"""
+        response = self.client.get(system_url(self.system.id, 'detail'))
+
+        self.assertNotIn('X-Hot-Store', response)
+        self.assertEqual(store.stats()['systems'], 0)
+        self.client.get(MEASUREMENTS_URL, self.since)
+        self.assert_same_as_database(system_url(self.system.id, 'detail'), {})
+
+    def test_unbounded_query_uses_database(self):
+        """Test a query starting before the window or of another user's system is not answered by the store"""
+        other = create_user(username='other', password='testpass123')
+        other_system = HydroponicSystem.objects.create(title='System 2', user=other, location='Paris')
+        create_readings(other_system, 5)
+
+        unbounded = self.client.get(MEASUREMENTS_URL, {'hydroponic_system': self.system.id})
+        foreign = self.client.get(MEASUREMENTS_URL, {**self.since, 'hydroponic_system': other_system.id})
+
+        self.assertNotIn('X-Hot-Store', unbounded)
+        self.assertEqual(unbounded.data['count'], 300)
+        self.assertNotIn('X-Hot-Store', foreign)
+        self.assertEqual(foreign.data['count'], 0)
+
+    def test_created_measurement_is_ingested(self):
+        """Test a measurement created through the API is appended without reloading the series"""
+        self.client.get(MEASUREMENTS_URL, self.since)
+        self.client.post(MEASUREMENTS_URL, {'hydroponic_system': self.system.id, 'ph': '7.10',
+                                            'temperature': '21.00', 'tds': '310.00'})
+
+        response = self.client.get(MEASUREMENTS_URL, self.since)
+
+        self.assertEqual(response['X-Hot-Store'], 'HIT')
+        self.assertEqual(response.data['count'], 301)
+        self.assertEqual(response.data['results'][0]['ph'], '7.10')
+        self.assertEqual(store.stats()['misses'], 1)
+
+    def test_change_elsewhere_reloads_series(self):
+        """Test a deleted measurement bumps the data version, so the series is read again"""
+        self.client.get(MEASUREMENTS_URL, self.since)
+        measurement = Measurement.objects.filter(hydroponic_system=self.system).order_by('-timestamp').first()
+        self.client.delete(reverse('api:measurement-detail', args=[measurement.id]))
+
+        response = self.client.get(MEASUREMENTS_URL, self.since)
+
+        self.assertEqual(response.data['count'], 299)
+        self.assertEqual(store.stats()['misses'], 2)
+
+    def insert_elsewhere(self, minutes_ago=0):
+        """Insert a reading like another worker does, bumping the shared version without this store ingesting it"""
+        [measurement] = Measurement.objects.bulk_create([Measurement(
+            hydroponic_system=self.system, ph=Decimal('7.20'), temperature=Decimal('21.00'), tds=Decimal('305.00'))])
+        if minutes_ago:
+            timestamp = timezone.now() - timedelta(minutes=minutes_ago)
+            Measurement.objects.filter(id=measurement.id).update(timestamp=timestamp)
+        bump_data_versions(('system', self.system.id))
+
+    def test_insert_elsewhere_fetches_newer_readings(self):
+        """Test a reading inserted by another worker is appended to the series without reloading it"""
+        self.client.get(MEASUREMENTS_URL, self.since)
+        self.insert_elsewhere()
+
+        self.assert_same_as_database(MEASUREMENTS_URL, self.since)
+
+        self.assertEqual(store.stats()['readings'], 301)
+        self.assertEqual(store.stats()['refreshes'], 1)
+
+    def test_insert_elsewhere_behind_last_reading_reloads_series(self):
+        """Test a reading inserted by another worker before the last stored one makes the series reload"""
+        self.client.get(MEASUREMENTS_URL, self.since)
+        self.insert_elsewhere(minutes_ago=60)
+
+        self.assert_same_as_database(MEASUREMENTS_URL, self.since)
+
+        self.assertEqual(store.stats()['readings'], 301)
+        self.assertEqual(store.stats()['refreshes'], 0)
+        self.assertEqual(store.stats()['misses'], 2)
+
+    def test_memory_budget_evicts_least_recently_used(self):
+        """Test the store drops the least recently used series when it exceeds its memory budget"""
+        other_system = HydroponicSystem.objects.create(title='System 2', user=self.user, location='Paris')
+        create_readings(other_system, 10)
+        self.client.get(MEASUREMENTS_URL, self.since)
+        size = store.stats()['bytes']
+
+        with override_settings(HOT_STORE_MAX_BYTES=size + 1):
+            self.client.get(MEASUREMENTS_URL, {**self.since, 'hydroponic_system': other_system.id})
+
+        self.assertEqual(store.stats()['systems'], 1)
+        self.assertLessEqual(store.stats()['bytes'], size + 1)
@@ -2,10 +2,14 @@
 Tests for hydroponic system API
 """
 
+from datetime import date
 from datetime import datetime
 from datetime import timedelta
 from django.contrib.auth.models import User
+from decimal import Decimal
 from core.models import HydroponicSystem
+from core.models import Job
+from core.models import Measurement
 from ..serializers import HydroponicSystemSerializer
 from ..serializers import HydroponicSystemDetailSerializer
 from django.test import TestCase
@@ -20,6 +24,10 @@ def detail_url(hydroponicsystem_id):
     return reverse('api:hydroponicsystem-detail', args=[hydroponicsystem_id])
 
 
+def anomalies_url(hydroponicsystem_id):
+    return reverse('api:hydroponicsystem-anomalies', args=[hydroponicsystem_id])
+
+
 def create_user(username, password):
     """Create and return a new user"""
     return User.objects.create_user(username, password)
@@ -159,3 +167,71 @@ class PrivateHydroponicSystemApiTests(TestCase):
         HydroponicSystemSerializer(systems, many=True)
 
         self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+    def test_search_hydroponic_system(self):
+        """Test searching hydroponic systems by title and location, best match first"""
+        HydroponicSystem.objects.create(title='Basement', user=self.user, location='Londonderry')
+        HydroponicSystem.objects.create(title='Balcony', user=self.user, location='London')
+        HydroponicSystem.objects.create(title='London lettuce', user=self.user, location='Paris')
+        HydroponicSystem.objects.create(title='Greenhouse', user=self.user, location='Barcelona')
+
+        response = self.client.get(HYDROPONIC_SYSTEM_URL, {'search': 'london'})
+
+        titles = [system['title'] for system in response.data['results']]
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(titles[0], 'Balcony')
+        self.assertEqual(sorted(titles), ['Balcony', 'Basement', 'London lettuce'])
+
+    def test_search_hydroponic_system_ordering(self):
+        """Test an explicit ordering overrides the search rank"""
+        first = HydroponicSystem.objects.create(title='System London', user=self.user, location='Paris')
+        HydroponicSystem.objects.create(title='Balcony', user=self.user, location='London')
+
+        response = self.client.get(HYDROPONIC_SYSTEM_URL, {'search': 'london', 'ordering': 'created'})
+
+        self.assertEqual(response.data['results'][0]['id'], first.id)
+
+    def test_hydroponic_system_anomalies(self):
+        """Test the anomaly report of a hydroponic system"""
+        hydroponic_system = HydroponicSystem.objects.create(title='System 1', user=self.user, location='London')
+        for ph in ['6.0'] * 5 + ['9.0']:
+            Measurement.objects.create(hydroponic_system=hydroponic_system, ph=Decimal(ph), temperature=Decimal('20'),
+                                       tds=Decimal('300'))
+
+        response = self.client.get(anomalies_url(hydroponic_system.id), {'window': 3, 'flatline_points': 5,
+                                                                         'start_date_after': date.today()})
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['readings'], 6)
+        found = [(anomaly['field'], anomaly['kind']) for anomaly in response.data['anomalies']]
+        self.assertIn(('ph', 'flatline'), found)
+
+    def test_hydroponic_system_anomalies_unbounded_range_rejected(self):
+        """Test an anomaly report without a start date or over a long range points to a job without creating one"""
+        hydroponic_system = HydroponicSystem.objects.create(title='System 1', user=self.user, location='London')
+
+        unbounded = self.client.get(anomalies_url(hydroponic_system.id), {'window': 3})
+        long_range = self.client.get(anomalies_url(hydroponic_system.id),
+                                     {'start_date_after': date.today() - timedelta(days=400)})
+
+        self.assertEqual(unbounded.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(unbounded.data['job']['kind'], Job.DETECT_ANOMALIES)
+        self.assertEqual(unbounded.data['job']['parameters']['window'], 3)
+        self.assertEqual(long_range.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertIn('start', long_range.data['job']['parameters'])
+        self.assertFalse(Job.objects.exists())
+        submitted = self.client.post(reverse('api:job-list'), unbounded.data['job'], format='json')
+        self.assertEqual(submitted.status_code, status.HTTP_202_ACCEPTED)
+
+    def test_hydroponic_system_anomalies_invalid_parameters(self):
+        """Test invalid anomaly parameters are rejected"""
+        hydroponic_system = HydroponicSystem.objects.create(title='System 1', user=self.user, location='London')
+        response = self.client.get(anomalies_url(hydroponic_system.id), {'window': 1})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_hydroponic_system_anomalies_other_user(self):
+        """Test the anomaly report of another user's system is not found"""
+        other_user = create_user(username='testuser2', password='testpass123')
+        hydroponic_system = HydroponicSystem.objects.create(title='System 1', user=other_user, location='London')
+        response = self.client.get(anomalies_url(hydroponic_system.id))
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
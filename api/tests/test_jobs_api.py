@@ -0,0 +1,109 @@
+"""
+Tests for the background jobs API
+"""
+
+import tempfile
+from decimal import Decimal
+from pathlib import Path
+from django.contrib.auth.models import User
+from django.test import TestCase
+from django.test import override_settings
+from django.urls import reverse
+from rest_framework import status
+from rest_framework.test import APIClient
+from core.jobs import claim_job
+from core.jobs import run_job
+from core.models import HydroponicSystem
+from core.models import Job
+from core.models import Measurement
+
+JOBS_URL = reverse('api:job-list')
+
+
+def create_user(username, password):
+    """Create and return a new user"""
+    return User.objects.create_user(username, password)
+
+
+def detail_url(job_id):
+    """Create and return a job detail URL"""
+    return reverse('api:job-detail', args=[job_id])
+
+
+class JobApiTests(TestCase):
+    """Test submitting, polling and downloading jobs"""
+
+    def setUp(self):
+        self.results = tempfile.TemporaryDirectory()
+        self.addCleanup(self.results.cleanup)
+        override = override_settings(JOB_RESULTS_DIR=Path(self.results.name))
+        override.enable()
+        self.addCleanup(override.disable)
+
+        self.client = APIClient()
+        self.user = create_user(username='testuser', password='testpass123')
+        self.client.force_authenticate(self.user)
+        self.system = HydroponicSystem.objects.create(title='System 1', user=self.user, location='London')
+        Measurement.objects.create(hydroponic_system=self.system, ph=Decimal('6.5'), temperature=Decimal('20'),
+                                   tds=Decimal('300'))
+
+    def test_submit_job_only_queues_it(self):
+        """Test submitting a job returns 202 with the queued job"""
+        response = self.client.post(JOBS_URL, {'kind': Job.EXPORT_MEASUREMENTS,
+                                               'parameters': {'hydroponic_system': self.system.id,
+                                                              'start': '2024-01-01T00:00:00Z'}}, format='json')
+
+        self.assertEqual(response.status_code, status.HTTP_202_ACCEPTED)
+        self.assertEqual(response.data['status'], Job.QUEUED)
+        self.assertEqual(response.data['parameters'], {'hydroponic_system': self.system.id,
+                                                       'start': '2024-01-01T00:00:00Z'})
+        self.assertIsNone(response.data['download'])
+
+    def test_submit_job_for_other_users_system(self):
+        """Test a job cannot be submitted for the system of another user"""
+        other = create_user(username='other', password='testpass123')
+        other_system = HydroponicSystem.objects.create(title='System 2', user=other, location='Paris')
+
+        response = self.client.post(JOBS_URL, {'kind': Job.SYSTEM_STATS,
+                                               'parameters': {'hydroponic_system': other_system.id}}, format='json')
+
+        self.assertEqual(response.status_code, status.HTTP_403_FORBIDDEN)
+        self.assertFalse(Job.objects.exists())
+
+    def test_submit_job_with_invalid_parameters(self):
+        """Test the parameters are validated for the kind of job"""
+        response = self.client.post(JOBS_URL, {'kind': Job.DETECT_ANOMALIES,
+                                               'parameters': {'hydroponic_system': self.system.id, 'window': 1}},
+                                    format='json')
+
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertIn('window', response.data['parameters'])
+
+    def test_poll_and_download_export(self):
+        """Test a finished export reports its result and its CSV can be downloaded"""
+        response = self.client.post(JOBS_URL, {'kind': Job.EXPORT_MEASUREMENTS,
+                                               'parameters': {'hydroponic_system': self.system.id}}, format='json')
+        job_id = response.data['id']
+        self.assertEqual(self.client.get(reverse('api:job-download', args=[job_id])).status_code,
+                         status.HTTP_404_NOT_FOUND)
+
+        run_job(claim_job())
+        job = self.client.get(detail_url(job_id)).data
+        download = self.client.get(job['download'])
+
+        self.assertEqual(job['status'], Job.SUCCEEDED)
+        self.assertEqual(job['progress'], 100)
+        self.assertEqual(job['result'], {'rows': 1})
+        self.assertEqual(download.status_code, status.HTTP_200_OK)
+        self.assertIn('attachment', download['Content-Disposition'])
+        self.assertIn(b'6.50', b''.join(download.streaming_content))
+
+    def test_list_only_own_jobs(self):
+        """Test users only see their own jobs"""
+        other = create_user(username='other', password='testpass123')
+        Job.objects.create(user=other, kind=Job.SYSTEM_STATS, parameters={})
+        Job.objects.create(user=self.user, kind=Job.SYSTEM_STATS, parameters={'hydroponic_system': self.system.id})
+
+        response = self.client.get(JOBS_URL)
+
+        self.assertEqual(response.data['count'], 1)
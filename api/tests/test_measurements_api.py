@@ -5,9 +5,13 @@ Tests for measurement API
 from datetime import datetime
 from datetime import timedelta
 from decimal import Decimal
+from unittest import mock
 from django.contrib.auth.models import User
+from django.db import DataError
+from django.db.models import QuerySet
 from core.models import HydroponicSystem
 from core.models import Measurement
+from core.models import CalibrationCorrection
 from ..serializers import MeasurementSerializer
 from django.test import TestCase
 from django.urls import reverse
@@ -15,6 +19,7 @@ from rest_framework.test import APIClient
 from rest_framework import status
 
 MEASUREMENTS_URL = reverse('api:measurement-list')
+CALIBRATE_URL = reverse('api:measurement-calibrate')
 
 
 def detail_url(measurement_id):
@@ -155,3 +160,80 @@ class PrivateMeasurementApiTests(TestCase):
         serializer = MeasurementSerializer(measurements, many=True)
         self.assertEqual(response.status_code, status.HTTP_200_OK)
         self.assertEqual(response.data, serializer.data)
+
+    def test_calibrate_measurements_in_range(self):
+        """Test bulk calibration only touches filtered measurements of the system"""
+        self.create_measurements()
+        hydroponic_system = HydroponicSystem.objects.get()
+        other_system = HydroponicSystem.objects.create(title='System 2', user=self.user, location='Paris')
+        other = Measurement.objects.create(hydroponic_system=other_system, ph=Decimal('25'),
+                                           temperature=Decimal('35'), tds=Decimal('25'))
+        payload = {'hydroponic_system': hydroponic_system.id, 'field': 'ph', 'scale': '1.1', 'offset': '-0.5'}
+
+        response = self.client.post(f'{CALIBRATE_URL}?ph_min=25', payload)
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['affected'], 2)
+        self.assertEqual(sorted(Measurement.objects.filter(hydroponic_system=hydroponic_system)
+                                .values_list('ph', flat=True)), [Decimal('20'), Decimal('27'), Decimal('32.5')])
+        other.refresh_from_db()
+        self.assertEqual(other.ph, Decimal('25'))
+        correction = CalibrationCorrection.objects.get()
+        self.assertEqual(correction.filters, {'ph_min': '25'})
+        self.assertEqual(correction.user, self.user)
+
+    def test_calibrate_out_of_range_rejected(self):
+        """Test a correction that overflows the field is rejected without changes"""
+        self.create_measurements()
+        hydroponic_system = HydroponicSystem.objects.get()
+        payload = {'hydroponic_system': hydroponic_system.id, 'field': 'ph', 'scale': '4'}
+
+        response = self.client.post(CALIBRATE_URL, payload)
+
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(Measurement.objects.filter(ph=Decimal('30')).count(), 1)
+        self.assertFalse(CalibrationCorrection.objects.exists())
+
+    def test_calibrate_overflow_in_update_rejected(self):
+        """Test an overflow raised by the UPDATE itself is a bad request, not a server error"""
+        self.create_measurements()
+        hydroponic_system = HydroponicSystem.objects.get()
+        payload = {'hydroponic_system': hydroponic_system.id, 'field': 'ph', 'offset': '1'}
+
+        with mock.patch.object(QuerySet, 'update', side_effect=DataError('numeric field overflow')):
+            response = self.client.post(CALIBRATE_URL, payload)
+
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertFalse(CalibrationCorrection.objects.exists())
+
+    def test_calibrate_other_user_system_forbidden(self):
+        """Test calibrating measurements of another user's system is forbidden"""
+        other_user = create_user(username='testuser2', password='testpass123')
+        hydroponic_system = HydroponicSystem.objects.create(title='System 1', user=other_user, location='London')
+        payload = {'hydroponic_system': hydroponic_system.id, 'field': 'tds', 'offset': '5'}
+
+        response = self.client.post(CALIBRATE_URL, payload)
+
+        self.assertEqual(response.status_code, status.HTTP_403_FORBIDDEN)
+
+    def test_downsampled_measurement_list(self):
+        """Test max_points returns at most that many measurements of one system in time order"""
+        hydroponic_system = HydroponicSystem.objects.create(title='System 1', user=self.user, location='London')
+        Measurement.objects.bulk_create([
+            Measurement(hydroponic_system=hydroponic_system, ph=Decimal(6 + index % 7), temperature=Decimal('20'),
+                        tds=Decimal('300'))
+            for index in range(50)
+        ])
+
+        response = self.client.get(MEASUREMENTS_URL, {'hydroponic_system': hydroponic_system.id, 'max_points': 10})
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['count'], 50)
+        self.assertLessEqual(len(response.data['results']), 10)
+        timestamps = [measurement['timestamp'] for measurement in response.data['results']]
+        self.assertEqual(timestamps, sorted(timestamps))
+
+    def test_downsampled_measurement_list_requires_system(self):
+        """Test max_points is rejected without a hydroponic system"""
+        response = self.client.get(MEASUREMENTS_URL, {'max_points': 10})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
@@ -0,0 +1,98 @@
+"""
+Tests for the approximate count pagination
+"""
+
+from decimal import Decimal
+from unittest.mock import patch
+from django.contrib.auth.models import User
+from core.models import HydroponicSystem
+from core.models import Measurement
+from ..cache import get_cache
+from django.test import TestCase
+from django.test import override_settings
+from django.urls import reverse
+from rest_framework.test import APIClient
+from rest_framework import status
+
+MEASUREMENTS_URL = reverse('api:measurement-list')
+HYDROPONIC_SYSTEM_URL = reverse('api:hydroponicsystem-list')
+
+
+def create_user(username, password):
+    """Create and return a new user"""
+    return User.objects.create_user(username, password)
+
+
+@override_settings(APPROXIMATE_COUNT_THRESHOLD=3)
+class ApproximateCountPaginationTests(TestCase):
+    """Test counts of paginated listings"""
+
+    def setUp(self):
+        get_cache().clear()
+        self.client = APIClient()
+        self.user = create_user(username='testuser', password='testpass123')
+        self.client.force_authenticate(self.user)
+        self.hydroponic_system = HydroponicSystem.objects.create(title='System 1', user=self.user,
+                                                                 location='London')
+
+    def create_measurements(self, number):
+        Measurement.objects.bulk_create([
+            Measurement(hydroponic_system=self.hydroponic_system, ph=Decimal('6'), temperature=Decimal('20'),
+                        tds=Decimal('300'))
+            for _ in range(number)
+        ])
+
+    def test_exact_count_below_threshold(self):
+        """Test listings up to the threshold are counted exactly"""
+        self.create_measurements(3)
+
+        response = self.client.get(MEASUREMENTS_URL)
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['count'], 3)
+        self.assertFalse(response.data['count_is_approximate'])
+
+    @patch('api.pagination.estimate_rows', return_value=1000)
+    def test_estimated_count_above_threshold(self, estimate_rows):
+        """Test listings above the threshold report the planner estimate"""
+        self.create_measurements(5)
+
+        response = self.client.get(MEASUREMENTS_URL)
+
+        self.assertEqual(response.data['count'], 1000)
+        self.assertTrue(response.data['count_is_approximate'])
+        self.assertEqual(len(response.data['results']), 5)
+
+    @patch('api.pagination.estimate_rows', return_value=None)
+    def test_exact_count_without_estimate(self, estimate_rows):
+        """Test backends without a planner estimate fall back to the exact count"""
+        self.create_measurements(5)
+
+        response = self.client.get(MEASUREMENTS_URL)
+
+        self.assertEqual(response.data['count'], 5)
+        self.assertFalse(response.data['count_is_approximate'])
+
+    @patch('api.pagination.estimate_rows', return_value=2)
+    def test_estimate_never_below_counted_rows(self, estimate_rows):
+        """Test an underestimate is raised to the rows already counted"""
+        for index in range(5):
+            HydroponicSystem.objects.create(title=f'System {index}', user=self.user, location='Paris')
+
+        response = self.client.get(HYDROPONIC_SYSTEM_URL)
+
+        self.assertEqual(response.data['count'], 4)
+        self.assertTrue(response.data['count_is_approximate'])
+
+    @patch('api.pagination.estimate_rows', return_value=12)
+    def test_pages_past_an_underestimate(self, estimate_rows):
+        """Test the rows after an estimate that is too low can still be paged through"""
+        self.create_measurements(35)
+
+        pages = [self.client.get(MEASUREMENTS_URL, {'page': page}) for page in (2, 3, 4, 5)]
+
+        self.assertEqual([response.status_code for response in pages], [200, 200, 200, 404])
+        self.assertEqual([response.data['count'] for response in pages[:3]], [12, 12, 12])
+        self.assertIsNotNone(pages[1].data['next'])
+        self.assertEqual(len(pages[2].data['results']), 5)
+        self.assertIsNone(pages[2].data['next'])
@@ -0,0 +1,125 @@
+"""
+Tests for on-demand request profiling and the profiles API
+"""
+
+import pstats
+import tempfile
+from decimal import Decimal
+from pathlib import Path
+from unittest import mock
+from django.contrib.auth.models import User
+from django.test import TestCase
+from django.test import override_settings
+from django.urls import reverse
+from rest_framework import status
+from rest_framework.authtoken.models import Token
+from rest_framework.test import APIClient
+from core.models import HydroponicSystem
+from core.models import Measurement
+from hydroponic_system.profiling import PROFILE_LOCK
+from hydroponic_system.profiling import sign_profile_token
+
+MEASUREMENTS_URL = reverse('api:measurement-list')
+PROFILES_URL = reverse('api:profile-list')
+
+
+class ProfilingTests(TestCase):
+    """Test requests are profiled only when asked by staff or with a signed token"""
+
+    def setUp(self):
+        self.profiles = tempfile.TemporaryDirectory()
+        self.addCleanup(self.profiles.cleanup)
+        override = override_settings(PROFILING_DIR=Path(self.profiles.name))
+        override.enable()
+        self.addCleanup(override.disable)
+
+        self.staff = User.objects.create_user(username='staff', password='testpass123', is_staff=True)
+        self.user = User.objects.create_user(username='testuser', password='testpass123')
+        system = HydroponicSystem.objects.create(title='System 1', user=self.user, location='London')
+        Measurement.objects.create(hydroponic_system=system, ph=Decimal('6.5'), temperature=Decimal('20'),
+                                   tds=Decimal('300'))
+        self.staff_client = self.token_client(self.staff)
+        self.client = self.token_client(self.user)
+
+    def token_client(self, user):
+        client = APIClient()
+        client.credentials(HTTP_AUTHORIZATION=f'Token {Token.objects.create(user=user).key}')
+        return client
+
+    def stored_profiles(self):
+        return sorted(path.name for path in Path(self.profiles.name).iterdir())
+
+    def test_not_profiled_without_header(self):
+        """Test requests without the header are not profiled"""
+        response = self.staff_client.get(MEASUREMENTS_URL)
+
+        self.assertFalse(response.has_header('X-Profile-Id'))
+        self.assertEqual(self.stored_profiles(), [])
+
+    def test_header_ignored_for_other_users(self):
+        """Test the plain header does nothing for users who are not staff"""
+        response = self.client.get(MEASUREMENTS_URL, HTTP_X_PROFILE='1')
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertFalse(response.has_header('X-Profile-Id'))
+
+    def test_one_profile_at_a_time(self):
+        """Test a request overlapping a profiled one, or another active profiler, is served unprofiled"""
+        with PROFILE_LOCK:
+            overlapping = self.staff_client.get(MEASUREMENTS_URL, HTTP_X_PROFILE='1')
+        with mock.patch('cProfile.Profile.enable', side_effect=ValueError('Another profiling tool is already active')):
+            refused = self.staff_client.get(MEASUREMENTS_URL, HTTP_X_PROFILE='1')
+
+        self.assertEqual([overlapping.status_code, refused.status_code], [200, 200])
+        self.assertFalse(overlapping.has_header('X-Profile-Id'))
+        self.assertFalse(refused.has_header('X-Profile-Id'))
+        self.assertEqual(self.stored_profiles(), [])
+        self.assertTrue(PROFILE_LOCK.acquire(blocking=False))
+        PROFILE_LOCK.release()
+
+    def test_staff_profile(self):
+        """Test a staff request is profiled and its profile can be listed, read and downloaded"""
+        response = self.staff_client.get(MEASUREMENTS_URL, HTTP_X_PROFILE='1')
+        profile_id = response['X-Profile-Id']
+
+        profiles = self.staff_client.get(PROFILES_URL).data
+        profile = self.staff_client.get(reverse('api:profile-detail', args=[profile_id])).data
+        download = self.staff_client.get(profiles[0]['download'])
+
+        self.assertEqual(self.stored_profiles(), [f'{profile_id}.json', f'{profile_id}.prof'])
+        self.assertEqual([item['id'] for item in profiles], [profile_id])
+        self.assertEqual(profile['path'], MEASUREMENTS_URL)
+        self.assertEqual(profile['status'], 200)
+        self.assertEqual(profile['query_count'], len(profile['queries']))
+        self.assertTrue(any('authtoken_token' in query['sql'] for query in profile['queries']))
+        self.assertTrue(profile['functions'])
+        self.assertEqual(download.status_code, status.HTTP_200_OK)
+        self.assertIn(f'{profile_id}.prof', download['Content-Disposition'])
+
+        path = Path(self.profiles.name) / f'{profile_id}.prof'
+        self.assertTrue(pstats.Stats(str(path)).total_calls)
+
+    def test_signed_token(self):
+        """Test a signed token profiles requests below its path only"""
+        allowed = self.client.get(MEASUREMENTS_URL, HTTP_X_PROFILE=sign_profile_token(MEASUREMENTS_URL))
+        other_path = self.client.get(MEASUREMENTS_URL,
+                                     HTTP_X_PROFILE=sign_profile_token(reverse('api:hydroponicsystem-list')))
+        forged = self.client.get(MEASUREMENTS_URL, HTTP_X_PROFILE='{"path": ""}:forged')
+
+        self.assertTrue(allowed.has_header('X-Profile-Id'))
+        self.assertFalse(other_path.has_header('X-Profile-Id'))
+        self.assertFalse(forged.has_header('X-Profile-Id'))
+
+    @override_settings(PROFILING_MAX_PROFILES=2)
+    def test_oldest_profiles_dropped(self):
+        """Test only the newest profiles are kept"""
+        profile_ids = [self.staff_client.get(MEASUREMENTS_URL, HTTP_X_PROFILE='1')['X-Profile-Id'] for _ in range(3)]
+
+        self.assertEqual(len(self.stored_profiles()), 4)
+        self.assertNotIn(f'{min(profile_ids)}.json', self.stored_profiles())
+
+    def test_profiles_admin_only(self):
+        """Test users who are not staff cannot list or download profiles"""
+        self.assertEqual(self.client.get(PROFILES_URL).status_code, status.HTTP_403_FORBIDDEN)
+        self.assertEqual(self.staff_client.get(reverse('api:profile-detail', args=['20240101T000000000000-01234567']))
+                         .status_code, status.HTTP_404_NOT_FOUND)
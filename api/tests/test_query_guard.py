@@ -0,0 +1,96 @@
+"""
+Tests for the query cost guard and statement timeouts
+"""
+
+import unittest
+from datetime import timedelta
+from unittest import mock
+from decimal import Decimal
+from django.contrib.auth.models import User
+from django.db import OperationalError
+from django.db import connection
+from django.test import TestCase
+from django.test import TransactionTestCase
+from django.test import override_settings
+from django.urls import reverse
+from django.utils import timezone
+from rest_framework import status
+from rest_framework.test import APIClient
+from core.db import is_query_timeout
+from core.db import statement_timeout
+from core.models import HydroponicSystem
+from core.models import Measurement
+from ..guards import guarded_query
+from ..guards import QueryTimeout
+
+MEASUREMENTS_URL = reverse('api:measurement-list')
+
+
+@override_settings(MEASUREMENT_QUERY_MAX_ROWS=2, RESPONSE_CACHE_ENABLED=False, HOT_STORE_ENABLED=False)
+class QueryCostGuardTests(TestCase):
+    """Test lists on the unindexed fields are rejected unless narrow enough"""
+
+    def setUp(self):
+        self.client = APIClient()
+        self.user = User.objects.create_user(username='testuser', password='testpass123')
+        self.client.force_authenticate(self.user)
+        self.system = HydroponicSystem.objects.create(title='System 1', user=self.user, location='London')
+        for tds in ('300', '310', '320'):
+            Measurement.objects.create(hydroponic_system=self.system, ph=Decimal('6.5'), temperature=Decimal('20'),
+                                       tds=Decimal(tds))
+        Measurement.objects.filter(tds=Decimal('300')).update(timestamp=timezone.now() - timedelta(days=10))
+        # Planner estimates of a three row table depend on when it was last analyzed, count the rows instead
+        patcher = mock.patch('api.guards.estimate_rows', return_value=None)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_unbounded_ordering_rejected(self):
+        """Test ordering the whole history by tds is rejected with an explanation"""
+        response = self.client.get(MEASUREMENTS_URL, {'ordering': '-tds'})
+
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(response.data['detail'].code, 'query_too_expensive')
+        self.assertIn('tds', response.data['detail'])
+        self.assertIn('start_date_after', response.data['detail'])
+
+    def test_unbounded_value_filter_rejected(self):
+        """Test filtering the whole history by ph is rejected"""
+        response = self.client.get(MEASUREMENTS_URL, {'ph_min': '6'})
+
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_bounded_ordering_allowed(self):
+        """Test ordering by tds within a narrow time range is allowed"""
+        start = (timezone.now() - timedelta(days=1)).date().isoformat()
+        response = self.client.get(MEASUREMENTS_URL, {'ordering': '-tds', 'start_date_after': start})
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual([measurement['tds'] for measurement in response.data['results']], ['320.00', '310.00'])
+
+    def test_indexed_ordering_allowed(self):
+        """Test orderings on indexed fields are never checked"""
+        response = self.client.get(MEASUREMENTS_URL, {'ordering': 'timestamp'})
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['count'], 3)
+
+
+@unittest.skipUnless(connection.vendor == 'postgresql', 'statement timeouts need PostgreSQL')
+class StatementTimeoutTests(TransactionTestCase):
+    """Test slow statements are cancelled and the timeout does not outlive the block"""
+
+    def test_statement_cancelled(self):
+        with self.assertRaises(OperationalError) as raised:
+            with statement_timeout(50), connection.cursor() as cursor:
+                cursor.execute('SELECT pg_sleep(1)')
+
+        self.assertTrue(is_query_timeout(raised.exception))
+        with connection.cursor() as cursor:
+            cursor.execute('SHOW statement_timeout')
+            self.assertEqual(cursor.fetchone()[0], '0')
+
+    @override_settings(QUERY_TIMEOUT_MS=50)
+    def test_guarded_query_error(self):
+        with self.assertRaises(QueryTimeout):
+            with guarded_query(), connection.cursor() as cursor:
+                cursor.execute('SELECT pg_sleep(1)')
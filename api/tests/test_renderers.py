@@ -0,0 +1,146 @@
+"""
+Tests for the orjson renderer and the response compression middleware
+"""
+
+import gzip
+import json
+import unittest
+from datetime import datetime
+from datetime import timezone
+from decimal import Decimal
+import numpy as np
+from django.contrib.auth.models import User
+from django.test import SimpleTestCase
+from django.test import TestCase
+from django.test import override_settings
+from django.urls import reverse
+from rest_framework.renderers import JSONRenderer
+from rest_framework.test import APIClient
+from core.models import HydroponicSystem
+from core.models import Measurement
+from hydroponic_system import compression
+from ..renderers import ORJSONRenderer
+
+SYSTEMS_URL = reverse('api:hydroponicsystem-list')
+
+
+class ORJSONRendererTests(SimpleTestCase):
+    """Test the orjson renderer writes the same bytes as JSONRenderer"""
+
+    def assertRendersLikeJSONRenderer(self, data, accepted_media_type=None):
+        self.assertEqual(ORJSONRenderer().render(data, accepted_media_type),
+                         JSONRenderer().render(data, accepted_media_type))
+
+    def test_serializer_output(self):
+        """Test a page of serialized measurements renders identically"""
+        self.assertRendersLikeJSONRenderer({
+            'count': 2, 'next': None, 'previous': 'http://testserver/api/measurements/?page=1',
+            'results': [{'id': 1, 'timestamp': '2024-05-01T12:00:00.123456Z', 'ph': '6.50',
+                         'temperature': '21.30', 'tds': '310.00'}] * 2,
+        })
+
+    def test_python_values(self):
+        """Test values orjson does not encode like json, datetimes, Decimals, numpy and line separators"""
+        self.assertRendersLikeJSONRenderer({
+            'timestamp': datetime(2024, 5, 1, 12, 0, 0, 123456, tzinfo=timezone.utc),
+            'naive': datetime(2024, 5, 1, 12),
+            'avg': Decimal('6.25'),
+            'values': np.array([1.5, 2.0]),
+            'score': np.float64(0.1),
+            'note': 'pH \u2028 dropped \u2029 \u20ac',
+            'pair': (1, 2),
+            3: 'integer key',
+        })
+
+    def test_indent(self):
+        """Test indented output from the Accept header"""
+        self.assertRendersLikeJSONRenderer({'results': [{'ph': '6.50'}], 'count': 1}, 'application/json; indent=2')
+        self.assertRendersLikeJSONRenderer({'results': [{'ph': '6.50'}], 'count': 1}, 'application/json; indent=4')
+
+    def test_floats(self):
+        """Test floats keep their value, only the exponent is written shorter"""
+        data = {'small': 1e-7, 'large': 1e16, 'plain': 0.1 + 0.2}
+
+        self.assertEqual(ORJSONRenderer().render(data), b'{"small":1e-7,"large":1e16,"plain":0.30000000000000004}')
+        self.assertEqual(json.loads(ORJSONRenderer().render(data)), json.loads(JSONRenderer().render(data)))
+
+    def test_large_integer(self):
+        """Test integers beyond 64 bits fall back to JSONRenderer"""
+        self.assertRendersLikeJSONRenderer({'count': 2 ** 70})
+
+    def test_none(self):
+        """Test no data renders an empty body"""
+        self.assertEqual(ORJSONRenderer().render(None), b'')
+
+
+class NegotiateTests(SimpleTestCase):
+    """Test choosing the content coding from Accept-Encoding"""
+
+    def test_gzip(self):
+        self.assertEqual(compression.negotiate('gzip, deflate'), 'gzip')
+
+    def test_refused(self):
+        self.assertIsNone(compression.negotiate('gzip;q=0, identity'))
+        self.assertIsNone(compression.negotiate(''))
+        self.assertIsNone(compression.negotiate('*;q=0'))
+
+    @unittest.skipIf(compression.brotli is None, 'brotli is not installed')
+    def test_brotli_preferred(self):
+        self.assertEqual(compression.negotiate('gzip, deflate, br'), 'br')
+        self.assertEqual(compression.negotiate('br;q=0.5, gzip'), 'gzip')
+        self.assertEqual(compression.negotiate('*'), 'br')
+
+
+class CompressionMiddlewareTests(TestCase):
+    """Test responses are compressed when large enough and accepted by the client"""
+
+    def setUp(self):
+        self.client = APIClient()
+        self.user = User.objects.create_user(username='testuser', password='testpass123')
+        self.client.force_authenticate(self.user)
+        for number in range(10):
+            system = HydroponicSystem.objects.create(title=f'Lettuce and basil, north wall {number}', user=self.user,
+                                                     location='London, greenhouse on the roof of the east building')
+            Measurement.objects.create(hydroponic_system=system, ph=Decimal('6.5'), temperature=Decimal('20'),
+                                       tds=Decimal('300'))
+
+    def test_gzip_response(self):
+        """Test a large JSON response is gzip compressed"""
+        plain = self.client.get(SYSTEMS_URL)
+        response = self.client.get(SYSTEMS_URL, HTTP_ACCEPT_ENCODING='gzip')
+
+        self.assertEqual(response['Content-Encoding'], 'gzip')
+        self.assertEqual(int(response['Content-Length']), len(response.content))
+        self.assertIn('Accept-Encoding', response['Vary'])
+        self.assertEqual(gzip.decompress(response.content), plain.content)
+
+    @unittest.skipIf(compression.brotli is None, 'brotli is not installed')
+    def test_brotli_response(self):
+        """Test brotli is preferred when the client accepts it"""
+        plain = self.client.get(SYSTEMS_URL)
+        response = self.client.get(SYSTEMS_URL, HTTP_ACCEPT_ENCODING='gzip, deflate, br')
+
+        self.assertEqual(response['Content-Encoding'], 'br')
+        self.assertEqual(compression.brotli.decompress(response.content), plain.content)
+
+    def test_not_accepted(self):
+        """Test the response is not compressed when the client does not accept a supported coding"""
+        response = self.client.get(SYSTEMS_URL, HTTP_ACCEPT_ENCODING='gzip;q=0, deflate')
+
+        self.assertFalse(response.has_header('Content-Encoding'))
+        self.assertIn('Accept-Encoding', response['Vary'])
+
+    def test_html_not_compressed(self):
+        """Test the browsable API's HTML, which holds the CSRF token, is never compressed"""
+        response = self.client.get(SYSTEMS_URL, HTTP_ACCEPT='text/html', HTTP_ACCEPT_ENCODING='gzip')
+
+        self.assertTrue(response['Content-Type'].startswith('text/html'))
+        self.assertGreater(len(response.content), 1024)
+        self.assertFalse(response.has_header('Content-Encoding'))
+
+    @override_settings(COMPRESSION_MIN_SIZE=1024 * 1024)
+    def test_below_threshold(self):
+        """Test small responses are sent uncompressed"""
+        response = self.client.get(SYSTEMS_URL, HTTP_ACCEPT_ENCODING='gzip')
+
+        self.assertFalse(response.has_header('Content-Encoding'))
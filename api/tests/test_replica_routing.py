@@ -0,0 +1,136 @@
+"""
+Tests for routing read-only API traffic to read replicas
+"""
+
+from decimal import Decimal
+from unittest import skipUnless
+from unittest.mock import patch
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.http import HttpResponse
+from django.test import RequestFactory
+from django.test import TestCase
+from django.test import TransactionTestCase
+from django.test import override_settings
+from django.urls import reverse
+from rest_framework.authtoken.models import Token
+from rest_framework.test import APIClient
+from rest_framework import status
+from core.models import HydroponicSystem
+from core.models import Measurement
+from hydroponic_system.routers import PrimaryReplicaRouter
+from hydroponic_system.routers import ReplicaRoutingMiddleware
+from hydroponic_system.routers import use_replica
+
+MEASUREMENTS_URL = reverse('api:measurement-list')
+HYDROPONIC_SYSTEM_URL = reverse('api:hydroponicsystem-list')
+
+
+def create_user(username, password):
+    """Create and return a new user"""
+    return User.objects.create_user(username, password)
+
+
+@override_settings(DATABASE_REPLICAS=['replica'])
+class ReplicaRouterTests(TestCase):
+    """Test the database router and middleware"""
+
+    def setUp(self):
+        cache.clear()
+        self.router = PrimaryReplicaRouter()
+
+    def test_reads_routed_while_replica_allowed(self):
+        """Test only data reads go to a replica, authentication and writes go to the primary"""
+        token = use_replica.set(True)
+        try:
+            self.assertEqual(self.router.db_for_read(Measurement), 'replica')
+            self.assertEqual(self.router.db_for_read(Token), 'default')
+            self.assertEqual(self.router.db_for_write(Measurement), 'default')
+        finally:
+            use_replica.reset(token)
+        self.assertEqual(self.router.db_for_read(Measurement), 'default')
+
+    def test_middleware_allows_replica_for_safe_methods(self):
+        """Test the middleware allows replica reads for GET but not for POST"""
+        seen = []
+        middleware = ReplicaRoutingMiddleware(lambda request: seen.append(use_replica.get()) or HttpResponse())
+
+        middleware(RequestFactory().get('/'))
+        middleware(RequestFactory().post('/'))
+
+        self.assertEqual(seen, [True, False])
+        self.assertFalse(use_replica.get())
+
+    def test_user_reads_primary_after_own_write(self):
+        """Test a user reads from the primary right after writing, other users keep using the replica"""
+        user = create_user(username='testuser', password='testpass123')
+        other_user = create_user(username='testuser2', password='testpass123')
+        client = APIClient()
+        routed = []
+        original = PrimaryReplicaRouter.db_for_read
+
+        def record(router, model, **hints):
+            if model is Measurement:
+                routed.append(original(router, model, **hints))
+            return 'default'
+
+        with patch.object(PrimaryReplicaRouter, 'db_for_read', autospec=True, side_effect=record):
+            client.force_authenticate(other_user)
+            client.get(MEASUREMENTS_URL)
+            client.force_authenticate(user)
+            client.get(MEASUREMENTS_URL)
+            client.post(HYDROPONIC_SYSTEM_URL, {'title': 'System 1', 'location': 'London'})
+            routed.clear()
+            client.get(MEASUREMENTS_URL, {'ph_min': 1})
+            self.assertEqual(set(routed), {'default'})
+            routed.clear()
+            client.force_authenticate(other_user)
+            client.get(MEASUREMENTS_URL, {'ph_min': 1})
+            self.assertEqual(set(routed), {'replica'})
+
+
+    def test_ingest_keeps_replica_reads(self):
+        """Test posting measurements does not pin the user, but their lists are not cached while replicas lag"""
+        user = create_user(username='testuser', password='testpass123')
+        hydroponic_system = HydroponicSystem.objects.create(title='System 1', user=user, location='London')
+        client = APIClient()
+        client.force_authenticate(user)
+        routed = []
+        original = PrimaryReplicaRouter.db_for_read
+
+        def record(router, model, **hints):
+            if model is Measurement:
+                routed.append(original(router, model, **hints))
+            return 'default'
+
+        with patch.object(PrimaryReplicaRouter, 'db_for_read', autospec=True, side_effect=record):
+            response = client.post(MEASUREMENTS_URL, {'hydroponic_system': hydroponic_system.id, 'ph': '6',
+                                                      'temperature': '20', 'tds': '300'})
+            self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+            routed.clear()
+            responses = [client.get(MEASUREMENTS_URL, {'ph_min': 1}) for _ in range(2)]
+
+        self.assertEqual(set(routed), {'replica'})
+        self.assertEqual([response['X-Cache'] for response in responses], ['MISS', 'MISS'])
+
+
+@skipUnless(settings.DATABASE_REPLICAS, 'Set POSTGRES_REPLICA_HOSTS to test with replica database aliases')
+class ReplicaDatabaseTests(TransactionTestCase):
+    """Test reading through a replica database alias, which only sees committed data"""
+    databases = '__all__'
+
+    def test_list_through_replica(self):
+        """Test a list request routed to the replica alias returns the data"""
+        user = create_user(username='testuser', password='testpass123')
+        hydroponic_system = HydroponicSystem.objects.create(title='System 1', user=user, location='London')
+        Measurement.objects.create(hydroponic_system=hydroponic_system, ph=Decimal('6'), temperature=Decimal('20'),
+                                   tds=Decimal('300'))
+        cache.clear()
+        client = APIClient()
+        client.force_authenticate(user)
+
+        response = client.get(MEASUREMENTS_URL)
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['count'], 1)
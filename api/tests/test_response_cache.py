@@ -0,0 +1,97 @@
+"""
+Tests for the list response cache
+"""
+
+from decimal import Decimal
+from django.contrib.auth.models import User
+from core.models import HydroponicSystem
+from core.models import Measurement
+from ..cache import get_cache
+from ..cache import get_stats
+from django.test import TestCase
+from django.urls import reverse
+from rest_framework.test import APIClient
+
+MEASUREMENTS_URL = reverse('api:measurement-list')
+HYDROPONIC_SYSTEM_URL = reverse('api:hydroponicsystem-list')
+
+
+def create_user(username, password):
+    """Create and return a new user"""
+    return User.objects.create_user(username, password)
+
+
+def create_measurement(hydroponic_system, ph='6'):
+    """Create and return a new measurement"""
+    return Measurement.objects.create(hydroponic_system=hydroponic_system, ph=Decimal(ph),
+                                      temperature=Decimal('20'), tds=Decimal('300'))
+
+
+class ResponseCacheTests(TestCase):
+    """Test caching of list responses"""
+
+    def setUp(self):
+        get_cache().clear()
+        self.client = APIClient()
+        self.user = create_user(username='testuser', password='testpass123')
+        self.client.force_authenticate(self.user)
+        self.system_1 = HydroponicSystem.objects.create(title='System 1', user=self.user, location='London')
+        self.system_2 = HydroponicSystem.objects.create(title='System 2', user=self.user, location='Paris')
+
+    def test_repeated_list_is_cached(self):
+        """Test an identical request with reordered parameters is served from the cache"""
+        create_measurement(self.system_1)
+
+        first = self.client.get(MEASUREMENTS_URL, {'ph_min': 5, 'ph_max': 7})
+        second = self.client.get(f'{MEASUREMENTS_URL}?ph_max=7&ph_min=5&page=1')
+
+        self.assertEqual(first['X-Cache'], 'MISS')
+        self.assertEqual(second['X-Cache'], 'HIT')
+        self.assertEqual(first.data, second.data)
+        self.assertEqual(get_stats()['hits'], 1)
+        self.assertEqual(get_stats()['misses'], 1)
+
+    def test_write_invalidates_list(self):
+        """Test creating a measurement invalidates the cached list"""
+        self.client.get(MEASUREMENTS_URL)
+        create_measurement(self.system_1)
+
+        response = self.client.get(MEASUREMENTS_URL)
+
+        self.assertEqual(response['X-Cache'], 'MISS')
+        self.assertEqual(response.data['count'], 1)
+
+    def test_write_only_invalidates_affected_system(self):
+        """Test a write to one system keeps the cached list of another system"""
+        self.client.get(MEASUREMENTS_URL, {'hydroponic_system': self.system_1.id})
+        self.client.get(MEASUREMENTS_URL, {'hydroponic_system': self.system_2.id})
+        create_measurement(self.system_2)
+
+        response_1 = self.client.get(MEASUREMENTS_URL, {'hydroponic_system': self.system_1.id})
+        response_2 = self.client.get(MEASUREMENTS_URL, {'hydroponic_system': self.system_2.id})
+
+        self.assertEqual(response_1['X-Cache'], 'HIT')
+        self.assertEqual(response_2['X-Cache'], 'MISS')
+        self.assertEqual(response_2.data['count'], 1)
+
+    def test_system_update_invalidates_system_list(self):
+        """Test updating a system invalidates the cached system list"""
+        self.client.get(HYDROPONIC_SYSTEM_URL)
+        self.system_1.title = 'Renamed'
+        self.system_1.save()
+
+        response = self.client.get(HYDROPONIC_SYSTEM_URL)
+
+        self.assertEqual(response['X-Cache'], 'MISS')
+        self.assertIn('Renamed', [system['title'] for system in response.data['results']])
+
+    def test_cache_separated_by_user(self):
+        """Test a cached list is never served to another user"""
+        create_measurement(self.system_1)
+        self.client.get(MEASUREMENTS_URL)
+        self.client.force_authenticate(create_user(username='testuser2', password='testpass123'))
+
+        response = self.client.get(MEASUREMENTS_URL)
+
+        self.assertEqual(response['X-Cache'], 'MISS')
+        self.assertEqual(response.data['count'], 0)
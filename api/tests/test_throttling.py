@@ -0,0 +1,100 @@
+"""
+Tests for the token bucket throttling
+"""
+
+from unittest import mock
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.cache import caches
+from django.test import SimpleTestCase
+from django.test import TestCase
+from django.test import override_settings
+from django.urls import reverse
+from rest_framework import status
+from rest_framework.test import APIClient
+from core.models import HydroponicSystem
+from ..throttling import parse_rate
+
+MEASUREMENTS_URL = reverse('api:measurement-list')
+RATES = {'ingest': '100/min', 'ingest_system': '2/min', 'writes': '100/min', 'reads': '1/min'}
+
+
+class ParseRateTests(SimpleTestCase):
+    """Test reading rates into bucket capacities and refill rates"""
+
+    def test_parse_rate(self):
+        self.assertEqual(parse_rate('120/min'), (120, 2.0))
+        self.assertEqual(parse_rate('10/s'), (10, 10.0))
+        self.assertEqual(parse_rate('36/hour'), (36, 0.01))
+
+
+@override_settings(REST_FRAMEWORK={**settings.REST_FRAMEWORK, 'DEFAULT_THROTTLE_RATES': RATES})
+class ThrottlingApiTests(TestCase):
+    """Test writes and expensive reads are throttled per token and per system"""
+
+    def setUp(self):
+        caches[settings.THROTTLE_CACHE_ALIAS].clear()
+        self.client = APIClient()
+        self.user = User.objects.create_user(username='testuser', password='testpass123')
+        self.client.force_authenticate(self.user)
+        self.system = HydroponicSystem.objects.create(title='System 1', user=self.user, location='London')
+        self.other_system = HydroponicSystem.objects.create(title='System 2', user=self.user, location='Paris')
+        self.now = 1_700_000_000.0
+        patcher = mock.patch('api.throttling.time.time', lambda: self.now)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def post_measurement(self, hydroponic_system):
+        return self.client.post(MEASUREMENTS_URL, {'hydroponic_system': hydroponic_system.id, 'ph': '6.5',
+                                                   'temperature': '20', 'tds': '300'})
+
+    def test_ingest_throttled_per_system(self):
+        """Test a system posting too fast is throttled with Retry-After while other systems are not"""
+        self.assertEqual(self.post_measurement(self.system).status_code, status.HTTP_201_CREATED)
+        self.assertEqual(self.post_measurement(self.system).status_code, status.HTTP_201_CREATED)
+
+        response = self.post_measurement(self.system)
+
+        self.assertEqual(response.status_code, status.HTTP_429_TOO_MANY_REQUESTS)
+        self.assertEqual(response['Retry-After'], '30')
+        self.assertEqual(self.post_measurement(self.other_system).status_code, status.HTTP_201_CREATED)
+
+    def test_bucket_refills(self):
+        """Test tokens come back at the refill rate"""
+        self.post_measurement(self.system)
+        self.post_measurement(self.system)
+
+        self.now += 29
+        self.assertEqual(self.post_measurement(self.system).status_code, status.HTTP_429_TOO_MANY_REQUESTS)
+        self.now += 1
+        self.assertEqual(self.post_measurement(self.system).status_code, status.HTTP_201_CREATED)
+
+    def test_rejected_request_takes_no_tokens(self):
+        """Test a throttled request does not drain the token's bucket"""
+        with override_settings(REST_FRAMEWORK={**settings.REST_FRAMEWORK,
+                                                'DEFAULT_THROTTLE_RATES': {**RATES, 'ingest': '3/min'}}):
+            self.post_measurement(self.system)
+            self.post_measurement(self.system)
+            self.post_measurement(self.system)
+
+            self.assertEqual(self.post_measurement(self.other_system).status_code, status.HTTP_201_CREATED)
+
+    def test_other_users_requests_do_not_drain_bucket(self):
+        """Test requests naming another user's system do not throttle its owner"""
+        other = APIClient()
+        other.force_authenticate(User.objects.create_user(username='other', password='testpass123'))
+        for _ in range(3):
+            other.post(MEASUREMENTS_URL, {'hydroponic_system': self.system.id, 'ph': '6.5', 'temperature': '20',
+                                          'tds': '300'})
+
+        self.assertEqual(self.post_measurement(self.system).status_code, status.HTTP_201_CREATED)
+
+    def test_plain_reads_not_throttled(self):
+        """Test lists are not throttled, downsampled lists are"""
+        for _ in range(3):
+            self.assertEqual(self.client.get(MEASUREMENTS_URL).status_code, status.HTTP_200_OK)
+
+        params = {'hydroponic_system': self.system.id, 'max_points': 10}
+        self.assertEqual(self.client.get(MEASUREMENTS_URL, params).status_code, status.HTTP_200_OK)
+        self.assertEqual(self.client.get(MEASUREMENTS_URL, params).status_code,
+                         status.HTTP_429_TOO_MANY_REQUESTS)
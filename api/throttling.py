@@ -0,0 +1,168 @@
+"""
+Token bucket throttling of writes and expensive reads, per API token and per hydroponic system
+"""
+
+import math
+import threading
+import time
+from collections.abc import Mapping
+from django.conf import settings
+from django.core.cache import caches
+from django.core.cache.backends.redis import RedisCache
+from rest_framework.permissions import SAFE_METHODS
+from rest_framework.settings import api_settings
+from rest_framework.throttling import BaseThrottle
+
+PERIODS = {'s': 1, 'm': 60, 'h': 3600, 'd': 86400}
+
+# Takes a token from every bucket in KEYS, or from none of them when one is empty. ARGV holds the
+# capacity and the refill rate (tokens per second) of each bucket. The clock is the Redis server's,
+# so workers with skewed clocks share the buckets fairly. Returns the seconds until every bucket has
+# a token again, 0 when the tokens were taken, as a string since Redis truncates Lua numbers to integers.
+TAKE_SCRIPT = """
+local time = redis.call('TIME')
+local now = tonumber(time[1]) + tonumber(time[2]) / 1000000
+local wait = 0
+local tokens = {}
+for index, key in ipairs(KEYS) do
+    local capacity = tonumber(ARGV[index * 2 - 1])
+    local rate = tonumber(ARGV[index * 2])
+    local bucket = redis.call('HMGET', key, 'tokens', 'updated')
+    local available = capacity
+    if bucket[1] then
+        available = math.min(capacity, tonumber(bucket[1]) + math.max(0, now - tonumber(bucket[2])) * rate)
+    end
+    if available < 1 then
+        wait = math.max(wait, (1 - available) / rate)
+    end
+    tokens[index] = available
+end
+if wait > 0 then
+    return tostring(wait)
+end
+for index, key in ipairs(KEYS) do
+    local capacity = tonumber(ARGV[index * 2 - 1])
+    local rate = tonumber(ARGV[index * 2])
+    redis.call('HSET', key, 'tokens', tostring(tokens[index] - 1), 'updated', string.format('%.6f', now))
+    redis.call('PEXPIRE', key, math.ceil(capacity / rate * 1000))
+end
+return '0'
+"""
+
+lock = threading.Lock()
+take_script = None
+
+
+def parse_rate(rate):
+    """Return the capacity and the refill rate per second of a rate like '120/min'
+
+    The bucket holds as many tokens as the rate allows per period, so it absorbs a burst of that
+    size and is refilled over one period.
+    """
+    number, period = rate.split('/')
+    return int(number), int(number) / PERIODS[period[0]]
+
+
+def system_id(value):
+    """Return a hydroponic system id given in request data or query parameters, None when it is not one"""
+    value = str(value)
+    return int(value) if value.isdigit() else None
+
+
+def take_tokens(buckets):
+    """Take a token from each (key, capacity, rate) bucket, or from none of them when one is empty
+
+    Returns 0 when the tokens were taken, else the seconds until every bucket has a token again.
+    With Redis this is one atomic script call, other caches read and write the buckets under a
+    process lock, which is exact for the local memory cache.
+    """
+    cache = caches[settings.THROTTLE_CACHE_ALIAS]
+    if isinstance(cache, RedisCache):
+        return take_redis_tokens(cache, buckets)
+
+    now = time.time()
+    with lock:
+        stored = cache.get_many([key for key, _, _ in buckets])
+        tokens = {}
+        wait = 0.0
+        for key, capacity, rate in buckets:
+            available, updated = stored.get(key, (capacity, now))
+            available = min(capacity, available + max(0.0, now - updated) * rate)
+            if available < 1:
+                wait = max(wait, (1 - available) / rate)
+            tokens[key] = available
+        if wait:
+            return wait
+        timeout = math.ceil(max(capacity / rate for _, capacity, rate in buckets))
+        cache.set_many({key: (available - 1, now) for key, available in tokens.items()}, timeout=timeout)
+    return 0.0
+
+
+def take_redis_tokens(cache, buckets):
+    global take_script
+    keys = [cache.make_and_validate_key(key) for key, _, _ in buckets]
+    # Django's Redis cache writes every key to the first server, so the buckets share one client
+    client = cache._cache.get_client(keys[0], write=True)
+    if take_script is None:
+        take_script = client.register_script(TAKE_SCRIPT)
+    arguments = [value for _, capacity, rate in buckets for value in (capacity, rate)]
+    return float(take_script(keys=keys, args=arguments, client=client))
+
+
+class TokenBucketThrottle(BaseThrottle):
+    """Throttle requests of a scope with a bucket per API token and a bucket per hydroponic system
+
+    The view names the scope of a request with get_throttle_scope() and the system it concerns with
+    get_throttle_system(), see ThrottledMixin. DEFAULT_THROTTLE_RATES gives the rate of each token
+    under '<scope>' and of each system under '<scope>_system'. Requests without a scope never touch
+    the cache, the others take their tokens in a single cache round trip.
+    """
+
+    def __init__(self):
+        self.delay = 0.0
+
+    def allow_request(self, request, view):
+        scope = view.get_throttle_scope() if hasattr(view, 'get_throttle_scope') else None
+        if scope is None:
+            return True
+
+        rates = api_settings.DEFAULT_THROTTLE_RATES
+        client = f'user-{request.user.pk}' if request.user.is_authenticated else self.get_ident(request)
+        buckets = []
+        if rates.get(scope):
+            buckets.append((f'throttle:{scope}:{client}', *parse_rate(rates[scope])))
+        hydroponic_system_id = view.get_throttle_system()
+        if hydroponic_system_id is not None and rates.get(f'{scope}_system'):
+            # Keyed by the client too, so requests naming someone else's system cannot drain its bucket
+            buckets.append((f'throttle:{scope}_system:{client}:{hydroponic_system_id}',
+                            *parse_rate(rates[f'{scope}_system'])))
+        if not buckets:
+            return True
+
+        self.delay = take_tokens(buckets)
+        return not self.delay
+
+    def wait(self):
+        return self.delay
+
+
+class ThrottledMixin:
+    """Throttle the writes of a viewset and the actions listed in throttle_scopes
+
+    Writes without an entry in throttle_scopes use the 'writes' scope, reads without one are not throttled.
+    """
+    throttle_scopes = {}
+
+    def get_throttle_scope(self):
+        """Return the throttle scope of the request, None when it is not throttled"""
+        if self.action in self.throttle_scopes:
+            return self.throttle_scopes[self.action]
+        return None if self.request.method in SAFE_METHODS else 'writes'
+
+    def get_throttle_system(self):
+        """Return the id of the hydroponic system named in the request data or query parameters"""
+        if self.request.method in SAFE_METHODS:
+            return system_id(self.request.query_params.get('hydroponic_system', ''))
+        if isinstance(self.request.data, Mapping):
+            return system_id(self.request.data.get('hydroponic_system', ''))
+        return None
@@ -3,10 +3,16 @@ from django.urls import include
 from rest_framework import routers
 from .views import HydroponicSystemViewSet
 from .views import MeasurementViewSet
+from .views import ChangeViewSet
+from .views import JobViewSet
+from .views import RequestProfileViewSet
 
 router = routers.DefaultRouter()
 router.register('systems', HydroponicSystemViewSet)
 router.register('measurements', MeasurementViewSet)
+router.register('changes', ChangeViewSet)
+router.register('jobs', JobViewSet)
+router.register('profiles', RequestProfileViewSet, basename='profile')
 
 app_name = 'api'
 
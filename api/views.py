@@ -2,34 +2,92 @@
 View for HydroponicSystem and Measurement model
 """
 
+from collections.abc import Mapping
+from datetime import timedelta
+from django.conf import settings
+from django.http import FileResponse
+from django.db import DataError
+from django.db import transaction
+from django.db.models import F
+from django.db.models import Max
+from django.db.models import Min
+from django.utils import timezone
+from rest_framework import mixins
 from rest_framework import viewsets
 from rest_framework import permissions
 from rest_framework import authentication
 from rest_framework import status
+from rest_framework.decorators import action
 from rest_framework.response import Response
+from core.analysis import detect_anomalies
+from core.completeness import completeness
+from core.downsampling import downsample
+from core.models import CalibrationCorrection
+from core.models import Change
+from core.models import ChangeFeedPrune
 from core.models import HydroponicSystem
+from core.models import Job
 from core.models import Measurement
+from core.jobs import result_path
+from core.signals import measurements_bulk_updated
+from core.signals import record_measurement_delete
+from core.stats import summarize_measurements
 from .serializers import HydroponicSystemSerializer
 from .serializers import HydroponicSystemDetailSerializer
 from .serializers import MeasurementSerializer
+from .serializers import MeasurementCalibrationSerializer
+from .serializers import CalibrationCorrectionSerializer
+from .serializers import ChangeSerializer
+from .serializers import AnomalyParametersSerializer
+from .serializers import DownsampleParametersSerializer
+from .serializers import MeasurementStatsSerializer
+from .serializers import CompletenessParametersSerializer
+from .serializers import CompletenessSerializer
+from .serializers import JobSerializer
+from .serializers import RequestProfileSerializer
+from .serializers import RequestProfileDetailSerializer
 from .filters import MeasurementFilter
 from .filters import HydroponicSystemFilter
+from .cache import CachedListMixin
+from .replicas import ReadYourWritesMixin
+from .throttling import ThrottledMixin
+from .guards import check_query_cost
+from .guards import guarded_query
+from .throttling import system_id
+from .pagination import ApproximateCountPagination
+from .hotstore import downsample_window
+from .hotstore import get_hot_store
+from .hotstore import query_window
+from .hotstore import window_stats
+from .signals import measurement_changed
+from hydroponic_system.profiling import PROFILE_ID
+from hydroponic_system.profiling import list_profiles
+from hydroponic_system.profiling import profile_path
+from hydroponic_system.profiling import read_profile
 from django_filters.rest_framework import DjangoFilterBackend
+from django_filters.utils import translate_validation
 from rest_framework.filters import OrderingFilter
 
 
-class HydroponicSystemViewSet(viewsets.ModelViewSet):
+class HydroponicSystemViewSet(ThrottledMixin, ReadYourWritesMixin, CachedListMixin, viewsets.ModelViewSet):
     """ViewSet for the HydroponicSystem Model"""
     queryset = HydroponicSystem.objects.all().select_related('user')
     authentication_classes = [authentication.TokenAuthentication]
     permission_classes = [permissions.IsAuthenticated]
     filter_backends = [DjangoFilterBackend, OrderingFilter]
     filterset_class = HydroponicSystemFilter
+    pagination_class = ApproximateCountPagination
     ordering_fields = ['created', 'updated']
+    cache_scope = 'systems'
+    throttle_scopes = {'anomalies': 'reads', 'stats': 'reads', 'completeness': 'reads', 'completeness_all': 'reads'}
 
     def get_queryset(self):
         return self.queryset.filter(user=self.request.user).order_by('-id')
 
+    def get_throttle_system(self):
+        """Requests on a system are throttled per that system"""
+        return system_id(self.kwargs.get('pk', ''))
+
     def get_serializer_class(self):
         if self.action == 'retrieve':
             return HydroponicSystemDetailSerializer
@@ -44,12 +102,98 @@ class HydroponicSystemViewSet(viewsets.ModelViewSet):
         serializer = self.get_serializer(instance)
         data = serializer.data
         if self.action == 'retrieve':
+            hot_store = get_hot_store()
+            latest = hot_store.latest(instance.id, 10) if hot_store else None
+            if latest is not None:
+                data['measurements'] = latest[:]
+                return Response(data, headers={'X-Hot-Store': 'HIT'})
             measurements = Measurement.objects.filter(hydroponic_system=instance).order_by('-timestamp')[:10]
             data['measurements'] = MeasurementSerializer(measurements, many=True).data
         return Response(data)
 
+    def measurement_filterset(self, queryset):
+        """Return the validated measurement filters of the query parameters over a measurement queryset"""
+        filterset = MeasurementFilter(self.request.query_params, queryset=queryset, request=self.request)
+        if not filterset.is_valid():
+            raise translate_validation(filterset.errors)
+        return filterset
+
+    def filter_measurements(self, queryset):
+        """Apply the measurement filters of the query parameters to a measurement queryset"""
+        return self.measurement_filterset(queryset).qs
+
+    @action(detail=True, methods=['get'])
+    def anomalies(self, request, *args, **kwargs):
+        """Flag spikes, implausible rates of change and flatlined sensors in the system's measurements
+
+        Only ranges of at most ANOMALY_REQUEST_MAX_DAYS are analysed in the request, for longer or unbounded
+        ranges the response holds the detect_anomalies job to submit to /jobs/ instead.
+        """
+        instance = self.get_object()
+        parameters = AnomalyParametersSerializer(data=request.query_params)
+        parameters.is_valid(raise_exception=True)
+        filterset = self.measurement_filterset(Measurement.objects.filter(hydroponic_system=instance))
+        start, end = filterset.time_range()
+        now = timezone.now()
+        if start is None or min(end or now, now) - start > timedelta(days=settings.ANOMALY_REQUEST_MAX_DAYS):
+            bounds = {name: value.isoformat() for name, value in (('start', start), ('end', end)) if value is not None}
+            return Response({
+                'detail': f"Ranges without a start or longer than {settings.ANOMALY_REQUEST_MAX_DAYS} days are not "
+                          "analysed in the request, submit the job below with POST /jobs/ instead.",
+                'job': {'kind': Job.DETECT_ANOMALIES,
+                        'parameters': {'hydroponic_system': instance.id, **bounds, **parameters.data}},
+            }, status=status.HTTP_400_BAD_REQUEST)
+        with guarded_query():
+            result = detect_anomalies(filterset.qs, **parameters.validated_data)
+        return Response({'hydroponic_system': instance.id, **result})
+
+    @action(detail=True, methods=['get'])
+    def stats(self, request, *args, **kwargs):
+        """Count, time range and minimum, maximum and average of each field of the system's measurements"""
+        instance = self.get_object()
+        hot = query_window(request, instance.id)
+        if hot is not None:
+            stats = window_stats(*hot)
+        else:
+            with guarded_query():
+                stats = summarize_measurements(
+                    self.filter_measurements(Measurement.objects.filter(hydroponic_system=instance)))
+        response = Response(MeasurementStatsSerializer({'hydroponic_system': instance.id, **stats}).data)
+        if hot is not None:
+            response['X-Hot-Store'] = 'HIT'
+        return response
+
+    def completeness_reports(self, hydroponic_system_ids):
+        """Return the completeness reports of the systems for the date range of the query parameters"""
+        parameters = CompletenessParametersSerializer(data=self.request.query_params)
+        parameters.is_valid(raise_exception=True)
+        min_gap = timedelta(seconds=parameters.validated_data['min_gap'])
+        date_filters = {name: value for name, value in self.request.query_params.items()
+                        if name.startswith(('start_date_', 'end_date_'))}
+        filterset = MeasurementFilter(date_filters, request=self.request,
+                                      queryset=Measurement.objects.filter(hydroponic_system__in=hydroponic_system_ids))
+        if not filterset.is_valid():
+            raise translate_validation(filterset.errors)
+        start, end = filterset.time_range()
+        # A range ending today runs until the end of the day, readings cannot be missing from the future
+        end = min(end, timezone.now()) if end is not None else None
+        with guarded_query():
+            return completeness(filterset.qs, hydroponic_system_ids, min_gap, start, end)
 
-class MeasurementViewSet(viewsets.ModelViewSet):
+    @action(detail=True, methods=['get'])
+    def completeness(self, request, *args, **kwargs):
+        """Gaps longer than min_gap seconds, uptime and readings per hour of the system's measurements"""
+        instance = self.get_object()
+        return Response(CompletenessSerializer(self.completeness_reports([instance.id])[0]).data)
+
+    @action(detail=False, methods=['get'], url_path='completeness', url_name='completeness-all')
+    def completeness_all(self, request, *args, **kwargs):
+        """Completeness reports of all of the user's systems from a single query"""
+        hydroponic_system_ids = list(self.get_queryset().order_by('id').values_list('id', flat=True))
+        return Response(CompletenessSerializer(self.completeness_reports(hydroponic_system_ids), many=True).data)
+
+
+class MeasurementViewSet(ThrottledMixin, ReadYourWritesMixin, CachedListMixin, viewsets.ModelViewSet):
     """ViewSet for the Measurement Model"""
     queryset = Measurement.objects.all().select_related('hydroponic_system', 'hydroponic_system__user')
     serializer_class = MeasurementSerializer
@@ -57,11 +201,74 @@ class MeasurementViewSet(viewsets.ModelViewSet):
     permission_classes = [permissions.IsAuthenticated]
     filter_backends = [DjangoFilterBackend, OrderingFilter]
     filterset_class = MeasurementFilter
+    pagination_class = ApproximateCountPagination
     ordering_fields = ['timestamp', 'ph', 'temperature', 'tds']
+    cache_scope = 'measurements'
+    throttle_scopes = {'create': 'ingest'}
+    unpinned_actions = ('create',)
 
     def get_queryset(self):
         return self.queryset.filter(hydroponic_system__user=self.request.user).order_by('-id')
 
+    def get_cache_scope(self):
+        """Lists of a single system only depend on that system's data version"""
+        hydroponic_system_id = self.request.query_params.get('hydroponic_system', '')
+        if hydroponic_system_id.isdigit():
+            return 'system', int(hydroponic_system_id)
+        return super().get_cache_scope()
+
+    def get_throttle_scope(self):
+        """Downsampled lists scan the whole range of a system, they are throttled like the other expensive reads"""
+        if self.action == 'list' and 'max_points' in self.request.query_params:
+            return 'reads'
+        return super().get_throttle_scope()
+
+    def list(self, request, *args, **kwargs):
+        """Handle GET request, downsampled for charts when max_points is given"""
+        if 'max_points' in request.query_params:
+            return self.downsampled_list(request)
+        hot = query_window(request)
+        if hot is not None:
+            return self.hot_list(request, *hot)
+        with guarded_query():
+            return super().list(request, *args, **kwargs)
+
+    def filter_queryset(self, queryset):
+        """Lists ordered or filtered by ph, temperature or tds must be narrow enough, see api/guards.py"""
+        queryset = super().filter_queryset(queryset)
+        if self.action == 'list':
+            ordering = () if 'max_points' in self.request.query_params else queryset.query.order_by
+            check_query_cost(self.request, ordering)
+        return queryset
+
+    def hot_list(self, request, window, mask):
+        """Return a page of the measurements of the hot window store, without SQL"""
+        ordering = OrderingFilter().get_ordering(request, self.get_queryset(), self) or ['-id']
+        readings = window.select(mask, ordering)
+        page = self.paginate_queryset(readings)
+        response = self.get_paginated_response(page) if page is not None else Response(readings[:])
+        response['X-Hot-Store'] = 'HIT'
+        return response
+
+    def downsampled_list(self, request):
+        """Return at most max_points measurements of one system that preserve the shape of the series"""
+        parameters = DownsampleParametersSerializer(data=request.query_params)
+        parameters.is_valid(raise_exception=True)
+        max_points = parameters.validated_data['max_points']
+        field = parameters.validated_data['downsample_field']
+
+        hot = query_window(request)
+        if hot is not None:
+            readings, count = downsample_window(*hot, max_points, field)
+            return Response({'count': count, 'max_points': max_points, 'field': field, 'results': readings[:]},
+                            headers={'X-Hot-Store': 'HIT'})
+
+        with guarded_query():
+            measurement_ids, count = downsample(self.filter_queryset(self.get_queryset()), max_points, field)
+            measurements = Measurement.objects.filter(id__in=measurement_ids).order_by('timestamp', 'id')
+            return Response({'count': count, 'max_points': max_points, 'field': field,
+                             'results': self.get_serializer(measurements, many=True).data})
+
     def create(self, request, *args, **kwargs):
         """Handle POST request"""
         serializer = self.get_serializer(data=request.data)
@@ -85,3 +292,176 @@ class MeasurementViewSet(viewsets.ModelViewSet):
             return Response({"detail": "You cannot change the hydroponic system of this measurement."},
                             status=status.HTTP_400_BAD_REQUEST)
         return super().update(request, *args, **kwargs)
+
+    def perform_destroy(self, instance):
+        """Delete the measurement, record it in the change feed and invalidate the cached lists"""
+        with transaction.atomic():
+            record_measurement_delete(instance)
+            instance.delete()
+            measurement_changed(instance)
+
+    @action(detail=False, methods=['post'], serializer_class=MeasurementCalibrationSerializer)
+    def calibrate(self, request, *args, **kwargs):
+        """Apply value * scale + offset to every filtered measurement of one system in a single UPDATE"""
+        serializer = self.get_serializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        hydroponic_system = serializer.validated_data['hydroponic_system']
+        field = serializer.validated_data['field']
+        scale = serializer.validated_data['scale']
+        offset = serializer.validated_data['offset']
+
+        if hydroponic_system.user != self.request.user:
+            return Response({"detail": "You do not have permission to calibrate measurements of this system."},
+                            status=status.HTTP_403_FORBIDDEN)
+
+        queryset = self.filter_queryset(Measurement.objects.filter(hydroponic_system=hydroponic_system)).order_by()
+        model_field = Measurement._meta.get_field(field)
+        limit = 10 ** (model_field.max_digits - model_field.decimal_places)
+        out_of_range = Response({"detail": f"The correction would move {field} readings out of range (+/-{limit})."},
+                                status=status.HTTP_400_BAD_REQUEST)
+
+        with transaction.atomic():
+            # Lock the rows in the database first, only their highest id comes back. Readings added later are
+            # left alone and the locked ones cannot change between the range check and the UPDATE.
+            last = (Measurement.objects.filter(id__in=queryset.select_for_update().values('id'))
+                    .aggregate(last=Max('id'))['last'])
+            queryset = queryset.filter(id__lte=last or 0)
+            bounds = queryset.aggregate(low=Min(field), high=Max(field))
+            if bounds['low'] is not None and not (-limit < bounds['low'] * scale + offset and
+                                                  bounds['high'] * scale + offset < limit):
+                return out_of_range
+            try:
+                with transaction.atomic():
+                    affected = queryset.update(**{field: F(field) * scale + offset})
+            except DataError:
+                # A reading that entered the filtered range after the lock overflowed the column
+                return out_of_range
+            correction = CalibrationCorrection.objects.create(
+                hydroponic_system=hydroponic_system,
+                user=self.request.user,
+                field=field,
+                scale=scale,
+                offset=offset,
+                filters={key: value for key, value in request.query_params.items() if key not in ('page', 'ordering')},
+                affected=affected,
+            )
+            measurements_bulk_updated.send(sender=Measurement, hydroponic_system=hydroponic_system,
+                                           correction=correction)
+
+        return Response(CalibrationCorrectionSerializer(correction).data, status=status.HTTP_200_OK)
+
+
+class ChangeViewSet(ReadYourWritesMixin, mixins.ListModelMixin, viewsets.GenericViewSet):
+    """Incremental change feed of the user's hydroponic systems and measurements"""
+    queryset = Change.objects.all()
+    serializer_class = ChangeSerializer
+    authentication_classes = [authentication.TokenAuthentication]
+    permission_classes = [permissions.IsAuthenticated]
+    pagination_class = None
+
+    def get_queryset(self):
+        return self.queryset.filter(user=self.request.user).select_related('correction').order_by('id')
+
+    def list(self, request, *args, **kwargs):
+        """Return the settled changes after the `since` cursor, or only the current cursor when `since` is omitted"""
+        settled = timezone.now() - timedelta(seconds=settings.CHANGE_FEED_SETTLE_SECONDS)
+        queryset = self.get_queryset().filter(timestamp__lte=settled)
+        if 'since' not in request.query_params:
+            return Response({'cursor': queryset.values_list('id', flat=True).last() or 0, 'has_more': False,
+                             'results': []})
+        try:
+            since = int(request.query_params['since'])
+        except ValueError:
+            return Response({"detail": "The since cursor must be an integer."}, status=status.HTTP_400_BAD_REQUEST)
+        horizon = ChangeFeedPrune.objects.aggregate(horizon=Max('pruned_through'))['horizon']
+        if horizon is not None and since < horizon:
+            return Response({"detail": "The since cursor has expired, the changes after it were pruned. Take a new "
+                                       "cursor without since and download the data again."},
+                            status=status.HTTP_410_GONE)
+
+        limit = settings.CHANGE_FEED_PAGE_SIZE
+        changes = list(queryset.filter(id__gt=since)[:limit + 1])
+        has_more = len(changes) > limit
+        changes = changes[:limit]
+        cursor = changes[-1].id if changes else since
+        return Response({'cursor': cursor, 'has_more': has_more,
+                         'results': self.get_serializer(changes, many=True).data})
+
+
+class JobViewSet(ThrottledMixin, mixins.CreateModelMixin, mixins.RetrieveModelMixin, mixins.ListModelMixin,
+                 viewsets.GenericViewSet):
+    """Submit background jobs, poll their status and progress and download their results
+
+    Creating a job only queues it, the run_jobs worker command does the work.
+    """
+    queryset = Job.objects.all()
+    serializer_class = JobSerializer
+    authentication_classes = [authentication.TokenAuthentication]
+    permission_classes = [permissions.IsAuthenticated]
+    throttle_scopes = {'create': 'jobs'}
+
+    def get_queryset(self):
+        return self.queryset.filter(user=self.request.user).order_by('-id')
+
+    def get_throttle_system(self):
+        """Jobs are throttled per system they run on"""
+        parameters = self.request.data.get('parameters') if isinstance(self.request.data, Mapping) else None
+        return system_id(parameters.get('hydroponic_system', '')) if isinstance(parameters, Mapping) else None
+
+    def create(self, request, *args, **kwargs):
+        """Handle POST request"""
+        serializer = self.get_serializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+
+        hydroponic_system_id = serializer.validated_data['parameters']['hydroponic_system']
+        hydroponic_system = HydroponicSystem.objects.get(id=hydroponic_system_id)
+        if hydroponic_system.user != self.request.user:
+            return Response({"detail": "You do not have permission to run jobs on this system."},
+                            status=status.HTTP_403_FORBIDDEN)
+        serializer.save(user=self.request.user)
+        headers = self.get_success_headers(serializer.data)
+        return Response(serializer.data, status=status.HTTP_202_ACCEPTED, headers=headers)
+
+    @action(detail=True, methods=['get'])
+    def download(self, request, *args, **kwargs):
+        """Download the result file of a finished job"""
+        job = self.get_object()
+        if job.status != Job.SUCCEEDED or not job.result_file:
+            return Response({"detail": "This job has no result file to download."}, status=status.HTTP_404_NOT_FOUND)
+        path = result_path(job)
+        if not path.exists():
+            return Response({"detail": "The result file of this job has been removed."}, status=status.HTTP_410_GONE)
+        return FileResponse(open(path, 'rb'), as_attachment=True, filename=job.result_file)
+
+
+class RequestProfileViewSet(viewsets.GenericViewSet):
+    """Profiles of single requests captured by the profiling middleware, for admins only"""
+    serializer_class = RequestProfileSerializer
+    authentication_classes = [authentication.TokenAuthentication]
+    permission_classes = [permissions.IsAdminUser]
+    pagination_class = None
+    lookup_value_regex = PROFILE_ID.pattern.strip('^$')
+
+    def get_serializer_class(self):
+        if self.action == 'retrieve':
+            return RequestProfileDetailSerializer
+        return RequestProfileSerializer
+
+    def list(self, request, *args, **kwargs):
+        """List the stored profiles, newest first"""
+        return Response(self.get_serializer(list_profiles(), many=True).data)
+
+    def retrieve(self, request, pk=None):
+        """Return a profile with the timings of its SQL queries and its slowest functions"""
+        profile = read_profile(pk)
+        if profile is None:
+            return Response({"detail": "No such profile."}, status=status.HTTP_404_NOT_FOUND)
+        return Response(self.get_serializer(profile).data)
+
+    @action(detail=True, methods=['get'])
+    def download(self, request, pk=None):
+        """Download the cProfile statistics of a profile"""
+        path = profile_path(pk, '.prof')
+        if path is None or not path.exists():
+            return Response({"detail": "No such profile."}, status=status.HTTP_404_NOT_FOUND)
+        return FileResponse(open(path, 'rb'), as_attachment=True, filename=path.name)
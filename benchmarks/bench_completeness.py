@@ -0,0 +1,112 @@
+"""
+Benchmark the completeness report: the LAG window query against reading every timestamp into Python
+
+Creates a benchmark user with --systems systems of --readings one-minute readings with random outages
+when missing. Requires a migrated database reachable with the usual POSTGRES_* environment variables:
+
+    python benchmarks/bench_completeness.py --systems 10 --readings 50000
+"""
+
+import argparse
+import os
+import random
+import statistics
+import sys
+import time
+from datetime import timedelta
+from decimal import Decimal
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'hydroponic_system.settings')
+
+
+def create_readings(hydroponic_system, number, generator):
+    """Create one reading a minute up to now, leaving out a few outages of up to a day"""
+    from django.utils import timezone
+    from core.models import Measurement
+
+    skipped = set()
+    for _ in range(number // 5000):
+        start = generator.randrange(number)
+        skipped.update(range(start, start + generator.randrange(30, 1440)))
+    now = timezone.now()
+    minutes = [minute for minute in range(number) if minute not in skipped]
+    measurements = [Measurement(hydroponic_system=hydroponic_system, ph=Decimal('6.50'), temperature=Decimal('20'),
+                                tds=Decimal('300')) for _ in minutes]
+    Measurement.objects.bulk_create(measurements, batch_size=5000)
+    for minute, measurement in zip(minutes, measurements):
+        measurement.timestamp = now - timedelta(minutes=number - minute)
+    Measurement.objects.bulk_update(measurements, ['timestamp'], batch_size=5000)
+
+
+def python_gaps(hydroponic_system_ids, min_gap):
+    """Gaps of each system found by streaming every timestamp to Python, as an export would"""
+    from core.models import Measurement
+
+    gaps = {}
+    for hydroponic_system_id in hydroponic_system_ids:
+        timestamps = (Measurement.objects.filter(hydroponic_system_id=hydroponic_system_id).order_by('timestamp')
+                      .values_list('timestamp', flat=True).iterator(chunk_size=5000))
+        previous = None
+        gaps[hydroponic_system_id] = []
+        for timestamp in timestamps:
+            if previous is not None and timestamp - previous > min_gap:
+                gaps[hydroponic_system_id].append((previous, timestamp))
+            previous = timestamp
+    return gaps
+
+
+def timed(function, repeat):
+    """Return the result and the median duration in milliseconds of repeated calls"""
+    durations = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = function()
+        durations.append((time.perf_counter() - start) * 1000)
+    return result, statistics.median(durations)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--systems', type=int, default=10)
+    parser.add_argument('--readings', type=int, default=50000)
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args()
+
+    import django
+    django.setup()
+    from django.contrib.auth.models import User
+    from core.completeness import completeness
+    from core.completeness import find_gaps
+    from core.models import HydroponicSystem
+    from core.models import Measurement
+
+    generator = random.Random(41)
+    user, _ = User.objects.get_or_create(username='benchmark-completeness')
+    hydroponic_system_ids = []
+    for number in range(args.systems):
+        hydroponic_system, _ = HydroponicSystem.objects.get_or_create(user=user, title=f'Completeness {number}')
+        if not hydroponic_system.measurements.exists():
+            create_readings(hydroponic_system, args.readings, generator)
+        hydroponic_system_ids.append(hydroponic_system.id)
+
+    min_gap = timedelta(minutes=15)
+    readings = Measurement.objects.filter(hydroponic_system__in=hydroponic_system_ids)
+    expected, python_ms = timed(lambda: python_gaps(hydroponic_system_ids, min_gap), args.repeat)
+    found, batch_ms = timed(lambda: find_gaps(readings, min_gap), args.repeat)
+    assert {key: value['gaps'] for key, value in found.items()} == expected
+    _, single_ms = timed(lambda: [completeness(readings.filter(hydroponic_system_id=hydroponic_system_id),
+                                               [hydroponic_system_id], min_gap)
+                                  for hydroponic_system_id in hydroponic_system_ids], args.repeat)
+
+    total = readings.count()
+    gaps = sum(len(value) for value in expected.values())
+    print(f'{args.systems} systems, {total} readings, {gaps} gaps over {min_gap}')
+    print(f"{'timestamps to Python':<28}{python_ms:>10.1f} ms")
+    print(f"{'window query per system':<28}{single_ms:>10.1f} ms")
+    print(f"{'window query, all systems':<28}{batch_ms:>10.1f} ms")
+
+
+if __name__ == '__main__':
+    main()
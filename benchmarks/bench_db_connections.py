@@ -0,0 +1,76 @@
+"""
+Benchmark request latency with and without persistent or pooled database connections
+
+Every mode runs in its own process, because the database settings are read at startup.
+Requires a migrated database reachable with the usual POSTGRES_* environment variables:
+
+    python benchmarks/bench_db_connections.py --requests 500
+"""
+
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'hydroponic_system.settings')
+
+MODES = {
+    'new connection per request': {'DB_CONN_MAX_AGE': '0'},
+    'persistent connections': {'DB_CONN_MAX_AGE': '60'},
+    'psycopg connection pool': {'DB_POOL_MAX_SIZE': '4', 'DB_POOL_MIN_SIZE': '1'},
+}
+
+
+def run_requests(number):
+    """Send authenticated list requests through the full Django request cycle and return the latencies"""
+    import django
+    django.setup()
+    from django.conf import settings
+    from django.contrib.auth.models import User
+    from django.test import Client
+    from rest_framework.authtoken.models import Token
+
+    settings.RESPONSE_CACHE_ENABLED = False
+    user, _ = User.objects.get_or_create(username='benchmark')
+    token, _ = Token.objects.get_or_create(user=user)
+    client = Client(HTTP_HOST='localhost', HTTP_AUTHORIZATION=f'Token {token.key}')
+
+    client.get('/systems/')
+    latencies = []
+    for _ in range(number):
+        start = time.perf_counter()
+        response = client.get('/systems/')
+        latencies.append(time.perf_counter() - start)
+        assert response.status_code == 200, response.status_code
+    return latencies
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--requests', type=int, default=500)
+    parser.add_argument('--worker', action='store_true', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.worker:
+        latencies = run_requests(args.requests)
+        print(' '.join(f'{latency:.6f}' for latency in latencies))
+        return
+
+    print(f"{'mode':<30}{'mean ms':>10}{'p50 ms':>10}{'p95 ms':>10}{'req/s':>10}")
+    for mode, environment in MODES.items():
+        env = {key: value for key, value in os.environ.items() if not key.startswith('DB_')}
+        env.update(environment)
+        output = subprocess.run([sys.executable, __file__, '--worker', '--requests', str(args.requests)],
+                                env=env, capture_output=True, text=True, check=True).stdout
+        latencies = sorted(float(latency) * 1000 for latency in output.split())
+        mean = statistics.fmean(latencies)
+        print(f'{mode:<30}{mean:>10.2f}{statistics.median(latencies):>10.2f}'
+              f'{latencies[int(len(latencies) * 0.95)]:>10.2f}{1000 / mean:>10.0f}')
+
+
+if __name__ == '__main__':
+    main()
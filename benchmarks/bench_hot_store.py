@@ -0,0 +1,141 @@
+"""
+Benchmark recent window queries answered by the hot store against the database path
+
+Creates a benchmark user with one system and --readings measurements over the last day when missing.
+The "after insert elsewhere" rows insert a reading like another worker before every request, which the
+store catches up with (hot store) or, when the system's readings were also rewritten, reloads (reload).
+Requires a migrated database reachable with the usual POSTGRES_* environment variables:
+
+    python benchmarks/bench_hot_store.py --readings 20000 --requests 200
+"""
+
+import argparse
+import os
+import statistics
+import sys
+import time
+from datetime import timedelta
+from decimal import Decimal
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'hydroponic_system.settings')
+
+
+def create_readings(hydroponic_system, number):
+    """Create readings evenly spread over the last day"""
+    from django.utils import timezone
+    from core.models import Measurement
+
+    now = timezone.now()
+    step = timedelta(days=1) / number
+    measurements = [Measurement(hydroponic_system=hydroponic_system, ph=Decimal(600 + index % 150) / 100,
+                                temperature=Decimal(2000 + index % 300) / 100, tds=Decimal(300 + index % 50))
+                    for index in range(number)]
+    Measurement.objects.bulk_create(measurements, batch_size=5000)
+    for index, measurement in enumerate(measurements):
+        measurement.timestamp = now - step * (number - index)
+    Measurement.objects.bulk_update(measurements, ['timestamp'], batch_size=1000)
+
+
+def measure(client, url, params, number):
+    """Return the latencies in milliseconds of repeated requests"""
+    latencies = []
+    for _ in range(number):
+        start = time.perf_counter()
+        response = client.get(url, params)
+        latencies.append((time.perf_counter() - start) * 1000)
+        assert response.status_code == 200, response.status_code
+    return sorted(latencies)
+
+
+def measure_after_write(client, url, params, number, write):
+    """Return the latencies in milliseconds of requests each following a write, the write is not timed"""
+    latencies = []
+    for _ in range(number):
+        write()
+        start = time.perf_counter()
+        response = client.get(url, params)
+        latencies.append((time.perf_counter() - start) * 1000)
+        assert response.status_code == 200, response.status_code
+    return sorted(latencies)
+
+
+def report(name, path, latencies):
+    mean = statistics.fmean(latencies)
+    print(f'{name:<22}{path:<10}{mean:>10.2f}{statistics.median(latencies):>10.2f}'
+          f'{latencies[int(len(latencies) * 0.95)]:>10.2f}{1000 / mean:>10.0f}')
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--readings', type=int, default=20000)
+    parser.add_argument('--requests', type=int, default=200)
+    args = parser.parse_args()
+
+    import django
+    django.setup()
+    from django.conf import settings
+    from django.contrib.auth.models import User
+    from django.test import Client
+    from django.utils import timezone
+    from rest_framework.authtoken.models import Token
+    from rest_framework.settings import api_settings
+    from core.models import HydroponicSystem
+    from core.models import Measurement
+    from api.cache import bump_data_versions
+    from api.hotstore import store
+
+    settings.RESPONSE_CACHE_ENABLED = False
+    settings.REST_FRAMEWORK = {**settings.REST_FRAMEWORK, 'DEFAULT_THROTTLE_RATES': {}}
+    api_settings.reload()
+    user, _ = User.objects.get_or_create(username='benchmark')
+    token, _ = Token.objects.get_or_create(user=user)
+    hydroponic_system, _ = HydroponicSystem.objects.get_or_create(user=user, title='Hot store benchmark')
+    if hydroponic_system.measurements.count() != args.readings:
+        hydroponic_system.measurements.all().delete()
+        create_readings(hydroponic_system, args.readings)
+
+    client = Client(HTTP_HOST='localhost', HTTP_AUTHORIZATION=f'Token {token.key}')
+    since = {'hydroponic_system': hydroponic_system.id,
+             'start_date_after': (timezone.now() - timedelta(days=1)).date()}
+    queries = {
+        'list page': ('/measurements/', since),
+        'list ordered by ph': ('/measurements/', {**since, 'ordering': '-ph'}),
+        'stats': (f'/systems/{hydroponic_system.id}/stats/', since),
+        'chart 500 points': ('/measurements/', {**since, 'max_points': 500}),
+    }
+
+    print(f"{'query':<22}{'path':<10}{'mean ms':>10}{'p50 ms':>10}{'p95 ms':>10}{'req/s':>10}")
+    for name, (url, params) in queries.items():
+        for path, enabled in (('database', False), ('hot store', True)):
+            settings.HOT_STORE_ENABLED = enabled
+            client.get(url, params)
+            report(name, path, measure(client, url, params, args.requests))
+
+    inserted = []
+
+    def insert_elsewhere(*scopes):
+        # Inserted without the post_save receivers, so only the shared versions tell this store about it
+        inserted.extend(Measurement.objects.bulk_create([Measurement(
+            hydroponic_system=hydroponic_system, ph=Decimal('6.50'), temperature=Decimal('21.00'), tds=Decimal(310))]))
+        bump_data_versions(('system', hydroponic_system.id), *scopes)
+
+    writes = {
+        'database': (False, insert_elsewhere),
+        'hot store': (True, insert_elsewhere),
+        'reload': (True, lambda: insert_elsewhere(('rewrites', hydroponic_system.id))),
+    }
+    for path, (enabled, write) in writes.items():
+        settings.HOT_STORE_ENABLED = enabled
+        client.get('/measurements/', since)
+        report('list after insert', path, measure_after_write(client, '/measurements/', since, args.requests, write))
+    Measurement.objects.filter(id__in=[measurement.id for measurement in inserted]).delete()
+
+    stats = store.stats()
+    print(f"\nhot store: {stats['readings']} readings of {stats['systems']} systems in {stats['bytes']} bytes "
+          f"({stats['bytes'] / max(stats['readings'], 1):.1f} bytes per reading, capacity {stats['capacity']})")
+
+
+if __name__ == '__main__':
+    main()
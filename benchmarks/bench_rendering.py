@@ -0,0 +1,78 @@
+"""
+Benchmark rendering and compressing large measurement pages, JSONRenderer against ORJSONRenderer
+
+Serializes unsaved measurements, so no database is needed:
+
+    python benchmarks/bench_rendering.py --rows 1000 10000 --repeat 20
+"""
+
+import argparse
+import gzip
+import os
+import statistics
+import sys
+import time
+from datetime import timedelta
+from decimal import Decimal
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'hydroponic_system.settings')
+
+
+def build_page(rows):
+    """Return a paginated response body of serialized measurements"""
+    from django.utils import timezone
+    from api.serializers import MeasurementSerializer
+    from core.models import Measurement
+
+    now = timezone.now()
+    measurements = [Measurement(id=index + 1, hydroponic_system_id=1, timestamp=now - timedelta(seconds=index * 60),
+                                ph=Decimal(600 + index % 150) / 100, temperature=Decimal(2000 + index % 300) / 100,
+                                tds=Decimal(300 + index % 50)) for index in range(rows)]
+    return {'count': rows, 'next': 'http://testserver/api/measurements/?page=2', 'previous': None,
+            'results': MeasurementSerializer(measurements, many=True).data}
+
+
+def timed(function, repeat):
+    """Return the result and the median duration in milliseconds of repeated calls"""
+    durations = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = function()
+        durations.append((time.perf_counter() - start) * 1000)
+    return result, statistics.median(durations)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--rows', type=int, nargs='+', default=[1000, 10000])
+    parser.add_argument('--repeat', type=int, default=20)
+    args = parser.parse_args()
+
+    import django
+    django.setup()
+    from django.conf import settings
+    from rest_framework.renderers import JSONRenderer
+    from api.renderers import ORJSONRenderer
+    from hydroponic_system import compression
+
+    for rows in args.rows:
+        page = build_page(rows)
+        print(f'{rows} measurements')
+        for renderer in (JSONRenderer(), ORJSONRenderer()):
+            body, duration = timed(lambda: renderer.render(page), args.repeat)
+            print(f'  {type(renderer).__name__:<16} {duration:8.2f} ms  {rows / duration * 1000:>10.0f} rows/s'
+                  f'  {len(body) / duration / 1000:7.1f} MB/s  {len(body):>9} bytes')
+        codings = [('gzip', settings.COMPRESSION_GZIP_LEVEL)]
+        if compression.brotli is not None:
+            codings.append(('br', settings.COMPRESSION_BROTLI_QUALITY))
+        for coding, level in codings:
+            compressed, duration = timed(lambda: compression.compress(body, coding), args.repeat)
+            print(f'  {coding:<4} level {level:<9} {duration:8.2f} ms  {len(compressed):>9} bytes'
+                  f'  {len(compressed) / len(body):6.1%} of the body')
+        assert gzip.decompress(compression.compress(body, 'gzip')) == body
+
+
+if __name__ == '__main__':
+    main()
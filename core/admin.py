@@ -1,5 +1,9 @@
 from django.contrib import admin
-from core.models import HydroponicSystem, Measurement
+from core.models import HydroponicSystem, Measurement, CalibrationCorrection, Change, ChangeFeedPrune, Job
 
 admin.site.register(HydroponicSystem)
 admin.site.register(Measurement)
+admin.site.register(CalibrationCorrection)
+admin.site.register(Change)
+admin.site.register(ChangeFeedPrune)
+admin.site.register(Job)
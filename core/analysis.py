@@ -0,0 +1,113 @@
+"""
+Vectorized anomaly detection over measurement history
+"""
+
+from datetime import datetime
+from datetime import timedelta
+from datetime import timezone
+from itertools import islice
+import numpy as np
+from .models import Measurement
+
+FIELDS = ('ph', 'temperature', 'tds')
+CHUNK_SIZE = 10000
+
+DEFAULT_WINDOW = 60
+DEFAULT_Z_THRESHOLD = 4.0
+DEFAULT_FLATLINE_POINTS = 30
+# Largest plausible change per hour of each field
+DEFAULT_MAX_RATES = {'ph': 2.0, 'temperature': 10.0, 'tds': 500.0}
+
+
+def load_readings(queryset, chunk_size=CHUNK_SIZE):
+    """Load a measurement queryset ordered by time into arrays of epoch seconds and FIELDS values"""
+    rows = queryset.order_by('timestamp').values_list('timestamp', *FIELDS).iterator(chunk_size=chunk_size)
+    timestamps = []
+    values = []
+    while chunk := list(islice(rows, chunk_size)):
+        timestamps.append(np.fromiter((row[0].timestamp() for row in chunk), dtype=np.float64, count=len(chunk)))
+        values.append(np.array([row[1:] for row in chunk], dtype=np.float64))
+    if not timestamps:
+        return np.empty(0, dtype=np.float64), np.empty((0, len(FIELDS)), dtype=np.float64)
+    return np.concatenate(timestamps), np.concatenate(values)
+
+
+def intervals(mask):
+    """Return the start (inclusive) and end (exclusive) indexes of the runs of True in a boolean array"""
+    edges = np.flatnonzero(np.diff(np.concatenate(([False], mask, [False])).astype(np.int8)))
+    return edges[0::2], edges[1::2]
+
+
+def rolling_zscores(series, window):
+    """Z-score of every reading against the mean and deviation of the `window` readings before it"""
+    scores = np.zeros(len(series))
+    if len(series) <= window:
+        return scores
+    centered = series - series.mean()
+    sums = np.concatenate(([0.0], np.cumsum(centered)))
+    squares = np.concatenate(([0.0], np.cumsum(centered ** 2)))
+    mean = (sums[window:-1] - sums[:-window - 1]) / window
+    variance = (squares[window:-1] - squares[:-window - 1]) / window - mean ** 2
+    deviation = np.sqrt(np.clip(variance, 0, None))
+    np.divide(centered[window:] - mean, deviation, out=scores[window:], where=deviation > 1e-9)
+    return scores
+
+
+def find_spikes(series, window, z_threshold):
+    """Runs of readings that deviate more than z_threshold from their trailing window"""
+    scores = np.abs(rolling_zscores(series, window))
+    starts, ends = intervals(scores > z_threshold)
+    return [(start, end - 1, float(scores[start:end].max())) for start, end in zip(starts, ends)]
+
+
+def find_rate_changes(timestamps, series, max_rate):
+    """Runs of consecutive readings that change faster than max_rate per hour"""
+    elapsed = np.diff(timestamps)
+    rates = np.zeros(len(elapsed))
+    np.divide(np.abs(np.diff(series)) * 3600, elapsed, out=rates, where=elapsed > 0)
+    starts, ends = intervals(rates > max_rate)
+    return [(start, end, float(rates[start:end].max())) for start, end in zip(starts, ends)]
+
+
+def find_flatlines(series, min_points):
+    """Runs of at least min_points identical consecutive readings"""
+    starts, ends = intervals(np.diff(series) == 0)
+    return [(start, end, float(end - start + 1)) for start, end in zip(starts, ends) if end - start + 1 >= min_points]
+
+
+def to_datetime(timestamp):
+    return datetime.fromtimestamp(timestamp, tz=timezone.utc)
+
+
+def detect_anomalies(queryset, window=DEFAULT_WINDOW, z_threshold=DEFAULT_Z_THRESHOLD,
+                     flatline_points=DEFAULT_FLATLINE_POINTS, max_rates=None):
+    """Flag spikes, implausible rates of change and flatlined sensors in a measurement queryset"""
+    max_rates = {**DEFAULT_MAX_RATES, **(max_rates or {})}
+    timestamps, values = load_readings(queryset)
+    anomalies = []
+    for column, field in enumerate(FIELDS):
+        series = values[:, column]
+        found = [
+            ('spike', find_spikes(series, window, z_threshold)),
+            ('rate', find_rate_changes(timestamps, series, max_rates[field])),
+            ('flatline', find_flatlines(series, flatline_points)),
+        ]
+        for kind, runs in found:
+            anomalies += [{
+                'field': field,
+                'kind': kind,
+                'start': to_datetime(timestamps[start]),
+                'end': to_datetime(timestamps[end]),
+                'points': int(end - start + 1),
+                'score': round(score, 3),
+            } for start, end, score in runs]
+    anomalies.sort(key=lambda anomaly: (anomaly['start'], anomaly['field'], anomaly['kind']))
+    return {'readings': len(timestamps), 'anomalies': anomalies}
+
+
+def analyse_system(hydroponic_system_id, hours=None, **options):
+    """Detect the anomalies of one system, optionally limited to the last hours, in a worker process"""
+    queryset = Measurement.objects.filter(hydroponic_system_id=hydroponic_system_id)
+    if hours:
+        queryset = queryset.filter(timestamp__gte=datetime.now(tz=timezone.utc) - timedelta(hours=hours))
+    return hydroponic_system_id, detect_anomalies(queryset, **options)
@@ -0,0 +1,77 @@
+"""
+Completeness of measurement series: gaps between readings, uptime and reading rate per hydroponic system
+"""
+
+from django.db.models import Count
+from django.db.models import F
+from django.db.models import Max
+from django.db.models import Q
+from django.db.models import Window
+from django.db.models.functions import Lag
+from django.db.models.functions import RowNumber
+
+DEFAULT_MIN_GAP_SECONDS = 900
+
+
+def find_gaps(queryset, min_gap):
+    """Return the readings count, first and last timestamp and the gaps longer than min_gap of each system
+
+    A single pass in (hydroponic_system, timestamp) order: LAG gives every reading the timestamp of the
+    one before it, and only the first reading of each system and the readings ending a gap come back
+    from the database.
+    """
+    partition = {'partition_by': [F('hydroponic_system_id')]}
+    order = F('timestamp').asc()
+    rows = (queryset.order_by()
+            .annotate(previous=Window(Lag('timestamp'), order_by=order, **partition),
+                      position=Window(RowNumber(), order_by=order, **partition),
+                      readings=Window(Count('id'), **partition),
+                      last=Window(Max('timestamp'), **partition))
+            .filter(Q(position=1) | Q(timestamp__gt=F('previous') + min_gap))
+            .order_by('hydroponic_system_id', 'timestamp')
+            .values_list('hydroponic_system_id', 'previous', 'timestamp', 'readings', 'last'))
+
+    series = {}
+    for hydroponic_system_id, previous, timestamp, readings, last in rows:
+        if previous is None:
+            series[hydroponic_system_id] = {'readings': readings, 'first': timestamp, 'last': last, 'gaps': []}
+        else:
+            series[hydroponic_system_id]['gaps'].append((previous, timestamp))
+    return series
+
+
+def completeness(queryset, hydroponic_system_ids, min_gap, start=None, end=None):
+    """Return the completeness report of each system's measurements in the queryset
+
+    The period runs from start to end, or from the first to the last reading where they are None.
+    Time from the start of the period to the first reading and from the last reading to its end
+    counts as a gap too. Uptime is the share of the period not in a gap.
+    """
+    found = find_gaps(queryset, min_gap)
+    reports = []
+    for hydroponic_system_id in hydroponic_system_ids:
+        series = found.get(hydroponic_system_id, {'readings': 0, 'first': None, 'last': None, 'gaps': []})
+        gaps = list(series['gaps'])
+        first, last = series['first'], series['last']
+        if start is not None and (first or end) is not None and (first or end) - start > min_gap:
+            gaps.insert(0, (start, first or end))
+        if end is not None and last is not None and end - last > min_gap:
+            gaps.append((last, end))
+
+        period_start = start or first
+        period_end = end or last
+        seconds = (period_end - period_start).total_seconds() if period_start and period_end else 0
+        offline = sum((gap_end - gap_start).total_seconds() for gap_start, gap_end in gaps)
+        reports.append({
+            'hydroponic_system': hydroponic_system_id,
+            'start': period_start,
+            'end': period_end,
+            'readings': series['readings'],
+            'first': first,
+            'last': last,
+            'uptime': round(100 * (seconds - offline) / seconds, 2) if seconds > 0 else None,
+            'readings_per_hour': round(series['readings'] * 3600 / seconds, 3) if seconds > 0 else None,
+            'gaps': [{'start': gap_start, 'end': gap_end, 'seconds': (gap_end - gap_start).total_seconds()}
+                     for gap_start, gap_end in gaps],
+        })
+    return reports
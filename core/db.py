@@ -0,0 +1,64 @@
+"""
+Database helpers that use the query planner where the backend has one
+"""
+
+import json
+from contextlib import ExitStack
+from contextlib import contextmanager
+from django.db import connections
+
+# SQLSTATE of a statement cancelled by statement_timeout
+QUERY_CANCELED = '57014'
+
+
+def estimate_rows(queryset):
+    """Return the planner's row estimate for a queryset, or None when the backend cannot estimate"""
+    connection = connections[queryset.db]
+    if connection.vendor != 'postgresql':
+        return None
+    sql, params = queryset.query.sql_with_params()
+    with connection.cursor() as cursor:
+        cursor.execute(f'EXPLAIN (FORMAT JSON) {sql}', params)
+        plan = cursor.fetchone()[0]
+    if isinstance(plan, str):
+        plan = json.loads(plan)
+    return int(plan[0]['Plan']['Plan Rows'])
+
+
+def is_query_timeout(error):
+    """Return whether a database error is a statement cancelled by statement_timeout"""
+    return getattr(error.__cause__, 'sqlstate', None) == QUERY_CANCELED
+
+
+@contextmanager
+def statement_timeout(milliseconds):
+    """Cancel the PostgreSQL statements of the block that run longer than the timeout
+
+    The timeout is set on each connection before its first statement in the block, so it holds on
+    whichever replica the router picks, and is reset afterwards. Inside a transaction it is set
+    locally and lasts until the transaction ends.
+    """
+    timed = []
+
+    def set_timeout(execute, sql, params, many, context):
+        connection = context['connection']
+        if connection.vendor == 'postgresql' and connection not in timed:
+            timed.append(connection)
+            with connection.cursor() as cursor:
+                cursor.execute("SELECT set_config('statement_timeout', %s, %s)",
+                               [f'{milliseconds}ms', connection.in_atomic_block])
+        return execute(sql, params, many, context)
+
+    if not milliseconds:
+        yield
+        return
+    with ExitStack() as stack:
+        for connection in connections.all():
+            stack.enter_context(connection.execute_wrapper(set_timeout))
+        try:
+            yield
+        finally:
+            for connection in timed:
+                if connection.connection is not None and not connection.in_atomic_block:
+                    with connection.cursor() as cursor:
+                        cursor.execute('RESET statement_timeout')
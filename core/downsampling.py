@@ -0,0 +1,107 @@
+"""
+Shape-preserving downsampling of measurement series for charts
+"""
+
+from itertools import islice
+import numpy as np
+from django.db.models import Count
+from django.db.models import Max
+from django.db.models import Min
+from .analysis import CHUNK_SIZE
+
+# Time buckets kept per output point while streaming, each keeps its minimum and maximum reading
+CANDIDATES_PER_POINT = 4
+
+
+def lttb(x, y, threshold):
+    """Return the indexes of the points Largest-Triangle-Three-Buckets keeps of a series sorted by x"""
+    if threshold < 3:
+        raise ValueError('LTTB keeps at least the first, the last and one point in between')
+    length = len(x)
+    if threshold >= length:
+        return np.arange(length)
+    every = (length - 2) / (threshold - 2)
+    edges = np.append(np.floor(np.arange(threshold - 1) * every).astype(np.int64) + 1, length)
+    selected = np.empty(threshold, dtype=np.int64)
+    selected[0] = previous = 0
+    selected[-1] = length - 1
+    for bucket in range(threshold - 2):
+        start, end, next_end = edges[bucket], edges[bucket + 1], edges[bucket + 2]
+        average_x = x[end:next_end].mean()
+        average_y = y[end:next_end].mean()
+        areas = np.abs((x[previous] - average_x) * (y[start:end] - y[previous]) -
+                       (x[previous] - x[start:end]) * (average_y - y[previous]))
+        previous = start + int(np.argmax(areas))
+        selected[bucket + 1] = previous
+    return selected
+
+
+def stream_candidates(queryset, field, buckets, first, last, chunk_size=CHUNK_SIZE):
+    """Stream a series and keep the first, last, minimum and maximum reading of every time bucket
+
+    Memory stays bounded by the number of buckets and the chunk size however many rows are read.
+    Returns the ids, epoch seconds and values of the candidates sorted by time.
+    """
+    rows = queryset.order_by('timestamp', 'id').values_list('id', 'timestamp', field).iterator(chunk_size=chunk_size)
+
+    def chunks():
+        while chunk := list(islice(rows, chunk_size)):
+            yield (np.fromiter((row[0] for row in chunk), dtype=np.float64, count=len(chunk)),
+                   np.fromiter((row[1].timestamp() for row in chunk), dtype=np.float64, count=len(chunk)),
+                   np.fromiter((row[2] for row in chunk), dtype=np.float64, count=len(chunk)))
+
+    return select_candidates(chunks(), buckets, first.timestamp(), last.timestamp())
+
+
+def select_candidates(chunks, buckets, first, last):
+    """Keep the first, last, minimum and maximum reading of every time bucket of a chunked series
+
+    The chunks are (ids, epoch seconds, values) arrays sorted by time, first and last are the epoch
+    seconds of the first and last reading of the series.
+    """
+    span = max(last - first, 1e-6)
+    low = np.full(buckets, np.inf)
+    high = np.full(buckets, -np.inf)
+    low_rows = np.zeros((buckets, 2))
+    high_rows = np.zeros((buckets, 2))
+    ends = []
+
+    for ids, times, values in chunks:
+        if not ends:
+            ends.append((ids[0], times[0], values[0]))
+        ends[1:] = [(ids[-1], times[-1], values[-1])]
+
+        rows_data = np.column_stack((ids, times))
+        bucket = np.minimum(((times - first) / span * buckets).astype(np.int64), buckets - 1)
+        order = np.lexsort((values, bucket))
+        starts = np.flatnonzero(np.concatenate(([True], np.diff(bucket[order]) != 0)))
+        stops = np.append(starts[1:], len(order)) - 1
+        segments = bucket[order][starts]
+
+        for rows_index, best, rows_store, better in ((order[starts], low, low_rows, np.less),
+                                                     (order[stops], high, high_rows, np.greater)):
+            improved = better(values[rows_index], best[segments])
+            best[segments[improved]] = values[rows_index][improved]
+            rows_store[segments[improved]] = rows_data[rows_index][improved]
+
+    filled = np.isfinite(low)
+    candidate_ids = np.concatenate((low_rows[filled, 0], high_rows[filled, 0], [end[0] for end in ends]))
+    candidate_times = np.concatenate((low_rows[filled, 1], high_rows[filled, 1], [end[1] for end in ends]))
+    candidate_values = np.concatenate((low[filled], high[filled], [end[2] for end in ends]))
+    candidate_ids, unique = np.unique(candidate_ids, return_index=True)
+    order = np.argsort(candidate_times[unique], kind='stable')
+    return candidate_ids[order].astype(np.int64), candidate_times[unique][order], candidate_values[unique][order]
+
+
+def downsample(queryset, max_points, field='ph'):
+    """Return the ids of at most max_points measurements that preserve the shape of the field's series
+
+    The rows are streamed into min/max candidates per time bucket, which LTTB reduces to max_points.
+    Returns the ids and the number of raw measurements.
+    """
+    stats = queryset.order_by().aggregate(count=Count('id'), first=Min('timestamp'), last=Max('timestamp'))
+    if stats['count'] <= max_points:
+        return list(queryset.values_list('id', flat=True)), stats['count']
+    ids, times, values = stream_candidates(queryset, field, max_points * CANDIDATES_PER_POINT, stats['first'],
+                                           stats['last'])
+    return ids[lttb(times, values, max_points)].tolist(), stats['count']
@@ -0,0 +1,177 @@
+"""
+Background jobs: the queue in the Job table and the handlers the run_jobs worker command executes
+"""
+
+import csv
+import logging
+import threading
+import time
+from contextlib import contextmanager
+from datetime import timedelta
+from pathlib import Path
+from django.conf import settings
+from django.db import connections
+from django.db import transaction
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+from . import analysis
+from .models import Job
+from .models import Measurement
+from .stats import summarize_measurements
+
+logger = logging.getLogger(__name__)
+
+HANDLERS = {}
+# Seconds between progress updates written to the database
+PROGRESS_INTERVAL = 1.0
+
+
+def handler(kind):
+    """Register the function running the jobs of a kind, it returns the job's result"""
+    def register(function):
+        HANDLERS[kind] = function
+        return function
+    return register
+
+
+class Progress:
+    """Report the progress of a job, written at most every PROGRESS_INTERVAL seconds"""
+
+    def __init__(self, job):
+        self.job = job
+        self.written = 0.0
+
+    def __call__(self, done, total):
+        percent = min(99, int(done * 100 / total)) if total else 0
+        now = time.monotonic()
+        if percent != self.job.progress and now - self.written >= PROGRESS_INTERVAL:
+            self.job.progress = percent
+            self.written = now
+            Job.objects.filter(id=self.job.id).update(progress=percent)
+
+
+def job_measurements(job):
+    """Return the measurements of the job's hydroponic system between its optional start and end"""
+    queryset = Measurement.objects.filter(hydroponic_system_id=job.parameters['hydroponic_system'])
+    if job.parameters.get('start'):
+        queryset = queryset.filter(timestamp__gte=parse_datetime(job.parameters['start']))
+    if job.parameters.get('end'):
+        queryset = queryset.filter(timestamp__lte=parse_datetime(job.parameters['end']))
+    return queryset
+
+
+def result_path(job):
+    """Return the path of a job's result file"""
+    return Path(settings.JOB_RESULTS_DIR) / job.result_file
+
+
+@handler(Job.EXPORT_MEASUREMENTS)
+def export_measurements(job, progress):
+    """Stream the measurements to a CSV file, renamed into place once it is complete"""
+    queryset = job_measurements(job)
+    total = queryset.count()
+    directory = Path(settings.JOB_RESULTS_DIR)
+    directory.mkdir(parents=True, exist_ok=True)
+    name = f'job-{job.id}-measurements-{job.parameters["hydroponic_system"]}.csv'
+    partial = directory / f'{name}.part'
+
+    rows = 0
+    with open(partial, 'w', newline='') as file:
+        writer = csv.writer(file)
+        writer.writerow(['id', 'timestamp', 'ph', 'temperature', 'tds'])
+        values = queryset.order_by('timestamp', 'id').values_list('id', 'timestamp', 'ph', 'temperature', 'tds')
+        for row in values.iterator(chunk_size=analysis.CHUNK_SIZE):
+            writer.writerow((row[0], row[1].isoformat(), *row[2:]))
+            rows += 1
+            if rows % analysis.CHUNK_SIZE == 0:
+                progress(rows, total)
+    partial.rename(directory / name)
+    job.result_file = name
+    return {'rows': rows}
+
+
+@handler(Job.SYSTEM_STATS)
+def system_stats(job, progress):
+    """Recompute the summary statistics of the measurements"""
+    return summarize_measurements(job_measurements(job))
+
+
+@handler(Job.DETECT_ANOMALIES)
+def detect_anomalies(job, progress):
+    """Run the anomaly detection over the measurements"""
+    options = {name: job.parameters[name] for name in ('window', 'z_threshold', 'flatline_points')
+               if name in job.parameters}
+    return analysis.detect_anomalies(job_measurements(job), **options)
+
+
+def claim_job():
+    """Mark the oldest queued job as running and return its id, or None when the queue is empty
+
+    SKIP LOCKED lets several worker commands claim from the same queue, the conditional update
+    covers databases without row locks.
+    """
+    with transaction.atomic():
+        job_id = (Job.objects.select_for_update(skip_locked=True).filter(status=Job.QUEUED).order_by('id')
+                  .values_list('id', flat=True).first())
+        if job_id is None:
+            return None
+        now = timezone.now()
+        claimed = Job.objects.filter(id=job_id, status=Job.QUEUED).update(status=Job.RUNNING, started=now,
+                                                                           heartbeat=now)
+    return job_id if claimed else None
+
+
+def touch_jobs(job_ids):
+    """Record that the worker command running the jobs is alive"""
+    if job_ids:
+        Job.objects.filter(id__in=job_ids, status=Job.RUNNING).update(heartbeat=timezone.now())
+
+
+@contextmanager
+def heartbeat(job_id, interval):
+    """Touch a job every interval seconds from a thread while it runs in this process
+
+    The pool mode of the worker command touches its jobs between polls, a job run in the command's own
+    process would block that loop and be queued again after JOB_STALE_SECONDS while still running.
+    """
+    stopped = threading.Event()
+
+    def beat():
+        try:
+            while not stopped.wait(interval):
+                touch_jobs([job_id])
+        finally:
+            # Database connections are per thread, close the one this thread opened
+            connections.close_all()
+
+    thread = threading.Thread(target=beat, name=f'job-{job_id}-heartbeat', daemon=True)
+    thread.start()
+    try:
+        yield
+    finally:
+        stopped.set()
+        thread.join()
+
+
+def requeue_stale_jobs():
+    """Queue running jobs again whose worker command stopped updating their heartbeat, return their number"""
+    stale = timezone.now() - timedelta(seconds=settings.JOB_STALE_SECONDS)
+    return Job.objects.filter(status=Job.RUNNING, heartbeat__lt=stale).update(status=Job.QUEUED, progress=0,
+                                                                             started=None, heartbeat=None)
+
+
+def run_job(job_id):
+    """Run a claimed job and store its result or error, returns the job id and final status"""
+    job = Job.objects.get(id=job_id)
+    try:
+        job.result = HANDLERS[job.kind](job, Progress(job))
+    except Exception as error:
+        logger.exception('Job %s (%s) failed', job.id, job.kind)
+        job.status = Job.FAILED
+        job.error = str(error) or type(error).__name__
+    else:
+        job.status = Job.SUCCEEDED
+        job.progress = 100
+    job.finished = timezone.now()
+    job.save(update_fields=['status', 'progress', 'result', 'result_file', 'error', 'finished'])
+    return job.id, job.status
@@ -0,0 +1,66 @@
+"""
+Detect measurement anomalies of every hydroponic system in parallel worker processes
+"""
+
+import json
+import os
+from concurrent.futures import ProcessPoolExecutor
+from django.core.management.base import BaseCommand
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import connections
+from core import analysis
+from core.models import HydroponicSystem
+from core.workers import setup_worker
+
+
+class Command(BaseCommand):
+    help = 'Detect spikes, implausible rates of change and flatlined sensors across all hydroponic systems'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--system', type=int, action='append', dest='systems',
+                            help='Only analyse this hydroponic system ID, can be repeated')
+        parser.add_argument('--hours', type=int, default=24, help='Analyse the last hours, 0 for the whole history')
+        parser.add_argument('--workers', type=int, default=os.cpu_count(), help='Number of worker processes')
+        parser.add_argument('--window', type=int, default=analysis.DEFAULT_WINDOW)
+        parser.add_argument('--z-threshold', type=float, default=analysis.DEFAULT_Z_THRESHOLD)
+        parser.add_argument('--flatline-points', type=int, default=analysis.DEFAULT_FLATLINE_POINTS)
+        parser.add_argument('--json', action='store_true', help='Write one JSON object per system')
+
+    def handle(self, *args, **options):
+        systems = HydroponicSystem.objects.order_by('id').values_list('id', flat=True)
+        if options['systems']:
+            systems = systems.filter(id__in=options['systems'])
+        systems = list(systems)
+        parameters = {
+            'hours': options['hours'],
+            'window': options['window'],
+            'z_threshold': options['z_threshold'],
+            'flatline_points': options['flatline_points'],
+        }
+
+        if options['workers'] > 1 and len(systems) > 1:
+            # Worker processes must open their own database connections
+            connections.close_all()
+            with ProcessPoolExecutor(max_workers=options['workers'], initializer=setup_worker) as executor:
+                futures = [executor.submit(analysis.analyse_system, system_id, **parameters) for system_id in systems]
+                results = (future.result() for future in futures)
+                self.report(results, options)
+        else:
+            self.report((analysis.analyse_system(system_id, **parameters) for system_id in systems), options)
+
+    def report(self, results, options):
+        flagged = 0
+        for system_id, result in results:
+            flagged += bool(result['anomalies'])
+            if options['json']:
+                self.stdout.write(json.dumps({'hydroponic_system': system_id, **result}, cls=DjangoJSONEncoder))
+                continue
+            self.stdout.write(f"System {system_id}: {result['readings']} readings, "
+                              f"{len(result['anomalies'])} anomalies")
+            if options['verbosity'] > 1:
+                for anomaly in result['anomalies']:
+                    self.stdout.write(f"  {anomaly['field']} {anomaly['kind']} {anomaly['start']:%Y-%m-%d %H:%M:%S} - "
+                                      f"{anomaly['end']:%Y-%m-%d %H:%M:%S} ({anomaly['points']} points, "
+                                      f"score {anomaly['score']})")
+        if not options['json']:
+            self.stdout.write(self.style.SUCCESS(f'{flagged} systems with anomalies'))
@@ -0,0 +1,37 @@
+"""
+Delete change feed entries older than the retention period
+"""
+
+from datetime import timedelta
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db.models import Max
+from django.db.models import Min
+from django.utils import timezone
+from core.models import Change
+from core.models import ChangeFeedPrune
+
+
+class Command(BaseCommand):
+    help = 'Delete change feed entries older than CHANGE_FEED_RETENTION_DAYS, clients behind them must resync'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--days', type=int, default=settings.CHANGE_FEED_RETENTION_DAYS,
+                            help='Keep the changes of the last days')
+        parser.add_argument('--batch-size', type=int, default=10000, help='Changes deleted per statement')
+
+    def handle(self, *args, **options):
+        before = timezone.now() - timedelta(days=options['days'])
+        last = Change.objects.filter(timestamp__lt=before).aggregate(last=Max('id'))['last']
+        if last is None:
+            self.stdout.write('No changes to prune')
+            return
+        # The horizon is stored before deleting, so no cursor is served a range that is being deleted
+        prune = ChangeFeedPrune.objects.create(pruned_through=last)
+        start = Change.objects.aggregate(first=Min('id'))['first'] - 1
+        while start < last:
+            end = min(start + options['batch_size'], last)
+            prune.deleted += Change.objects.filter(id__gt=start, id__lte=end).delete()[0]
+            start = end
+        prune.save(update_fields=['deleted'])
+        self.stdout.write(self.style.SUCCESS(f'Deleted {prune.deleted} changes up to id {last}'))
@@ -0,0 +1,71 @@
+"""
+Run queued background jobs in worker processes
+"""
+
+import multiprocessing
+import os
+import time
+from concurrent.futures import FIRST_COMPLETED
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures import wait
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import connections
+from core import jobs
+from core.models import Job
+from core.workers import setup_worker
+
+
+class Command(BaseCommand):
+    help = 'Claim queued jobs (exports, statistics, anomaly detection) and run them in worker processes'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, default=os.cpu_count(),
+                            help='Number of worker processes, 0 runs the jobs in this process')
+        parser.add_argument('--poll', type=float, default=settings.JOB_POLL_SECONDS,
+                            help='Seconds between checks of an empty queue')
+        parser.add_argument('--once', action='store_true', help='Exit when the queue is empty')
+
+    def handle(self, *args, **options):
+        requeued = jobs.requeue_stale_jobs()
+        if requeued:
+            self.stdout.write(f'Requeued {requeued} stale jobs')
+        if options['workers'] < 1:
+            self.run_inline(options)
+            return
+
+        # Worker processes are started while jobs are claimed, spawning them keeps them off this
+        # process's database connection
+        connections.close_all()
+        with ProcessPoolExecutor(max_workers=options['workers'], initializer=setup_worker,
+                                 mp_context=multiprocessing.get_context('spawn')) as executor:
+            running = {}
+            while True:
+                while len(running) < options['workers'] and (job_id := jobs.claim_job()) is not None:
+                    running[executor.submit(jobs.run_job, job_id)] = job_id
+                if not running:
+                    if options['once']:
+                        break
+                    time.sleep(options['poll'])
+                    jobs.requeue_stale_jobs()
+                    continue
+                done, _ = wait(running, timeout=options['poll'], return_when=FIRST_COMPLETED)
+                for future in done:
+                    del running[future]
+                    self.report(*future.result())
+                jobs.touch_jobs(list(running.values()))
+
+    def run_inline(self, options):
+        while True:
+            job_id = jobs.claim_job()
+            if job_id is None:
+                if options['once']:
+                    return
+                time.sleep(options['poll'])
+                continue
+            with jobs.heartbeat(job_id, options['poll']):
+                self.report(*jobs.run_job(job_id))
+
+    def report(self, job_id, status):
+        style = self.style.SUCCESS if status == Job.SUCCEEDED else self.style.ERROR
+        self.stdout.write(style(f'Job {job_id} {status}'))
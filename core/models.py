@@ -1,5 +1,6 @@
 from django.db import models
 from django.contrib.auth.models import User
+from django.core.serializers.json import DjangoJSONEncoder
 
 
 class HydroponicSystem(models.Model):
@@ -34,7 +35,128 @@ class Measurement(models.Model):
         ordering = ['-timestamp']
         indexes = [
             models.Index(fields=['-timestamp']),
+            models.Index(fields=['hydroponic_system', 'timestamp']),
         ]
 
     def __str__(self):
         return f"{self.hydroponic_system.title} - {self.timestamp}"
+
+
+class CalibrationCorrection(models.Model):
+    """Audit record of a bulk calibration correction applied to measurements"""
+    FIELD_CHOICES = [
+        ('ph', 'pH'),
+        ('temperature', 'Temperature'),
+        ('tds', 'TDS'),
+    ]
+
+    hydroponic_system = models.ForeignKey(HydroponicSystem, on_delete=models.CASCADE,
+                                          related_name='calibration_corrections')
+    user = models.ForeignKey(User, on_delete=models.SET_NULL, null=True, related_name='calibration_corrections')
+    field = models.CharField(max_length=20, choices=FIELD_CHOICES)
+    scale = models.DecimalField(max_digits=10, decimal_places=6, default=1)
+    offset = models.DecimalField(max_digits=8, decimal_places=2, default=0)
+    filters = models.JSONField(default=dict, blank=True)
+    affected = models.PositiveIntegerField(default=0)
+    created = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        ordering = ['-created']
+
+    def __str__(self):
+        return f"{self.hydroponic_system.title} - {self.field} x{self.scale} {self.offset:+}"
+
+
+class Change(models.Model):
+    """Change feed entry, the auto-incremented id is the synchronisation cursor"""
+    SYSTEM = 'system'
+    MEASUREMENT = 'measurement'
+    MODEL_CHOICES = [
+        (SYSTEM, 'Hydroponic system'),
+        (MEASUREMENT, 'Measurement'),
+    ]
+    CREATE = 'create'
+    UPDATE = 'update'
+    DELETE = 'delete'
+    ACTION_CHOICES = [
+        (CREATE, 'Create'),
+        (UPDATE, 'Update'),
+        (DELETE, 'Delete'),
+    ]
+
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='changes')
+    model = models.CharField(max_length=20, choices=MODEL_CHOICES)
+    object_id = models.BigIntegerField()
+    system_id = models.BigIntegerField()
+    action = models.CharField(max_length=10, choices=ACTION_CHOICES)
+    # Set on the single system update recorded for a bulk calibration correction of its measurements
+    correction = models.ForeignKey(CalibrationCorrection, on_delete=models.SET_NULL, null=True, blank=True,
+                                   related_name='changes')
+    timestamp = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        ordering = ['id']
+        indexes = [
+            models.Index(fields=['user', 'id']),
+        ]
+
+    def __str__(self):
+        return f"{self.id} - {self.action} {self.model} {self.object_id}"
+
+
+class ChangeFeedPrune(models.Model):
+    """Record of a prune_changes run, cursors below the highest pruned id may have missed changes"""
+    pruned_through = models.BigIntegerField()
+    deleted = models.PositiveIntegerField(default=0)
+    created = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        ordering = ['-id']
+
+    def __str__(self):
+        return f"{self.created:%Y-%m-%d %H:%M} - through {self.pruned_through}"
+
+
+class Job(models.Model):
+    """Background job queued by the API and run by the run_jobs worker command"""
+    EXPORT_MEASUREMENTS = 'export_measurements'
+    SYSTEM_STATS = 'system_stats'
+    DETECT_ANOMALIES = 'detect_anomalies'
+    KIND_CHOICES = [
+        (EXPORT_MEASUREMENTS, 'Export measurements to CSV'),
+        (SYSTEM_STATS, 'Recompute system statistics'),
+        (DETECT_ANOMALIES, 'Detect anomalies'),
+    ]
+    QUEUED = 'queued'
+    RUNNING = 'running'
+    SUCCEEDED = 'succeeded'
+    FAILED = 'failed'
+    STATUS_CHOICES = [
+        (QUEUED, 'Queued'),
+        (RUNNING, 'Running'),
+        (SUCCEEDED, 'Succeeded'),
+        (FAILED, 'Failed'),
+    ]
+
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='jobs')
+    kind = models.CharField(max_length=30, choices=KIND_CHOICES)
+    parameters = models.JSONField(default=dict, blank=True)
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default=QUEUED)
+    progress = models.PositiveSmallIntegerField(default=0)
+    result = models.JSONField(null=True, blank=True, encoder=DjangoJSONEncoder)
+    result_file = models.CharField(max_length=255, blank=True)
+    error = models.TextField(blank=True)
+    created = models.DateTimeField(auto_now_add=True)
+    started = models.DateTimeField(null=True, blank=True)
+    finished = models.DateTimeField(null=True, blank=True)
+    heartbeat = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        ordering = ['-id']
+        indexes = [
+            models.Index(fields=['status', 'id']),
+            models.Index(fields=['user', '-id']),
+        ]
+
+    def __str__(self):
+        return f"{self.id} - {self.kind} ({self.status})"
@@ -0,0 +1,69 @@
+"""
+Substring search on hydroponic systems, backed by pg_trgm GIN indexes on PostgreSQL
+"""
+
+import logging
+from django.db import connections
+from django.db.models import Case
+from django.db.models import FloatField
+from django.db.models import Q
+from django.db.models import Value
+from django.db.models import When
+from django.db.models.functions import Greatest
+from .models import HydroponicSystem
+
+logger = logging.getLogger(__name__)
+
+# Django compiles icontains to UPPER("column"::text) LIKE UPPER(%s), so the indexes cover that expression
+TRIGRAM_INDEXES = {
+    'core_hydroponicsystem_title_trgm': 'title',
+    'core_hydroponicsystem_location_trgm': 'location',
+}
+
+
+def create_trigram_indexes(using='default', **kwargs):
+    """Create the pg_trgm extension and the trigram indexes, a post_migrate receiver"""
+    connection = connections[using]
+    if connection.vendor != 'postgresql':
+        return
+    quote_name = connection.ops.quote_name
+    table = quote_name(HydroponicSystem._meta.db_table)
+    with connection.cursor() as cursor:
+        cursor.execute("SELECT 1 FROM pg_available_extensions WHERE name = 'pg_trgm'")
+        if cursor.fetchone() is None:
+            logger.warning('The pg_trgm extension is not available, system search will not use trigram indexes')
+            return
+        cursor.execute('CREATE EXTENSION IF NOT EXISTS pg_trgm')
+        for name, column in TRIGRAM_INDEXES.items():
+            cursor.execute(f'CREATE INDEX IF NOT EXISTS {quote_name(name)} ON {table} '
+                           f'USING gin ((UPPER({quote_name(column)}::text)) gin_trgm_ops)')
+
+
+def has_trigram_extension(connection):
+    """Whether the pg_trgm extension is installed in the connection's database, checked once per process"""
+    if connection.vendor != 'postgresql':
+        return False
+    if connection.alias not in _trigram_extension:
+        with connection.cursor() as cursor:
+            cursor.execute("SELECT 1 FROM pg_extension WHERE extname = 'pg_trgm'")
+            _trigram_extension[connection.alias] = cursor.fetchone() is not None
+    return _trigram_extension[connection.alias]
+
+
+_trigram_extension = {}
+
+
+def search_systems(queryset, term):
+    """Filter the systems whose title or location contains the term, best matches first"""
+    queryset = queryset.filter(Q(title__icontains=term) | Q(location__icontains=term))
+    if has_trigram_extension(connections[queryset.db]):
+        from django.contrib.postgres.search import TrigramSimilarity
+        rank = Greatest(TrigramSimilarity('title', term), TrigramSimilarity('location', term))
+    else:
+        rank = Case(
+            When(Q(title__iexact=term) | Q(location__iexact=term), then=Value(1.0)),
+            When(Q(title__istartswith=term) | Q(location__istartswith=term), then=Value(0.5)),
+            default=Value(0.1),
+            output_field=FloatField(),
+        )
+    return queryset.annotate(rank=rank).order_by('-rank', '-id')
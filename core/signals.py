@@ -0,0 +1,69 @@
+"""
+Signals for changes that bypass the model save/delete signals and the change feed receivers
+"""
+
+from django.db.models.signals import post_delete
+from django.db.models.signals import post_save
+from django.dispatch import Signal
+from django.dispatch import receiver
+from .models import Change
+from .models import HydroponicSystem
+from .models import Measurement
+
+# Sent after a set-based UPDATE rewrote measurements of a single hydroponic system.
+# Arguments: hydroponic_system, correction (its filters are the scope of the rewritten measurements)
+measurements_bulk_updated = Signal()
+
+
+def deleted_directly(origin, model):
+    """Whether a deletion was started on the model itself, not cascaded from a parent object"""
+    return origin is None or isinstance(origin, model) or getattr(origin, 'model', None) is model
+
+
+@receiver(post_save, sender=HydroponicSystem)
+def record_system_save(sender, instance, created, raw=False, **kwargs):
+    """Record a created or updated hydroponic system in the change feed"""
+    if raw:
+        return
+    Change.objects.create(user_id=instance.user_id, model=Change.SYSTEM, object_id=instance.pk,
+                          system_id=instance.pk, action=Change.CREATE if created else Change.UPDATE)
+
+
+@receiver(post_delete, sender=HydroponicSystem)
+def record_system_delete(sender, instance, origin=None, **kwargs):
+    """Record a deleted hydroponic system, which implies the deletion of its measurements"""
+    if not deleted_directly(origin, HydroponicSystem):
+        return
+    Change.objects.create(user_id=instance.user_id, model=Change.SYSTEM, object_id=instance.pk,
+                          system_id=instance.pk, action=Change.DELETE)
+
+
+@receiver(post_save, sender=Measurement)
+def record_measurement_save(sender, instance, created, raw=False, **kwargs):
+    """Record a created or updated measurement in the change feed"""
+    if raw:
+        return
+    Change.objects.create(user_id=instance.hydroponic_system.user_id, model=Change.MEASUREMENT,
+                          object_id=instance.pk, system_id=instance.hydroponic_system_id,
+                          action=Change.CREATE if created else Change.UPDATE)
+
+
+def record_measurement_delete(measurement):
+    """Record a deleted measurement, called by the API before deleting it
+
+    Not a post_delete receiver: any receiver on Measurement turns off the single DELETE Django issues
+    for the measurements of a deleted system and loads every one of them instead.
+    """
+    Change.objects.create(user_id=measurement.hydroponic_system.user_id, model=Change.MEASUREMENT,
+                          object_id=measurement.pk, system_id=measurement.hydroponic_system_id, action=Change.DELETE)
+
+
+@receiver(measurements_bulk_updated)
+def record_measurements_bulk_update(sender, hydroponic_system, correction, **kwargs):
+    """Record a bulk update as a single update of the system carrying the correction
+
+    One change per rewritten measurement would be inserted early in a long transaction and could commit
+    after the change feed settle time.
+    """
+    Change.objects.create(user_id=hydroponic_system.user_id, model=Change.SYSTEM, object_id=hydroponic_system.pk,
+                          system_id=hydroponic_system.pk, action=Change.UPDATE, correction=correction)
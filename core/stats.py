@@ -0,0 +1,29 @@
+"""
+Summary statistics of measurements
+"""
+
+from decimal import Decimal
+from django.db.models import Avg
+from django.db.models import Count
+from django.db.models import Max
+from django.db.models import Min
+from .models import Measurement
+
+FIELDS = ('ph', 'temperature', 'tds')
+
+
+def summarize_measurements(queryset):
+    """Return the count, first and last timestamp and per field minimum, maximum and average in one query"""
+    aggregates = queryset.order_by().aggregate(
+        count=Count('id'), first=Min('timestamp'), last=Max('timestamp'),
+        **{f'{field}_{name}': function(field) for field in FIELDS
+           for name, function in (('min', Min), ('max', Max), ('avg', Avg))})
+    stats = {'count': aggregates['count'], 'first': aggregates['first'], 'last': aggregates['last']}
+    for field in FIELDS:
+        # Some backends return the extremes with more decimal places than the field has
+        places = Decimal(1).scaleb(-Measurement._meta.get_field(field).decimal_places)
+        low, high, average = (aggregates[f'{field}_{name}'] for name in ('min', 'max', 'avg'))
+        stats[field] = {'min': low.quantize(places) if low is not None else None,
+                        'max': high.quantize(places) if high is not None else None,
+                        'avg': float(average) if average is not None else None}
+    return stats
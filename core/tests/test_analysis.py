@@ -0,0 +1,103 @@
+"""
+Tests for the anomaly detection
+"""
+
+from datetime import datetime
+from datetime import timedelta
+from datetime import timezone
+from io import StringIO
+from decimal import Decimal
+import numpy as np
+from django.contrib.auth.models import User
+from django.core.management import call_command
+from django.test import SimpleTestCase
+from django.test import TestCase
+from ..analysis import detect_anomalies
+from ..analysis import find_flatlines
+from ..analysis import find_rate_changes
+from ..analysis import find_spikes
+from ..analysis import load_readings
+from ..analysis import rolling_zscores
+from ..models import HydroponicSystem
+from ..models import Measurement
+
+
+def create_readings(hydroponic_system, values, start=None, interval=timedelta(minutes=1)):
+    """Create measurements with the given pH values and a constant temperature and TDS at a fixed interval"""
+    start = start or datetime(2024, 1, 1, tzinfo=timezone.utc)
+    for index, ph in enumerate(values):
+        measurement = Measurement.objects.create(hydroponic_system=hydroponic_system, ph=Decimal(str(ph)),
+                                                 temperature=Decimal('20'), tds=Decimal('300'))
+        Measurement.objects.filter(pk=measurement.pk).update(timestamp=start + index * interval)
+
+
+class TestAnalysisFunctions(SimpleTestCase):
+    """Tests the vectorized detectors"""
+
+    def test_rolling_zscores_match_loop(self):
+        """Test the vectorized z-scores equal a straightforward loop"""
+        series = np.random.default_rng(1).normal(6, 0.2, 200)
+        scores = rolling_zscores(series, 20)
+        for index in (20, 57, 199):
+            previous = series[index - 20:index]
+            self.assertAlmostEqual(scores[index], (series[index] - previous.mean()) / previous.std())
+        self.assertTrue((scores[:20] == 0).all())
+
+    def test_find_spikes(self):
+        """Test a single outlier is flagged as a spike"""
+        series = np.random.default_rng(2).normal(6, 0.05, 300)
+        series[150] = 9
+        self.assertEqual([run[:2] for run in find_spikes(series, 60, 4)], [(150, 150)])
+
+    def test_find_rate_changes(self):
+        """Test a jump faster than the maximum rate is flagged between two readings"""
+        timestamps = np.arange(5) * 60.0
+        series = np.array([6.0, 6.0, 7.0, 7.0, 7.0])
+        self.assertEqual(find_rate_changes(timestamps, series, 2.0), [(1, 2, 60.0)])
+
+    def test_find_flatlines(self):
+        """Test only runs of at least min_points identical readings are flagged"""
+        series = np.array([1.0, 2.0, 2.0, 2.0, 2.0, 3.0, 4.0, 4.0])
+        self.assertEqual(find_flatlines(series, 3), [(1, 4, 4.0)])
+
+
+class TestDetectAnomalies(TestCase):
+    """Tests anomaly detection over measurements"""
+
+    def setUp(self):
+        user = User.objects.create_user(username='testuser', password='testpass123')
+        self.hydroponic_system = HydroponicSystem.objects.create(title='System 1', user=user, location='London')
+
+    def test_load_readings_in_chunks(self):
+        """Test readings are loaded in time order across chunks"""
+        create_readings(self.hydroponic_system, [6.1, 6.2, 6.3, 6.4, 6.5])
+        timestamps, values = load_readings(Measurement.objects.all(), chunk_size=2)
+        self.assertEqual(list(values[:, 0]), [6.1, 6.2, 6.3, 6.4, 6.5])
+        self.assertTrue((np.diff(timestamps) == 60).all())
+
+    def test_detect_anomalies(self):
+        """Test a pH spike and a flatline are reported as intervals"""
+        values = [round(6 + 0.05 * ((index * 7) % 5), 2) for index in range(80)] + [6.5] * 10
+        values[70] = 9.5
+        create_readings(self.hydroponic_system, values)
+
+        result = detect_anomalies(Measurement.objects.all(), window=20, flatline_points=10)
+
+        self.assertEqual(result['readings'], 90)
+        found = {(anomaly['field'], anomaly['kind']) for anomaly in result['anomalies']}
+        self.assertIn(('ph', 'spike'), found)
+        self.assertIn(('ph', 'rate'), found)
+        self.assertIn(('ph', 'flatline'), found)
+        flatline = next(anomaly for anomaly in result['anomalies']
+                        if (anomaly['field'], anomaly['kind']) == ('ph', 'flatline'))
+        self.assertEqual(flatline['points'], 10)
+        self.assertEqual(flatline['end'], datetime(2024, 1, 1, 1, 29, tzinfo=timezone.utc))
+
+    def test_detect_anomalies_command(self):
+        """Test the management command reports every system"""
+        create_readings(self.hydroponic_system, [6.0] * 40)
+        out = StringIO()
+
+        call_command('detect_anomalies', '--hours', '0', '--workers', '1', stdout=out)
+
+        self.assertIn(f'System {self.hydroponic_system.id}: 40 readings, 3 anomalies', out.getvalue())
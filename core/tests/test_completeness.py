@@ -0,0 +1,65 @@
+"""
+Tests for the completeness report of measurement series
+"""
+
+from datetime import datetime
+from datetime import timedelta
+from datetime import timezone
+from decimal import Decimal
+from django.contrib.auth.models import User
+from django.test import TestCase
+from ..completeness import completeness
+from ..models import HydroponicSystem
+from ..models import Measurement
+
+START = datetime(2024, 5, 1, tzinfo=timezone.utc)
+
+
+class CompletenessTests(TestCase):
+    """Test finding gaps and computing uptime with the LAG window query"""
+
+    def setUp(self):
+        user = User.objects.create_user(username='testuser', password='testpass123')
+        self.system = HydroponicSystem.objects.create(title='System 1', user=user, location='London')
+        self.other_system = HydroponicSystem.objects.create(title='System 2', user=user, location='Paris')
+        self.empty_system = HydroponicSystem.objects.create(title='System 3', user=user, location='Rome')
+        # Readings every 10 minutes for 4 hours, offline from 01:00 to 02:00
+        self.add_readings(self.system, [minutes for minutes in range(0, 250, 10) if not 60 < minutes < 120])
+        self.add_readings(self.other_system, range(0, 250, 10))
+
+    def add_readings(self, hydroponic_system, minutes):
+        measurements = Measurement.objects.bulk_create([
+            Measurement(hydroponic_system=hydroponic_system, ph=Decimal('6.5'), temperature=Decimal('20'),
+                        tds=Decimal('300')) for _ in minutes])
+        for measurement, offset in zip(measurements, minutes):
+            measurement.timestamp = START + timedelta(minutes=offset)
+        Measurement.objects.bulk_update(measurements, ['timestamp'])
+
+    def report(self, **kwargs):
+        ids = [self.system.id, self.other_system.id, self.empty_system.id]
+        return completeness(Measurement.objects.filter(hydroponic_system__in=ids), ids, timedelta(minutes=15),
+                            **kwargs)
+
+    def test_gaps_and_uptime(self):
+        """Test the gap is found per system and the period runs from the first to the last reading"""
+        report, other, empty = self.report()
+
+        self.assertEqual(report['readings'], 20)
+        self.assertEqual(report['gaps'], [{'start': START + timedelta(minutes=60),
+                                           'end': START + timedelta(minutes=120), 'seconds': 3600.0}])
+        self.assertEqual(report['start'], START)
+        self.assertEqual(report['end'], START + timedelta(minutes=240))
+        self.assertEqual(report['uptime'], 75.0)
+        self.assertEqual(report['readings_per_hour'], 5.0)
+        self.assertEqual((other['uptime'], other['gaps']), (100.0, []))
+        self.assertEqual((empty['readings'], empty['uptime'], empty['gaps']), (0, None, []))
+
+    def test_period_edges_count_as_gaps(self):
+        """Test time without readings at the start and end of an explicit period is a gap"""
+        report, _, empty = self.report(start=START - timedelta(hours=1), end=START + timedelta(hours=5))
+
+        self.assertEqual([gap['seconds'] for gap in report['gaps']], [3600.0, 3600.0, 3600.0])
+        self.assertEqual(report['uptime'], 50.0)
+        self.assertEqual(empty['gaps'], [{'start': START - timedelta(hours=1), 'end': START + timedelta(hours=5),
+                                          'seconds': 21600.0}])
+        self.assertEqual(empty['uptime'], 0.0)
@@ -0,0 +1,84 @@
+"""
+Tests for the chart downsampling
+"""
+
+from datetime import datetime
+from datetime import timedelta
+from datetime import timezone
+from decimal import Decimal
+import math
+import numpy as np
+from django.contrib.auth.models import User
+from django.test import SimpleTestCase
+from django.test import TestCase
+from ..downsampling import downsample
+from ..downsampling import lttb
+from ..downsampling import stream_candidates
+from ..models import HydroponicSystem
+from ..models import Measurement
+
+
+class TestLttb(SimpleTestCase):
+    """Tests the Largest-Triangle-Three-Buckets selection"""
+
+    def test_keeps_threshold_points(self):
+        """Test the first and last point are kept and the result is sorted"""
+        x = np.arange(1000, dtype=np.float64)
+        y = np.sin(x / 50)
+        selected = lttb(x, y, 50)
+        self.assertEqual(len(selected), 50)
+        self.assertEqual((selected[0], selected[-1]), (0, 999))
+        self.assertTrue((np.diff(selected) > 0).all())
+
+    def test_keeps_spike(self):
+        """Test a single spike survives the downsampling"""
+        x = np.arange(1000, dtype=np.float64)
+        y = np.zeros(1000)
+        y[437] = 10
+        self.assertIn(437, lttb(x, y, 20))
+
+    def test_short_series_unchanged(self):
+        """Test series shorter than the threshold are returned whole"""
+        self.assertEqual(list(lttb(np.arange(5.0), np.arange(5.0), 10)), [0, 1, 2, 3, 4])
+
+
+class TestDownsample(TestCase):
+    """Tests downsampling of measurement querysets"""
+
+    def setUp(self):
+        user = User.objects.create_user(username='testuser', password='testpass123')
+        self.hydroponic_system = HydroponicSystem.objects.create(title='System 1', user=user, location='London')
+        start = datetime(2024, 1, 1, tzinfo=timezone.utc)
+        measurements = Measurement.objects.bulk_create([
+            Measurement(hydroponic_system=self.hydroponic_system,
+                        ph=Decimal(str(round(6 + math.sin(index / 40), 2))),
+                        temperature=Decimal('20'), tds=Decimal('300'))
+            for index in range(600)
+        ])
+        for index, measurement in enumerate(measurements):
+            measurement.timestamp = start + timedelta(minutes=index)
+        Measurement.objects.bulk_update(measurements, ['timestamp'])
+        self.queryset = Measurement.objects.filter(hydroponic_system=self.hydroponic_system)
+
+    def test_candidates_bounded_by_buckets(self):
+        """Test streaming keeps at most two readings per bucket plus the ends, across chunks"""
+        first, last = self.queryset.order_by('timestamp').first(), self.queryset.order_by('timestamp').last()
+        ids, times, values = stream_candidates(self.queryset, 'ph', 20, first.timestamp, last.timestamp,
+                                               chunk_size=64)
+        self.assertLessEqual(len(ids), 42)
+        self.assertEqual((ids[0], ids[-1]), (first.id, last.id))
+        self.assertTrue((np.diff(times) > 0).all())
+        self.assertEqual(values.max(), float(self.queryset.order_by('-ph').first().ph))
+
+    def test_downsample_at_most_max_points(self):
+        """Test the result never exceeds max_points"""
+        measurement_ids, count = downsample(self.queryset, 25)
+        self.assertEqual(count, 600)
+        self.assertLessEqual(len(measurement_ids), 25)
+        self.assertEqual(len(set(measurement_ids)), len(measurement_ids))
+
+    def test_downsample_small_range_unchanged(self):
+        """Test a range with fewer rows than max_points is returned whole"""
+        measurement_ids, count = downsample(self.queryset, 1000)
+        self.assertEqual(count, 600)
+        self.assertEqual(len(measurement_ids), 600)
@@ -0,0 +1,131 @@
+"""
+Tests for the background job queue
+"""
+
+import csv
+import tempfile
+import time
+from datetime import timedelta
+from decimal import Decimal
+from io import StringIO
+from pathlib import Path
+from unittest import mock
+from django.contrib.auth.models import User
+from django.core.management import call_command
+from django.test import TestCase
+from django.test import override_settings
+from django.utils import timezone
+from ..jobs import claim_job
+from ..jobs import heartbeat
+from ..jobs import requeue_stale_jobs
+from ..jobs import result_path
+from ..jobs import run_job
+from ..models import HydroponicSystem
+from ..models import Job
+from ..models import Measurement
+
+
+class JobTests(TestCase):
+    """Test claiming and running jobs"""
+
+    def setUp(self):
+        self.results = tempfile.TemporaryDirectory()
+        self.addCleanup(self.results.cleanup)
+        override = override_settings(JOB_RESULTS_DIR=Path(self.results.name))
+        override.enable()
+        self.addCleanup(override.disable)
+
+        self.user = User.objects.create_user(username='testuser', password='testpass123')
+        self.system = HydroponicSystem.objects.create(title='System 1', user=self.user, location='London')
+        for ph in ('6.10', '6.30', '6.20'):
+            Measurement.objects.create(hydroponic_system=self.system, ph=Decimal(ph), temperature=Decimal('20'),
+                                       tds=Decimal('300'))
+
+    def create_job(self, kind, **parameters):
+        return Job.objects.create(user=self.user, kind=kind,
+                                  parameters={'hydroponic_system': self.system.id, **parameters})
+
+    def test_claim_oldest_queued_job(self):
+        """Test jobs are claimed oldest first and only once"""
+        first = self.create_job(Job.SYSTEM_STATS)
+        second = self.create_job(Job.SYSTEM_STATS)
+
+        self.assertEqual(claim_job(), first.id)
+        self.assertEqual(claim_job(), second.id)
+        self.assertIsNone(claim_job())
+        first.refresh_from_db()
+        self.assertEqual(first.status, Job.RUNNING)
+        self.assertIsNotNone(first.started)
+
+    def test_export_writes_csv(self):
+        """Test an export job writes the measurements to a CSV result file"""
+        job = self.create_job(Job.EXPORT_MEASUREMENTS)
+
+        self.assertEqual(run_job(claim_job()), (job.id, Job.SUCCEEDED))
+
+        job.refresh_from_db()
+        with open(result_path(job), newline='') as file:
+            rows = list(csv.reader(file))
+        self.assertEqual(job.progress, 100)
+        self.assertEqual(job.result, {'rows': 3})
+        self.assertEqual(rows[0], ['id', 'timestamp', 'ph', 'temperature', 'tds'])
+        self.assertEqual([row[2] for row in rows[1:]], ['6.10', '6.30', '6.20'])
+
+    def test_stats_result(self):
+        """Test a statistics job stores the summary of the measurements"""
+        job = self.create_job(Job.SYSTEM_STATS)
+
+        run_job(claim_job())
+
+        job.refresh_from_db()
+        self.assertEqual(job.result['count'], 3)
+        self.assertEqual(job.result['ph']['max'], '6.30')
+        self.assertAlmostEqual(job.result['ph']['avg'], 6.2)
+
+    def test_failed_job_records_error(self):
+        """Test a job raising an error is marked as failed with the error message"""
+        job = Job.objects.create(user=self.user, kind=Job.SYSTEM_STATS, parameters={})
+
+        self.assertEqual(run_job(claim_job()), (job.id, Job.FAILED))
+
+        job.refresh_from_db()
+        self.assertEqual(job.error, "'hydroponic_system'")
+        self.assertIsNotNone(job.finished)
+
+    def test_requeue_stale_jobs(self):
+        """Test running jobs without a recent heartbeat are queued again"""
+        stale = self.create_job(Job.SYSTEM_STATS)
+        alive = self.create_job(Job.SYSTEM_STATS)
+        claim_job()
+        claim_job()
+        Job.objects.filter(id=stale.id).update(heartbeat=timezone.now() - timedelta(hours=1))
+
+        self.assertEqual(requeue_stale_jobs(), 1)
+        stale.refresh_from_db()
+        alive.refresh_from_db()
+        self.assertEqual(stale.status, Job.QUEUED)
+        self.assertEqual(alive.status, Job.RUNNING)
+
+    def test_heartbeat_while_running_in_process(self):
+        """Test a job run in the worker command's process is touched until it finishes"""
+        with mock.patch('core.jobs.touch_jobs') as touch_jobs:
+            with heartbeat(7, 0.01):
+                time.sleep(0.1)
+            touched = touch_jobs.call_count
+            time.sleep(0.05)
+
+        self.assertGreater(touched, 1)
+        touch_jobs.assert_called_with([7])
+        self.assertEqual(touch_jobs.call_count, touched)
+
+    def test_command_runs_queued_jobs(self):
+        """Test the worker command runs the queue in process and exits once it is empty"""
+        job = self.create_job(Job.DETECT_ANOMALIES, window=3)
+        out = StringIO()
+
+        call_command('run_jobs', '--once', '--workers', '0', stdout=out)
+
+        job.refresh_from_db()
+        self.assertIn(f'Job {job.id} succeeded', out.getvalue())
+        self.assertEqual(job.status, Job.SUCCEEDED)
+        self.assertEqual(job.result['readings'], 3)
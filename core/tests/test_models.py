@@ -1,4 +1,6 @@
+from django.db import connection
 from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
 from django.contrib.auth.models import User
 from ..models import HydroponicSystem
 from ..models import Measurement
@@ -22,6 +24,23 @@ class TestHydroponicSystemModel(TestCase):
         )
         self.assertEqual(hydroponic_system.title, 'System 1')
 
+    def test_delete_hydroponic_system_deletes_measurements_at_once(self):
+        """Test deleting a system deletes its measurements with one DELETE without loading them"""
+        user = create_user()
+        hydroponic_system = HydroponicSystem.objects.create(title='System 1', user=user, location='London')
+        Measurement.objects.bulk_create(
+            Measurement(hydroponic_system=hydroponic_system, ph=6, temperature=20, tds=300) for _ in range(150)
+        )
+
+        with CaptureQueriesContext(connection) as context:
+            hydroponic_system.delete()
+
+        measurement_table = Measurement._meta.db_table
+        measurement_queries = [query['sql'] for query in context.captured_queries if measurement_table in query['sql']]
+        self.assertEqual(len(measurement_queries), 1)
+        self.assertTrue(measurement_queries[0].startswith('DELETE'))
+        self.assertFalse(Measurement.objects.exists())
+
 
 class TestMeasurementModel(TestCase):
     """Tests the Measurement model"""
@@ -0,0 +1,12 @@
+"""
+Process pool helpers, importable before Django is set up
+"""
+
+import django
+from django.apps import apps
+
+
+def setup_worker():
+    """Prepare Django in a worker process started without fork"""
+    if not apps.ready:
+        django.setup()
@@ -14,3 +14,7 @@ from django.core.asgi import get_asgi_application
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'hydroponic_system.settings')
 
 application = get_asgi_application()
+
+from api.hotstore import warm_hot_store  # noqa: E402
+
+warm_hot_store()
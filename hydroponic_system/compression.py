@@ -0,0 +1,85 @@
+"""
+Response compression negotiated from Accept-Encoding, brotli when the brotli package is installed, else gzip
+"""
+
+import gzip
+from django.conf import settings
+from django.utils.cache import patch_vary_headers
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+# JSON and the OpenAPI schema only. The browsable API's HTML puts the CSRF token next to the reflected path and
+# query, compressing it would open it to BREACH (GZipMiddleware pads against that, this middleware skips it).
+COMPRESSIBLE_TYPES = ('application/json', 'application/vnd.oai.openapi')
+
+
+def accepted_encodings(header):
+    """Return the content codings of an Accept-Encoding header with their quality values"""
+    encodings = {}
+    for item in header.split(','):
+        coding, _, params = item.strip().partition(';')
+        quality = 1.0
+        for param in params.split(';'):
+            name, _, value = param.strip().partition('=')
+            if name.lower() == 'q':
+                try:
+                    quality = float(value)
+                except ValueError:
+                    quality = 0.0
+        if coding:
+            encodings[coding.strip().lower()] = quality
+    return encodings
+
+
+def negotiate(header):
+    """Return the preferred supported coding of an Accept-Encoding header, or None"""
+    encodings = accepted_encodings(header)
+    supported = ('br', 'gzip') if brotli is not None else ('gzip',)
+    # Ties go to the first supported coding, brotli compresses JSON smaller at the same speed
+    best = max(supported, key=lambda coding: encodings.get(coding, encodings.get('*', 0.0)))
+    return best if encodings.get(best, encodings.get('*', 0.0)) > 0 else None
+
+
+def compress(content, coding):
+    if coding == 'br':
+        return brotli.compress(content, mode=brotli.MODE_TEXT, quality=settings.COMPRESSION_BROTLI_QUALITY)
+    # mtime=0 keeps the output of the same content identical
+    return gzip.compress(content, compresslevel=settings.COMPRESSION_GZIP_LEVEL, mtime=0)
+
+
+class CompressionMiddleware:
+    """Compress JSON responses above COMPRESSION_MIN_SIZE bytes
+
+    Unlike GZipMiddleware this negotiates brotli and honours q=0, and it leaves streaming
+    responses such as job downloads alone.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        response = self.get_response(request)
+        if (response.streaming or response.has_header('Content-Encoding')
+                or not response.get('Content-Type', '').startswith(COMPRESSIBLE_TYPES)):
+            return response
+        patch_vary_headers(response, ('Accept-Encoding',))
+        if len(response.content) < settings.COMPRESSION_MIN_SIZE:
+            return response
+        coding = negotiate(request.META.get('HTTP_ACCEPT_ENCODING', ''))
+        if coding is None:
+            return response
+
+        compressed = compress(response.content, coding)
+        if len(compressed) >= len(response.content):
+            return response
+        response.content = compressed
+        response['Content-Length'] = str(len(compressed))
+        response['Content-Encoding'] = coding
+        # The compressed representation is no longer byte for byte the one a strong ETag was computed for
+        etag = response.get('ETag')
+        if etag and etag.startswith('"'):
+            response['ETag'] = f'W/{etag}'
+        return response
@@ -0,0 +1,173 @@
+"""
+On-demand profiles of single production requests: cProfile statistics and SQL timings in PROFILING_DIR
+"""
+
+import cProfile
+import json
+import pstats
+import re
+import threading
+import time
+import uuid
+from contextlib import ExitStack
+from pathlib import Path
+from django.conf import settings
+from django.core import signing
+from django.db import connections
+from django.utils import timezone
+from rest_framework.authentication import TokenAuthentication
+from rest_framework.exceptions import AuthenticationFailed
+
+HEADER = 'HTTP_X_PROFILE'
+SIGNING_SALT = 'request-profile'
+PROFILE_ID = re.compile(r'^\d{8}T\d{12}-[0-9a-f]{8}$')
+# Functions by cumulative time kept in the summary, the full statistics are in the .prof file
+TOP_FUNCTIONS = 30
+# Only one profiler can be active per process, from Python 3.12 on enabling a second one raises ValueError
+PROFILE_LOCK = threading.Lock()
+
+
+def sign_profile_token(path_prefix=''):
+    """Return an X-Profile header value allowing profiles of requests below a path for PROFILING_TOKEN_MAX_AGE"""
+    return signing.dumps({'path': path_prefix}, salt=SIGNING_SALT)
+
+
+def profile_directory():
+    return Path(settings.PROFILING_DIR)
+
+
+def profile_path(profile_id, suffix):
+    """Return the path of a stored profile's .json summary or .prof statistics, None for an invalid id"""
+    if not PROFILE_ID.match(profile_id):
+        return None
+    return profile_directory() / f'{profile_id}{suffix}'
+
+
+def list_profiles():
+    """Return the summaries of the stored profiles without their queries and functions, newest first"""
+    profiles = []
+    for path in sorted(profile_directory().glob('*.json'), reverse=True):
+        try:
+            summary = json.loads(path.read_text())
+        except (OSError, ValueError):
+            continue
+        profiles.append({key: value for key, value in summary.items() if key not in ('queries', 'functions')})
+    return profiles
+
+
+def read_profile(profile_id):
+    """Return the full summary of a stored profile, None when there is none"""
+    path = profile_path(profile_id, '.json')
+    if path is None or not path.exists():
+        return None
+    return json.loads(path.read_text())
+
+
+class QueryTimer:
+    """Database execute wrapper recording the SQL and duration of every query"""
+
+    def __init__(self):
+        self.queries = []
+
+    def __call__(self, execute, sql, params, many, context):
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            # Parameters are left out, they hold user data
+            self.queries.append({'database': context['connection'].alias, 'sql': sql, 'many': many,
+                                 'duration_ms': round((time.perf_counter() - start) * 1000, 3)})
+
+
+class ProfilingMiddleware:
+    """Profile requests sent with an X-Profile header, by staff or with a signed token
+
+    Staff send 'X-Profile: 1', anyone else a token from sign_profile_token (manage.py profile_token).
+    The profile covers the view, DRF's dispatch, filters, serializers and rendering, with the time of
+    every SQL query. Requests without the header cost one dictionary lookup. One request per process is
+    profiled at a time, requests overlapping it are served without a profile.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        if HEADER not in request.META or not self.allowed(request):
+            return self.get_response(request)
+        if not PROFILE_LOCK.acquire(blocking=False):
+            return self.get_response(request)
+        try:
+            return self.profile(request)
+        finally:
+            PROFILE_LOCK.release()
+
+    def profile(self, request):
+        profiler = cProfile.Profile()
+        try:
+            profiler.enable()
+        except ValueError:
+            # Another profiling tool, such as a debugger or coverage, is active in this process
+            return self.get_response(request)
+
+        timer = QueryTimer()
+        start = time.perf_counter()
+        try:
+            with ExitStack() as stack:
+                for connection in connections.all():
+                    stack.enter_context(connection.execute_wrapper(timer))
+                response = self.get_response(request)
+        finally:
+            profiler.disable()
+        duration = time.perf_counter() - start
+
+        response['X-Profile-Id'] = self.save(request, response, profiler, timer.queries, duration)
+        return response
+
+    def allowed(self, request):
+        value = request.META[HEADER]
+        if value != '1':
+            try:
+                token = signing.loads(value, salt=SIGNING_SALT, max_age=settings.PROFILING_TOKEN_MAX_AGE)
+            except signing.BadSignature:
+                return False
+            return request.path.startswith(token['path'])
+
+        user = getattr(request, 'user', None)
+        if user is None or not user.is_authenticated:
+            try:
+                user, _ = TokenAuthentication().authenticate(request) or (None, None)
+            except AuthenticationFailed:
+                return False
+        return user is not None and user.is_staff
+
+    def save(self, request, response, profiler, queries, duration):
+        """Write the profile statistics and the summary, drop the oldest beyond PROFILING_MAX_PROFILES"""
+        now = timezone.now()
+        # Ids sort by time, the newest profiles are kept by name
+        profile_id = f'{now:%Y%m%dT%H%M%S%f}-{uuid.uuid4().hex[:8]}'
+        directory = profile_directory()
+        directory.mkdir(parents=True, exist_ok=True)
+        profiler.dump_stats(directory / f'{profile_id}.prof')
+
+        stats = pstats.Stats(profiler).stats
+        functions = sorted(stats.items(), key=lambda item: item[1][3], reverse=True)[:TOP_FUNCTIONS]
+        summary = {
+            'id': profile_id,
+            'created': now.isoformat(),
+            'method': request.method,
+            'path': request.get_full_path(),
+            'status': response.status_code,
+            'duration_ms': round(duration * 1000, 3),
+            'query_count': len(queries),
+            'query_ms': round(sum(query['duration_ms'] for query in queries), 3),
+            'queries': queries,
+            'functions': [{'function': pstats.func_std_string(function), 'calls': calls,
+                           'total_ms': round(total * 1000, 3), 'cumulative_ms': round(cumulative * 1000, 3)}
+                          for function, (_, calls, total, cumulative, _) in functions],
+        }
+        (directory / f'{profile_id}.json').write_text(json.dumps(summary, indent=2))
+
+        for path in sorted(directory.glob('*.json'), reverse=True)[settings.PROFILING_MAX_PROFILES:]:
+            path.unlink(missing_ok=True)
+            path.with_suffix('.prof').unlink(missing_ok=True)
+        return profile_id
@@ -0,0 +1,77 @@
+"""
+Database router sending the reads of safe requests to read replicas
+"""
+
+import random
+from contextvars import ContextVar
+from django.conf import settings
+from django.core.cache import cache
+
+SAFE_METHODS = ('GET', 'HEAD', 'OPTIONS')
+# Authentication and admin data always comes from the primary, so fresh tokens work immediately
+PRIMARY_APPS = {'admin', 'auth', 'authtoken', 'contenttypes', 'sessions'}
+# Jobs are polled right after they are submitted and updated by the workers
+PRIMARY_MODELS = {'core.job'}
+
+use_replica = ContextVar('use_replica', default=False)
+
+
+def pin_key(user_id):
+    return f'replica-pin:{user_id}'
+
+
+def write_key(user_id):
+    return f'replica-write:{user_id}'
+
+
+def pin_to_primary(user_id):
+    """Read the user's data from the primary for REPLICA_READ_YOUR_WRITES_SECONDS after a write of their session"""
+    if settings.DATABASE_REPLICAS:
+        cache.set(pin_key(user_id), True, timeout=settings.REPLICA_READ_YOUR_WRITES_SECONDS)
+
+
+def is_pinned_to_primary(user_id):
+    return bool(settings.DATABASE_REPLICAS) and cache.get(pin_key(user_id), False)
+
+
+def note_write(user_id):
+    """Remember for REPLICA_READ_YOUR_WRITES_SECONDS that the replicas may lag behind the user's data"""
+    if settings.DATABASE_REPLICAS:
+        cache.set(write_key(user_id), True, timeout=settings.REPLICA_READ_YOUR_WRITES_SECONDS)
+
+
+def replicas_may_lag(user_id):
+    return bool(settings.DATABASE_REPLICAS) and cache.get(write_key(user_id), False)
+
+
+class PrimaryReplicaRouter:
+    """Route reads to a random replica while `use_replica` is set, everything else to the primary"""
+
+    def db_for_read(self, model, **hints):
+        if (use_replica.get() and settings.DATABASE_REPLICAS and model._meta.app_label not in PRIMARY_APPS
+                and model._meta.label_lower not in PRIMARY_MODELS):
+            return random.choice(settings.DATABASE_REPLICAS)
+        return 'default'
+
+    def db_for_write(self, model, **hints):
+        return 'default'
+
+    def allow_relation(self, obj1, obj2, **hints):
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        return db == 'default'
+
+
+class ReplicaRoutingMiddleware:
+    """Allow replica reads for the duration of safe requests"""
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        token = use_replica.set(request.method in SAFE_METHODS)
+        try:
+            return self.get_response(request)
+        finally:
+            use_replica.reset(token)
@@ -1,3 +1,4 @@
+import copy
 import os
 from pathlib import Path
 
@@ -34,12 +35,15 @@ INSTALLED_APPS = [
 
 MIDDLEWARE = [
     'django.middleware.security.SecurityMiddleware',
+    'hydroponic_system.compression.CompressionMiddleware',
+    'hydroponic_system.routers.ReplicaRoutingMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
+    'hydroponic_system.profiling.ProfilingMiddleware',
 ]
 
 ROOT_URLCONF = 'hydroponic_system.urls'
@@ -64,7 +68,10 @@ TEMPLATES = [
 WSGI_APPLICATION = 'hydroponic_system.wsgi.application'
 
 # Database
-# https://docs.djangoproject.com/en/5.0/ref/settings/#databases
+# https://docs.djangoproject.com/en/5.1/ref/settings/#databases
+# Connections are kept open for DB_CONN_MAX_AGE seconds and health checked before reuse.
+# Setting DB_POOL_MAX_SIZE switches to the psycopg 3 connection pool instead. The pool lives in each
+# worker process, so keep DB_POOL_MAX_SIZE x worker processes below PostgreSQL's max_connections.
 
 DATABASES = {
     'default': {
@@ -72,11 +79,72 @@ DATABASES = {
         'NAME': os.getenv('POSTGRES_DB'),
         'USER': os.getenv('POSTGRES_USER'),
         'PASSWORD': os.getenv('POSTGRES_PASSWORD'),
-        'HOST': 'db',
-        'PORT': '5432',
+        'HOST': os.getenv('POSTGRES_HOST', 'db'),
+        'PORT': os.getenv('POSTGRES_PORT', '5432'),
+        'CONN_MAX_AGE': int(os.getenv('DB_CONN_MAX_AGE', '60')),
+        'CONN_HEALTH_CHECKS': True,
+        'OPTIONS': {},
     }
 }
 
+if os.getenv('DB_POOL_MAX_SIZE'):
+    DATABASES['default']['CONN_MAX_AGE'] = 0
+    DATABASES['default']['OPTIONS']['pool'] = {
+        'min_size': int(os.getenv('DB_POOL_MIN_SIZE', '2')),
+        'max_size': int(os.getenv('DB_POOL_MAX_SIZE')),
+        'timeout': float(os.getenv('DB_POOL_TIMEOUT', '10')),
+        'max_idle': float(os.getenv('DB_POOL_MAX_IDLE', '600')),
+    }
+
+# Read replicas
+# POSTGRES_REPLICA_HOSTS is a comma separated list of hosts replicating the default database. Safe requests
+# read from a random replica, unless the user wrote within REPLICA_READ_YOUR_WRITES_SECONDS (keep it above the
+# replication lag). Pointing it at the primary host (POSTGRES_REPLICA_HOSTS=db) runs two aliases locally.
+
+DATABASE_REPLICAS = []
+for index, host in enumerate(filter(None, os.getenv('POSTGRES_REPLICA_HOSTS', '').split(',')), start=1):
+    DATABASES[f'replica_{index}'] = {
+        **copy.deepcopy(DATABASES['default']),
+        'HOST': host.strip(),
+        'TEST': {'MIRROR': 'default'},
+    }
+    DATABASE_REPLICAS.append(f'replica_{index}')
+
+DATABASE_ROUTERS = ['hydroponic_system.routers.PrimaryReplicaRouter']
+REPLICA_READ_YOUR_WRITES_SECONDS = 5
+
+# Cache
+# https://docs.djangoproject.com/en/5.0/topics/cache/
+# Set REDIS_URL when running more than one worker process, so cache invalidation and counters are shared.
+
+if os.getenv('REDIS_URL'):
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+            'LOCATION': os.getenv('REDIS_URL'),
+        },
+        'responses': {
+            'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+            'LOCATION': os.getenv('REDIS_URL'),
+            'KEY_PREFIX': 'responses',
+            'TIMEOUT': 300,
+        },
+    }
+else:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        },
+        'responses': {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+            'LOCATION': 'responses',
+            'TIMEOUT': 300,
+            'OPTIONS': {
+                'MAX_ENTRIES': 5000,
+            },
+        },
+    }
+
 # Password validation
 # https://docs.djangoproject.com/en/5.0/ref/settings/#auth-password-validators
 
@@ -122,4 +190,93 @@ REST_FRAMEWORK = {
     'DEFAULT_FILTER_BACKENDS': ['django_filters.rest_framework.DjangoFilterBackend'],
     'DEFAULT_PAGINATION_CLASS': 'rest_framework.pagination.PageNumberPagination',
     'PAGE_SIZE': 10,
+    'DEFAULT_RENDERER_CLASSES': [
+        'api.renderers.ORJSONRenderer',
+        'rest_framework.renderers.BrowsableAPIRenderer',
+    ],
+    'DEFAULT_THROTTLE_CLASSES': ['api.throttling.TokenBucketThrottle'],
+    'DEFAULT_THROTTLE_RATES': {
+        'ingest': '1200/min',
+        'ingest_system': '120/min',
+        'writes': '300/min',
+        'writes_system': '60/min',
+        'reads': '120/min',
+        'reads_system': '60/min',
+        'jobs': '30/min',
+        'jobs_system': '10/min',
+    },
 }
+
+# Throttling, see api/throttling.py
+# Token buckets per API token ('<scope>') and per hydroponic system ('<scope>_system'). A rate of '120/min'
+# absorbs a burst of 120 requests and refills at two per second. Set REDIS_URL so every worker shares them.
+
+THROTTLE_CACHE_ALIAS = 'default'
+
+# Response compression, see hydroponic_system/compression.py
+# JSON responses only. Brotli is used when the client accepts it and the brotli package is installed, gzip otherwise.
+# Bodies below the minimum size are sent as is, the headers would outweigh the savings.
+
+COMPRESSION_MIN_SIZE = 1024
+COMPRESSION_GZIP_LEVEL = 6
+COMPRESSION_BROTLI_QUALITY = 4
+
+# Change feed
+# Changes younger than the settle time are held back, so a slower concurrent transaction
+# cannot commit a change below a cursor that a client has already received.
+# "python manage.py prune_changes" deletes changes older than the retention, run it daily.
+
+CHANGE_FEED_SETTLE_SECONDS = 2
+CHANGE_FEED_PAGE_SIZE = 1000
+CHANGE_FEED_RETENTION_DAYS = 30
+
+# Response cache for list endpoints, see api/cache.py
+# With Redis the size is bounded by the server's maxmemory and an allkeys-lru eviction policy.
+
+RESPONSE_CACHE_ENABLED = True
+RESPONSE_CACHE_ALIAS = 'responses'
+
+# Pagination
+# Listings with more rows than the threshold report the planner's estimate instead of an exact COUNT(*).
+
+APPROXIMATE_COUNT_THRESHOLD = 10000
+
+# Query cost guard, see api/guards.py
+# ph, temperature and tds have no index. Measurement lists ordered or filtered by them are rejected when the
+# system and time range filters leave more than MEASUREMENT_QUERY_MAX_ROWS rows to scan (the planner's estimate
+# on PostgreSQL). Measurement lists, stats and anomalies are cancelled after QUERY_TIMEOUT_MS on PostgreSQL.
+
+MEASUREMENT_QUERY_MAX_ROWS = 100000
+QUERY_TIMEOUT_MS = 10000
+
+# Anomaly detection
+# /systems/{id}/anomalies/ loads the readings of its range into memory. Ranges without a start or longer than
+# ANOMALY_REQUEST_MAX_DAYS are rejected with the detect_anomalies job to submit to /jobs/ instead, see core/jobs.py.
+
+ANOMALY_REQUEST_MAX_DAYS = 31
+
+# Hot window store, see api/hotstore.py
+# Keeps the last HOT_STORE_WINDOW_HOURS of readings per system in memory of every worker process, so
+# "since yesterday" dashboards are answered without SQL. Memory use is bounded by HOT_STORE_MAX_BYTES
+# (about 26 bytes per reading). Needs REDIS_URL with more than one worker, like the response cache.
+
+HOT_STORE_ENABLED = os.getenv('HOT_STORE_ENABLED', '0') == '1'
+HOT_STORE_WINDOW_HOURS = 48
+HOT_STORE_CAPACITY = 50000
+HOT_STORE_MAX_BYTES = int(os.getenv('HOT_STORE_MAX_BYTES', str(256 * 1024 * 1024)))
+
+# Background jobs, run by "python manage.py run_jobs"
+# Result files are written to JOB_RESULTS_DIR, which the web and worker containers must share. Running jobs
+# whose worker command stopped updating their heartbeat for JOB_STALE_SECONDS are queued again.
+
+JOB_RESULTS_DIR = Path(os.getenv('JOB_RESULTS_DIR', BASE_DIR / 'job_results'))
+JOB_POLL_SECONDS = 1.0
+JOB_STALE_SECONDS = 300
+
+# Request profiling, see hydroponic_system/profiling.py
+# Staff profile a request by sending X-Profile: 1, others need a token from manage.py profile_token that
+# expires after PROFILING_TOKEN_MAX_AGE seconds. Only the newest PROFILING_MAX_PROFILES profiles are kept.
+
+PROFILING_DIR = Path(os.getenv('PROFILING_DIR', BASE_DIR / 'profiles'))
+PROFILING_MAX_PROFILES = 200
+PROFILING_TOKEN_MAX_AGE = 3600
@@ -14,3 +14,7 @@ from django.core.wsgi import get_wsgi_application
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'hydroponic_system.settings')
 
 application = get_wsgi_application()
+
+from api.hotstore import warm_hot_store  # noqa: E402
+
+warm_hot_store()